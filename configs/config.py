@@ -4,6 +4,15 @@ cfg = CfgNode(new_allowed=True)
 
 cfg.MODEL_ARC = 'BaseSiamModel'
 
+# device for training and tracking, 'cuda', 'cuda:1' or 'cpu'
+cfg.DEVICE = 'cuda'
+
+# only used when cfg.DEVICE is 'cpu'
+cfg.CPU = CfgNode()
+# number of intra-op threads, 0 keeps the torch default
+cfg.CPU.NUM_THREADS = 0
+cfg.CPU.CHANNELS_LAST = True
+
 cfg.DATASET = CfgNode()
 cfg.DATASET.NAMES = ['VID','DET','COCO','YOUTUBEBB']
 cfg.DATASET.COCO = CfgNode()
@@ -33,7 +42,17 @@ cfg.DATASET.YOUTUBEBB.NUM_USE = -1
 
 
 cfg.DATASET.NEG = 0.05
+# decoded images shared by the DataLoader workers (dataset/image_cache.py), for the sets whose frames
+# are sampled again and again: a small FRAME_RANGE and the random targets of the negative pairs
+cfg.DATASET.IMAGE_CACHE = CfgNode()
+# 0 disables the cache
+cfg.DATASET.IMAGE_CACHE.SIZE_MB = 0
+cfg.DATASET.IMAGE_CACHE.NAMES = ['COCO', 'YOUTUBEBB']
+# larger images are not cached, crop511 images are 511x511
+cfg.DATASET.IMAGE_CACHE.MAX_SIZE = 511
 cfg.DATASET.GRAY = 0.0
+# crop, flip, color and blur augmentation in one pass (Augmentation._fused_call)
+cfg.DATASET.FUSED_AUG = True
 
 cfg.DATASET.EXAMPLAR = CfgNode()
 # Random shift see [SiamPRN++](https://arxiv.org/pdf/1812.11703)
@@ -43,6 +62,10 @@ cfg.DATASET.EXAMPLAR.SCALE = 0.05
 cfg.DATASET.EXAMPLAR.BLUR = 0.0
 cfg.DATASET.EXAMPLAR.FLIP = 0.0
 cfg.DATASET.EXAMPLAR.COLOR = 1.0
+# decode the exemplar image at 1/n of its resolution (1, 2, 4 or 8) with cv2.IMREAD_REDUCED_COLOR_n,
+# the crop mapping is scaled to match. The exemplar is cropped from crop511 at a scale of about 1,
+# so n > 1 gives a blurrier exemplar for a faster decode, see tools/decode_benchmark.py
+cfg.DATASET.EXAMPLAR.REDUCED_DECODE = 1
 
 cfg.DATASET.SEARCH = CfgNode()
 cfg.DATASET.SEARCH.SHIFT = 64
@@ -53,6 +76,15 @@ cfg.DATASET.SEARCH.COLOR = 1.0
 
 cfg.DATASET.VIDEO_PER_EPOCH = 600000
 
+# order of the samples of an epoch, TrainDataset.shuffle
+cfg.DATASET.SHUFFLE = CfgNode()
+# 0 shuffles all the samples. n > 0 cuts every dataset into blocks of n consecutive videos (the order of
+# the annotation file, the order on disk for crop511 and pack_dataset.py) and takes the blocks in a random
+# order, the samples of INTERLEAVE blocks, of any datasets, shuffled together. The samples of an epoch
+# are the same, the workers read fewer videos at a time
+cfg.DATASET.SHUFFLE.BLOCK = 0
+cfg.DATASET.SHUFFLE.INTERLEAVE = 8
+
 cfg.ANCHOR = CfgNode()
 cfg.ANCHOR.RATIOS = [0.33, 0.5, 1, 2, 3]
 cfg.ANCHOR.SCALES = [8]
@@ -91,6 +123,13 @@ cfg.TRAIN.BASE_SIZE = 0
 cfg.TRAIN.OUTPUT_SIZE = 17
 cfg.TRAIN.BATCH_SIZE = 128
 cfg.TRAIN.NUM_WORKERS = 1
+# the dataset only returns the search bbox, train.py builds the anchor targets of the batch on the device
+cfg.TRAIN.DEVICE_ANCHOR_TARGET = False
+# the workers only decode the crop511 images (all of one size) and draw the augmentation,
+# train.py crops, colors and blurs the batch on the device with DeviceAugmentation
+cfg.TRAIN.DEVICE_AUG = False
+# log the rss/pss/private memory of every DataLoader worker every n batches, 0 to disable
+cfg.TRAIN.LOG_WORKER_MEMORY = 0
 
 cfg.TRAIN.BASE_LR = 0.005
 cfg.TRAIN.MOMENTUM = 0.9
@@ -138,5 +177,36 @@ cfg.TRACK.PENALTY_K = 0.16
 cfg.TRACK.WINDOW_INFLUENCE = 0.40
 cfg.TRACK.LR = 0.3
 
+# search a smaller crop when the target moves little, see SiamRPN._instance_size
+cfg.TRACK.ADAPTIVE = CfgNode()
+# candidate instance sizes below INSTANCE_SIZE, (size - EXAMPLAR_SIZE) a multiple of the stride, empty disables
+cfg.TRACK.ADAPTIVE.SIZES = []
+# frames of motion and score taken into account, the full size until there are as many
+cfg.TRACK.ADAPTIVE.HISTORY = 5
+# the reach of the score map must cover this times the largest recent move
+cfg.TRACK.ADAPTIVE.MOTION_RATIO = 2.0
+# a lower score in the history goes back to the full size
+cfg.TRACK.ADAPTIVE.MIN_SCORE = 0.9
+# SiamRPN reuses the rpn output of the last forward when the search crop did not change, see SiamRPN._rpn_output
+cfg.TRACK.STATIC = CfgNode()
+# mean absolute difference of the downsampled crops, in pixel levels, below which a crop is unchanged, 0 disables
+cfg.TRACK.STATIC.THRESHOLD = 0.
+# side of the downsampled crops
+cfg.TRACK.STATIC.SIZE = 32
+# CascadeSiamRPN, the heavy model only tracks the frames the light one is unsure about
+cfg.TRACK.CASCADE = CfgNode()
+# escalate when the best pscore of the light model is below
+cfg.TRACK.CASCADE.MIN_PSCORE = 0.8
+# or when the scale and ratio penalty of its best anchor is below, a sudden change of the box
+cfg.TRACK.CASCADE.MIN_PENALTY = 0.9
+# max number of targets tracked in one batch by MultiTargetSiamRPN
+cfg.TRACK.MAX_TARGETS = 32
+# examplar features reused across tracker inits on the same crop, see trackers/examplar_cache.py
+cfg.TRACK.EXAMPLAR_CACHE = CfgNode()
+# number of features kept in memory, 0 disables the cache
+cfg.TRACK.EXAMPLAR_CACHE.SIZE = 256
+# every new feature is also written here when set, so later runs start warm
+cfg.TRACK.EXAMPLAR_CACHE.DIR = ''
+
 
 
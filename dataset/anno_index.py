@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import logging
+
+import numpy as np
+
+logger = logging.getLogger('global')
+
+
+class AnnoIndex(object):
+    """The annotations of a SubDataset as a few flat numpy arrays.
+
+    video i owns the tracks video_offset[i]:video_offset[i+1], track t owns the frames
+    track_offset[t]:track_offset[t+1], sorted by frame id, with their boxes. The order of
+    the videos and of the tracks of a video is the order of the json file. There are no
+    python objects per video, track or frame. A saved index is a directory of .npy files
+    that load memory mapped, so opening it reads nothing and the forked DataLoader workers
+    share the pages of the file instead of each holding a copy.
+    """
+    FIELDS = ['videos', 'video_offset', 'track_ids', 'track_offset', 'frames', 'boxes']
+
+    def __init__(self, videos, video_offset, track_ids, track_offset, frames, boxes):
+        self.videos = videos  # V bytes
+        self.video_offset = video_offset  # V+1 int64
+        self.track_ids = track_ids  # T bytes
+        self.track_offset = track_offset  # T+1 int64
+        self.frames = frames  # F int32
+        self.boxes = boxes  # F x 4 float32, x1,y1,x2,y2 (0,0,w,h for w,h annotations)
+
+    @classmethod
+    def from_json(cls, annos):
+        """ compile the json annotations, dropping the boxes of zero size and the empty tracks and videos """
+        videos, video_offset, track_ids, track_offset, frames, boxes = [], [0], [], [0], [], []
+        for video, tracks in annos.items():
+            num_tracks = len(track_ids)
+            for trackid, track in tracks.items():
+                track_frames = []
+                for frame, bbox in track.items():
+                    if not frame.isdigit() or isinstance(bbox, dict):
+                        continue
+                    if len(bbox) == 4:
+                        x1, y1, x2, y2 = bbox
+                    else:
+                        x1, y1, (x2, y2) = 0, 0, bbox
+                    if x2 - x1 <= 0 or y2 - y1 <= 0:
+                        continue
+                    track_frames.append((int(frame), [x1, y1, x2, y2]))
+                if len(track_frames) == 0:
+                    continue
+                track_frames.sort(key=lambda x: x[0])
+                frames += [x[0] for x in track_frames]
+                boxes += [x[1] for x in track_frames]
+                track_ids.append(trackid)
+                track_offset.append(len(frames))
+            if len(track_ids) > num_tracks:
+                videos.append(video)
+                video_offset.append(len(track_ids))
+        return cls(np.array([x.encode() for x in videos], dtype=bytes),
+                   np.array(video_offset, dtype=np.int64),
+                   np.array([x.encode() for x in track_ids], dtype=bytes),
+                   np.array(track_offset, dtype=np.int64),
+                   np.array(frames, dtype=np.int32),
+                   np.array(boxes, dtype=np.float32).reshape(-1, 4))
+
+    @classmethod
+    def load(cls, path):
+        """ the arrays of the index directory, memory mapped read only """
+        return cls(*[np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in cls.FIELDS])
+
+    def save(self, path):
+        # write a new directory then rename it, a reader never sees a partial index
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        os.makedirs(tmp_path)
+        for name in self.FIELDS:
+            np.save(os.path.join(tmp_path, name + '.npy'), getattr(self, name))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.videos)
+
+    def video(self, idx):
+        return self.videos[idx].decode()
+
+    def num_tracks(self, idx):
+        return int(self.video_offset[idx + 1] - self.video_offset[idx])
+
+    def track(self, idx, i):
+        """ index of the i-th track of video idx """
+        return int(self.video_offset[idx]) + i
+
+    def track_id(self, track):
+        return self.track_ids[track].decode()
+
+    def track_frames(self, track):
+        """ the sorted frame ids of a track, a view of the index """
+        return self.frames[self.track_offset[track]:self.track_offset[track + 1]]
+
+    def box(self, track, pos):
+        """ box of the pos-th frame of a track as a list, like the json gives it """
+        return self.boxes[self.track_offset[track] + pos].tolist()
+
+
+def index_path(anno_file):
+    return os.path.splitext(anno_file)[0] + '.index'
+
+
+def load_anno_index(anno_file):
+    """ the compiled index of tools/compile_anno.py when it is newer than the json, else compile the json """
+    if anno_file.endswith('.index'):
+        return AnnoIndex.load(anno_file)
+    path = index_path(anno_file)
+    if os.path.isdir(path) and os.path.getmtime(path) >= os.path.getmtime(anno_file):
+        return AnnoIndex.load(path)
+    logger.info('no compiled index for {}, run tools/compile_anno.py to load it faster'.format(anno_file))
+    with open(anno_file, 'r') as f:
+        return AnnoIndex.from_json(json.load(f))
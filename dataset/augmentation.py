@@ -7,18 +7,23 @@ from __future__ import unicode_literals
 
 import numpy as np
 import cv2
+import torch
+import torch.nn.functional as F
 
 from utils.bbox import corner2center, \
         Center, center2corner, Corner
+from configs.config import cfg
 
 
 class Augmentation:
-    def __init__(self, shift, scale, blur, flip, color):
+    def __init__(self, shift, scale, blur, flip, color, fused=None):
         self.shift = shift
         self.scale = scale
         self.blur = blur
         self.flip = flip
         self.color = color
+        # one warpAffine with the flip in it, float32 color and box filter blur, see _fused_call
+        self.fused = cfg.DATASET.FUSED_AUG if fused is None else fused
         self.rgbVar = np.array(
             [[-0.55919361,  0.98062831, - 0.41940627],
              [1.72091413,  0.19879334, - 1.82968581],
@@ -28,26 +33,44 @@ class Augmentation:
     def random():
         return np.random.random() * 2 - 1.0
 
-    def _crop_roi(self, image, bbox, out_sz, padding=(0, 0, 0)):
+    @staticmethod
+    def _crop_mapping(bbox, out_sz, reduce=1):
+        """ affine mapping of bbox to the crop, from an image decoded at 1/reduce of the resolution """
         bbox = [float(x) for x in bbox]
         a = (out_sz-1) / (bbox[2]-bbox[0])
         b = (out_sz-1) / (bbox[3]-bbox[1])
         c = -a * bbox[0]
         d = -b * bbox[1]
+        if reduce > 1:
+            # pixel x of the reduced image is the mean of reduce*x .. reduce*x+reduce-1
+            c += a * (reduce - 1) / 2.
+            d += b * (reduce - 1) / 2.
+            a *= reduce
+            b *= reduce
         mapping = np.array([[a, 0, c],
-                            [0, b, d]]).astype(np.float)
+                            [0, b, d]]).astype(np.float64)
+        return mapping
+
+    def _crop_roi(self, image, bbox, out_sz, padding=(0, 0, 0), reduce=1):
+        mapping = self._crop_mapping(bbox, out_sz, reduce)
         crop = cv2.warpAffine(image, mapping, (out_sz, out_sz),
                               borderMode=cv2.BORDER_CONSTANT,
                               borderValue=padding)
         return crop
 
+    @staticmethod
+    def _rand_blur():
+        """ size and horizontal weight of a line motion blur kernel """
+        sizes = np.arange(5, 46, 2)
+        size = np.random.choice(sizes)
+        wx = np.random.random()
+        return size, wx
+
     def _blur_aug(self, image):
         def rand_kernel():
-            sizes = np.arange(5, 46, 2)
-            size = np.random.choice(sizes)
+            size, wx = self._rand_blur()
             kernel = np.zeros((size, size))
             c = int(size/2)
-            wx = np.random.random()
             kernel[:, c] += 1. / size * wx
             kernel[c, :] += 1. / size * (1-wx)
             return kernel
@@ -55,10 +78,21 @@ class Augmentation:
         image = cv2.filter2D(image, -1, kernel)
         return image
 
-    def _color_aug(self, image):
+    @staticmethod
+    def _line_blur(image, size, wx):
+        """ the line kernel of _blur_aug is a vertical plus a horizontal mean, two box filters """
+        vertical = cv2.blur(image, (1, size))
+        horizontal = cv2.blur(image, (size, 1))
+        return cv2.addWeighted(vertical, wx, horizontal, 1 - wx, 0)
+
+    def _rand_color(self):
         offset = np.dot(self.rgbVar, np.random.randn(3, 1))
         offset = offset[::-1]  # bgr 2 rgb
         offset = offset.reshape(3)
+        return offset
+
+    def _color_aug(self, image):
+        offset = self._rand_color()
         image = image - offset
         return image
 
@@ -67,8 +101,15 @@ class Augmentation:
         image = cv2.cvtColor(grayed, cv2.COLOR_GRAY2BGR)
         return image
 
-    def _shift_scale_aug(self, image, bbox, crop_bbox, size):
-        im_h, im_w = image.shape[:2]
+    def _shift_scale_aug(self, image, bbox, crop_bbox, size, shape=None, reduce=1):
+        shape = image.shape if shape is None else shape
+        crop_bbox, bbox = self._shift_scale_bbox(shape, bbox, crop_bbox)
+        image = self._crop_roi(image, crop_bbox, size, reduce=reduce)
+        return image, bbox
+
+    def _shift_scale_bbox(self, shape, bbox, crop_bbox):
+        """ random crop bbox in the image and the target bbox in the crop """
+        im_h, im_w = shape[:2]
 
         # adjust crop bounding box
         crop_bbox_center = corner2center(crop_bbox)
@@ -103,9 +144,7 @@ class Augmentation:
         if self.scale:
             bbox = Corner(bbox.x1 / scale_x, bbox.y1 / scale_y,
                           bbox.x2 / scale_x, bbox.y2 / scale_y)
-
-        image = self._crop_roi(image, crop_bbox, size)
-        return image, bbox
+        return crop_bbox, bbox
 
     def _flip_aug(self, image, bbox):
         image = cv2.flip(image, 1)
@@ -114,8 +153,78 @@ class Augmentation:
                       width - 1 - bbox.x1, bbox.y2)
         return image, bbox
 
-    def __call__(self, image, bbox, size, gray=False):
-        shape = image.shape
+    def _draw(self, shape, bbox, size, reduce=1):
+        """ the random draws of __call__, in its order, and the bbox in the crop
+
+        :return: crop mapping with the flip, color offset or None, (size, wx) of the blur or None, bbox
+        """
+        crop_bbox = center2corner(Center(shape[0]//2, shape[1]//2,
+                                         size-1, size-1))
+        crop_bbox, bbox = self._shift_scale_bbox(shape, bbox, crop_bbox)
+        offset = self._rand_color() if self.color > np.random.random() else None
+        blur = self._rand_blur() if self.blur > np.random.random() else None
+        flip = self.flip and self.flip > np.random.random()
+
+        mapping = self._crop_mapping(crop_bbox, size, reduce)
+        if flip:
+            # x -> size-1-x in the crop
+            mapping[0] = -mapping[0]
+            mapping[0, 2] += size - 1
+            bbox = Corner(size - 1 - bbox.x2, bbox.y1,
+                          size - 1 - bbox.x1, bbox.y2)
+        return mapping, offset, blur, bbox
+
+    def device_params(self, shape, bbox, size, gray=False):
+        """ the draws of __call__ for an image augmented by DeviceAugmentation
+
+        :return: float32 parameters, see DeviceAugmentation, and the bbox in the crop
+        """
+        mapping, offset, blur, bbox = self._draw(shape, bbox, size)
+        params = np.zeros(DeviceAugmentation.NUM_PARAMS, dtype=np.float32)
+        params[0:6] = mapping.reshape(-1)
+        if offset is not None:
+            params[6:9] = offset
+        params[9:11] = blur if blur is not None else (1, 0)
+        params[11] = gray
+        return params, bbox
+
+    def _fused_call(self, image, bbox, size, gray=False, shape=None, reduce=1):
+        """ __call__ with the same random draws in one crop
+
+        The flip is folded into the crop mapping and gray is applied to the crop instead of
+        the whole image. Color and blur run in float32 (the dataset converts to float32
+        anyway), the blur as two box filters.
+        """
+        shape = image.shape if shape is None else shape
+        mapping, offset, blur, bbox = self._draw(shape, bbox, size, reduce)
+        image = cv2.warpAffine(image, mapping, (size, size),
+                               borderMode=cv2.BORDER_CONSTANT,
+                               borderValue=(0, 0, 0))
+        if gray:
+            image = self._gray_aug(image)
+        if offset is not None or blur is not None:
+            image = image.astype(np.float32)
+        if offset is not None:
+            image -= offset.astype(np.float32)
+        if blur is not None:
+            image = self._line_blur(image, *blur)
+        return image, bbox
+
+    @staticmethod
+    def reduction(image, shape):
+        """ 1, 2, 4 or 8, the image was decoded at 1/reduction of the resolution of an image of this shape """
+        if shape is None or shape[1] == image.shape[1]:
+            return 1
+        return int(round(float(shape[1]) / image.shape[1]))
+
+    def __call__(self, image, bbox, size, gray=False, shape=None):
+        """ shape: of the full image when image was decoded at a reduced resolution, bbox is in
+        its coordinates and the random draws are the ones of the full image
+        """
+        reduce = self.reduction(image, shape)
+        if self.fused:
+            return self._fused_call(image, bbox, size, gray, shape, reduce)
+        shape = image.shape if shape is None else shape
         crop_bbox = center2corner(Center(shape[0]//2, shape[1]//2,
                                          size-1, size-1))
         # gray augmentation
@@ -123,7 +232,7 @@ class Augmentation:
             image = self._gray_aug(image)
 
         # shift scale augmentation
-        image, bbox = self._shift_scale_aug(image, bbox, crop_bbox, size)
+        image, bbox = self._shift_scale_aug(image, bbox, crop_bbox, size, shape, reduce)
 
         # color augmentation
         if self.color > np.random.random():
@@ -139,4 +248,79 @@ class Augmentation:
         return image, bbox
 
 
+class DeviceAugmentation(object):
+    """Augmentation of a batch of images with torch ops on the device.
+
+    The DataLoader workers only decode the images and draw the parameters with
+    Augmentation.device_params, which also gives the bbox. The parameters of an image are
+    the 2x3 crop mapping with the flip (0:6), the color offset (6:9), size and wx of the
+    blur (9:11, size 1 without blur) and the gray flag (11). The output is _fused_call of
+    the images up to interpolation rounding, float32 B,3,size,size in the channel order of
+    the input.
+    """
+
+    NUM_PARAMS = 12
+
+    def __init__(self, device):
+        self.device = device
+        # cv2.COLOR_BGR2GRAY
+        self.gray_weight = torch.tensor([0.114, 0.587, 0.299], device=device).view(1, 3, 1, 1)
+
+    @staticmethod
+    def _theta(params, in_h, in_w, size):
+        """ affine_grid theta, normalized output to normalized input coordinates, of the crop mappings """
+        mapping = params[:, 0:6].double().view(-1, 2, 3)
+        inv = torch.inverse(mapping[:, :, :2])
+        t = -torch.matmul(inv, mapping[:, :, 2:])
+        half = (size - 1) / 2.
+        scale = torch.tensor([2. / (in_w - 1), 2. / (in_h - 1)], dtype=torch.float64).view(1, 2, 1)
+        theta_a = scale * inv * half
+        theta_t = scale * (torch.matmul(inv, torch.full((1, 2, 1), half, dtype=torch.float64)) + t) - 1
+        return torch.cat([theta_a, theta_t], dim=2).float()
+
+    @staticmethod
+    def _line_kernels(sizes, max_size):
+        """ centered 1d mean kernels of the given sizes, zero padded to max_size """
+        taps = torch.arange(max_size, dtype=torch.float32).view(1, -1) - max_size // 2
+        sizes = sizes.view(-1, 1)
+        return (taps.abs() <= sizes // 2).float() / sizes
+
+    def _blur(self, images, blur):
+        """ line motion blur of _line_blur, per image sizes as grouped convs over the channels """
+        num, channels, h, w = images.size()
+        sizes, wx = blur[:, 0].round(), blur[:, 1]
+        max_size = int(sizes.max())
+        kernels = self._line_kernels(sizes, max_size).repeat_interleave(channels, dim=0).to(self.device)
+        wx = wx.repeat_interleave(channels).view(1, -1, 1, 1).to(self.device)
+        pad = max_size // 2
+        x = images.reshape(1, num * channels, h, w)
+        # reflect is cv2.BORDER_REFLECT_101, the default border of cv2.blur
+        vertical = F.conv2d(F.pad(x, (0, 0, pad, pad), mode='reflect'),
+                            kernels.view(-1, 1, max_size, 1), groups=num * channels)
+        horizontal = F.conv2d(F.pad(x, (pad, pad, 0, 0), mode='reflect'),
+                              kernels.view(-1, 1, 1, max_size), groups=num * channels)
+        return (vertical * wx + horizontal * (1 - wx)).view(num, channels, h, w)
+
+    def __call__(self, images, params, size):
+        """
+        :param images: B,H,W,3 uint8 images, as the workers decode them
+        :param params: B,NUM_PARAMS float32 from Augmentation.device_params
+        :param size: output size
+        :return: B,3,size,size float32 on the device
+        """
+        params = params.float().cpu()
+        in_h, in_w = images.shape[1:3]
+        images = images.to(self.device, non_blocking=True).permute(0, 3, 1, 2).float()
+        theta = self._theta(params, in_h, in_w, size).to(self.device)
+        grid = F.affine_grid(theta, [images.size(0), 3, size, size], align_corners=True)
+        images = F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros', align_corners=True)
 
+        gray = torch.nonzero(params[:, 11] > 0).view(-1)
+        if len(gray):
+            gray = gray.to(self.device)
+            images[gray] = (images[gray] * self.gray_weight).sum(dim=1, keepdim=True).expand(-1, 3, -1, -1)
+        images -= params[:, 6:9].to(self.device, non_blocking=True).view(-1, 3, 1, 1)
+        blur = torch.nonzero(params[:, 9] > 1).view(-1)
+        if len(blur):
+            images[blur.to(self.device)] = self._blur(images[blur.to(self.device)], params[blur, 9:11])
+        return images
@@ -1,5 +1,4 @@
 import os
-import json
 import logging
 import cv2
 import numpy as np
@@ -8,6 +7,9 @@ from configs.config import cfg
 from utils.bbox import center2corner, Center
 from utils.anchor import AnchorTarget
 from dataset.augmentation import Augmentation
+from dataset.storage import get_storage
+from dataset.image_cache import SharedImageCache
+from dataset.anno_index import load_anno_index
 
 logger = logging.getLogger('global')
 
@@ -19,86 +21,76 @@ class SubDataset(object):
         self.anno_file = anno_file
         self.frame_range = frame_range
         self.start_idx = start_idx
-        self.annos = json.load(open(anno_file, 'r'))
-        self.annos = self._filter_zero()
-        self.videos = list(self.annos.keys())
-        self.num = len(self.annos.keys())
+        # videos, tracks, sorted frames and boxes without the zero size boxes, see AnnoIndex
+        self.index = load_anno_index(anno_file)
+        self.num = len(self.index)
         self.num_use = self.num if num_use == -1 else num_use
         self.filename_format = '{}.{}.{}.jpg'
-        for video, tracks in self.annos.items():
-            for trackid in tracks.keys():
-                frames = self.annos[video][trackid]
-                frames = list(
-                    map(int, filter(lambda x: x.isdigit(), frames.keys())))
-                frames.sort()
-                self.annos[video][trackid]['frames'] = frames
+        self.storage = get_storage(data_dir)
+        # SharedImageCache of the decoded images, set by TrainDataset
+        self.cache = None
         self.pick = self.shuffle()
 
-    def _filter_zero(self):
-        new_annos = {}
-        for video, tracks in self.annos.items():
-            new_tracks = {}
-            for trackid, frames in tracks.items():
-                new_frames = {}
-                for frame, bbox in frames.items():
-                    if not isinstance(bbox, dict):
-                        if len(bbox) == 4:
-                            x1, y1, x2, y2 = bbox
-                            w, h = x2 - x1, y2 - y1
-                        else:
-                            w, h = bbox
-                        if w <= 0 or h <= 0:
-                            continue
-                    new_frames[frame] = bbox
-                if len(new_frames) > 0:
-                    new_tracks[trackid] = new_frames
-            if len(new_tracks) > 0:
-                new_annos[video] = new_tracks
-        return new_annos
+    def _random_track(self, idx):
+        """ video name, track id and track index of a random track of video idx """
+        track = self.index.track(idx, np.random.choice(self.index.num_tracks(idx)))
+        return self.index.video(idx), self.index.track_id(track), track
+
+    def _get_path(self, video, frame, trackid):
+        return os.path.join(self.data_dir, video, self.filename_format.format('{:06d}'.format(frame), trackid, 'x'))
 
     def get_postive_pair(self, idx):
-        video = self.videos[idx]
-        trackid = np.random.choice(list(self.annos[video].keys()))
-        frames = self.annos[video][trackid]['frames']  # the frames may not continue,so the frame_range
+        video, trackid, track = self._random_track(idx)
+        frames = self.index.track_frames(track)  # the frames may not continue,so the frame_range
         examplar_idx = np.random.randint(0, len(frames)) # in youtubebb is small
         left = max(0, examplar_idx - self.frame_range)
         right = min(len(frames) - 1, examplar_idx + self.frame_range) + 1
-        search_range = frames[left:right]
-        examplar_frame = frames[examplar_idx]
-        search_frame = np.random.choice(search_range)
-        examplar_frame = '{:06d}'.format(examplar_frame)
-        search_frame = '{:06d}'.format(search_frame)
-        examplar_path = os.path.join(self.data_dir, video, self.filename_format.format(examplar_frame, trackid, 'x'))
-        search_path = os.path.join(self.data_dir, video, self.filename_format.format(search_frame, trackid, 'x'))
-        examplar_anno = self.annos[video][trackid][examplar_frame]
-        search_anno = self.annos[video][trackid][search_frame]
+        search_idx = left + np.random.choice(right - left)
+        examplar_path = self._get_path(video, frames[examplar_idx], trackid)
+        search_path = self._get_path(video, frames[search_idx], trackid)
+        examplar_anno = self.index.box(track, examplar_idx)
+        search_anno = self.index.box(track, search_idx)
         return (examplar_path, examplar_anno), (search_path, search_anno)
 
     def get_random_target(self, idx=-1):
         if idx == -1:
             idx = np.random.randint(0, self.num)
-        video = self.videos[idx]
-
-        trackid = np.random.choice(list(self.annos[video].keys()))
-        frames = self.annos[video][trackid]['frames']
-        target_frame = np.random.choice(frames)
-        target_frame = '{:06d}'.format(target_frame)
-        target_path = os.path.join(self.data_dir, video, self.filename_format.format(target_frame, trackid, 'x'))
-        target_anno = self.annos[video][trackid][target_frame]
+        video, trackid, track = self._random_track(idx)
+        frames = self.index.track_frames(track)
+        target_idx = np.random.choice(len(frames))
+        target_path = self._get_path(video, frames[target_idx], trackid)
+        target_anno = self.index.box(track, target_idx)
         return target_path, target_anno
 
+    def imread(self, path):
+        """ read an image of a path given by get_postive_pair or get_random_target """
+        if self.cache is None:
+            return self.storage.imread(path)
+        image = self.cache.get(path)
+        if image is None:
+            image = self.storage.imread(path)
+            self.cache.put(path, image)
+        return image
+
+    def imread_reduced(self, path, reduce):
+        """ the image of path at 1/reduce of the resolution (2, 4 or 8) and the shape of the full image """
+        return self.storage.imread_reduced(path, reduce)
+
     def log(self):
         logger.info("{} start-index {} select [{}/{}]".format(
             self.name, self.start_idx, self.num_use,
             self.num))
 
     def shuffle(self):
+        # an array, not a list of ints the forked workers would copy by touching the refcounts
         p = []
-        indies = list(range(self.start_idx, self.start_idx + self.num))
-        while len(p) < self.num_use:
+        indies = np.arange(self.start_idx, self.start_idx + self.num)
+        num = 0
+        while num < self.num_use:
             np.random.shuffle(indies)
-            p += indies
-        return p[:self.num_use]
+            p.append(indies.copy())
+            num += len(indies)
+        return np.concatenate(p)[:self.num_use] if p else indies[:self.num_use]
 
     def __len__(self):
         return self.num
@@ -122,6 +114,14 @@ class TrainDataset(Dataset):
             start_idx += sub_dataset.num
             self.num += sub_dataset.num_use
         self.num = cfg.DATASET.VIDEO_PER_EPOCH if cfg.DATASET.VIDEO_PER_EPOCH > 0 else self.num
+        self.image_cache = None
+        if cfg.DATASET.IMAGE_CACHE.SIZE_MB > 0:
+            # created before the DataLoader forks its workers, they all share it
+            self.image_cache = SharedImageCache(cfg.DATASET.IMAGE_CACHE.SIZE_MB,
+                                                (cfg.DATASET.IMAGE_CACHE.MAX_SIZE, cfg.DATASET.IMAGE_CACHE.MAX_SIZE, 3))
+            for sub_dataset in self.all_dataset:
+                if sub_dataset.name in cfg.DATASET.IMAGE_CACHE.NAMES:
+                    sub_dataset.cache = self.image_cache
         self.anchor_target = AnchorTarget(cfg.ANCHOR.SCALES, cfg.ANCHOR.RATIOS, cfg.ANCHOR.STRIDE,
                                           cfg.TRAIN.SEARCH_SIZE // 2, cfg.TRAIN.OUTPUT_SIZE)
         self.template_aug = Augmentation(
@@ -138,26 +138,44 @@ class TrainDataset(Dataset):
             cfg.DATASET.SEARCH.FLIP,
             cfg.DATASET.SEARCH.COLOR
         )
+    def _block_shuffle(self, block_size, interleave):
+        """ the picks of all the datasets, in random blocks of block_size consecutive videos of a
+        dataset, the samples of every interleave blocks shuffled together
+        """
+        blocks = []
+        for sub_dataset in self.all_dataset:
+            p = np.sort(sub_dataset.pick)
+            block = (p - sub_dataset.start_idx) // block_size
+            blocks += np.split(p, np.flatnonzero(np.diff(block)) + 1)
+        order = np.random.permutation(len(blocks))
+        groups = []
+        for i in range(0, len(order), interleave):
+            group = np.concatenate([blocks[j] for j in order[i:i + interleave]])
+            np.random.shuffle(group)
+            groups.append(group)
+        return np.concatenate(groups)
+
     def shuffle(self):
         pick = []
         num = 0
         while num < self.num:
-            p = []
-            for sub_dataset in self.all_dataset:
-                sub_p = sub_dataset.pick
-                p += sub_p
-            np.random.shuffle(p)
-            pick += p
-            num = len(pick)
-        self.pick = pick[:self.num]
+            if cfg.DATASET.SHUFFLE.BLOCK > 0:
+                # the workers read a few blocks of videos at a time, friendlier to the page cache
+                p = self._block_shuffle(cfg.DATASET.SHUFFLE.BLOCK, cfg.DATASET.SHUFFLE.INTERLEAVE)
+            else:
+                p = np.concatenate([sub_dataset.pick for sub_dataset in self.all_dataset])
+                np.random.shuffle(p)
+            pick.append(p)
+            num += len(p)
+        self.pick = np.concatenate(pick)[:self.num]
 
     def _find_dataset(self, idx):
         for sub_dataset in self.all_dataset:
             if sub_dataset.start_idx + sub_dataset.num > idx:
                 return sub_dataset, idx - sub_dataset.start_idx
 
-    def get_bbox(self, image, ori_bbox):
-        img_h, img_w = image.shape[:2]
+    def get_bbox(self, image, ori_bbox, shape=None):
+        img_h, img_w = (image.shape if shape is None else shape)[:2]
         w, h = ori_bbox[2] - ori_bbox[0], ori_bbox[3] - ori_bbox[1]
         context_amount = 0.5
         wc_z = w + context_amount * (w + h)
@@ -177,53 +195,74 @@ class TrainDataset(Dataset):
         neg = cfg.DATASET.NEG and cfg.DATASET.NEG > np.random.random()
         if neg:
             examplar = sub_dataset.get_random_target(idx)
-            search = np.random.choice(self.all_dataset).get_random_target()
+            search_dataset = np.random.choice(self.all_dataset)
+            search = search_dataset.get_random_target()
         else:
+            search_dataset = sub_dataset
             examplar, search = sub_dataset.get_postive_pair(idx)
-        examplar_img = cv2.imread(examplar[0])
-        search_img = cv2.imread(search[0])
+        if cfg.DATASET.EXAMPLAR.REDUCED_DECODE > 1 and not cfg.TRAIN.DEVICE_AUG:
+            # the exemplar is a small crop of the image, decode it at a lower resolution
+            examplar_img, examplar_shape = sub_dataset.imread_reduced(examplar[0],
+                                                                      cfg.DATASET.EXAMPLAR.REDUCED_DECODE)
+        else:
+            examplar_img = sub_dataset.imread(examplar[0])
+            examplar_shape = examplar_img.shape
+        search_img = search_dataset.imread(search[0])
 
-        examplar_bbox = self.get_bbox(examplar_img, examplar[1])
+        examplar_bbox = self.get_bbox(examplar_img, examplar[1], examplar_shape)
         search_bbox = self.get_bbox(search_img, search[1])  # bbox: x1,y1,x2,y2
-        #----------------------------------------------------
-        # cur_mem=psutil.virtual_memory()
-        # cur_mem_used=cur_mem.used/1024/1024
-        # logger.info('mem add {}'.format(cur_mem_used-mem_used))
-        # mem = psutil.virtual_memory()
-        # mem_used=mem.used/1024/1024
-        #----------------------------------------------------
 
-        examplar_img, examplar_bbox = self.template_aug(examplar_img,
-                                                        examplar_bbox,
-                                                        cfg.TRAIN.EXAMPLER_SIZE,
-                                                        gray=gray)
-        search_img, search_bbox = self.search_aug(search_img,
-                                                  search_bbox,
-                                                  cfg.TRAIN.SEARCH_SIZE,
-                                                  gray=gray)
-
-        #--------------------------------------------------------
-        # debug
-        # print('template', examplar[0])
-        # print('search', search[0])
-        # pred_bbox = search_bbox
-        # pred_bbox = list(map(lambda x: int(x), pred_bbox))
-        # cv2.rectangle(search_img, (pred_bbox[0], pred_bbox[1]), (pred_bbox[2], pred_bbox[3]), (0, 0, 255), 2)
-        # cv2.imwrite('search.jpg', search_img.astype(np.uint8))
-        #--------------------------------------------------------
-        gt_cls, gt_delta, delta_weight = self.anchor_target(search_bbox, neg)
-        examplar_img = examplar_img.transpose((2, 0, 1)).astype(np.float32)  # NOTE: set as c,h,w and type=float32
-        search_img = search_img.transpose((2, 0, 1)).astype(np.float32)
-        examplar_img=examplar_img[::-1].copy() # use copy for memory contiguous
-        search_img=search_img[::-1].copy()
-        return {
-            'examplar_img': examplar_img,
-            'search_img': search_img,
-            'gt_cls': gt_cls,
-            'gt_delta': gt_delta,
-            'delta_weight': delta_weight,
-            'bbox': np.array(search_bbox)
-        }
+        if cfg.TRAIN.DEVICE_AUG:
+            # the decoded images and the draws, train.py augments the batch with DeviceAugmentation
+            examplar_param, examplar_bbox = self.template_aug.device_params(examplar_img.shape,
+                                                                            examplar_bbox,
+                                                                            cfg.TRAIN.EXAMPLER_SIZE,
+                                                                            gray=gray)
+            search_param, search_bbox = self.search_aug.device_params(search_img.shape,
+                                                                      search_bbox,
+                                                                      cfg.TRAIN.SEARCH_SIZE,
+                                                                      gray=gray)
+            data = {
+                'examplar_img': examplar_img,
+                'search_img': search_img,
+                'examplar_param': examplar_param,
+                'search_param': search_param
+            }
+        else:
+            examplar_img, examplar_bbox = self.template_aug(examplar_img,
+                                                            examplar_bbox,
+                                                            cfg.TRAIN.EXAMPLER_SIZE,
+                                                            gray=gray,
+                                                            shape=examplar_shape)
+            search_img, search_bbox = self.search_aug(search_img,
+                                                      search_bbox,
+                                                      cfg.TRAIN.SEARCH_SIZE,
+                                                      gray=gray)
+
+            #--------------------------------------------------------
+            # debug
+            # print('template', examplar[0])
+            # print('search', search[0])
+            # pred_bbox = search_bbox
+            # pred_bbox = list(map(lambda x: int(x), pred_bbox))
+            # cv2.rectangle(search_img, (pred_bbox[0], pred_bbox[1]), (pred_bbox[2], pred_bbox[3]), (0, 0, 255), 2)
+            # cv2.imwrite('search.jpg', search_img.astype(np.uint8))
+            #--------------------------------------------------------
+            examplar_img = examplar_img.transpose((2, 0, 1)).astype(np.float32)  # NOTE: set as c,h,w and type=float32
+            search_img = search_img.transpose((2, 0, 1)).astype(np.float32)
+            examplar_img=examplar_img[::-1].copy() # use copy for memory contiguous
+            search_img=search_img[::-1].copy()
+            data = {
+                'examplar_img': examplar_img,
+                'search_img': search_img
+            }
+        data['bbox'] = np.array(search_bbox)
+        if cfg.TRAIN.DEVICE_ANCHOR_TARGET:
+            # the targets are built from bbox and neg in the training step
+            data['neg'] = bool(neg)
+        else:
+            data['gt_cls'], data['gt_delta'], data['delta_weight'] = self.anchor_target(search_bbox, neg)
+        return data
 
     def __len__(self):
         return self.num
@@ -232,31 +271,22 @@ class TrainDataset(Dataset):
 class MetaSubDataset(SubDataset):
 
     def get_anno(self, idx):
-        video = self.videos[idx]
-        trackid = np.random.choice(list(self.annos[video].keys()))
-        frames = self.annos[video][trackid]['frames']
+        video, trackid, track = self._random_track(idx)
+        frames = self.index.track_frames(track)
         half = len(frames) // 2
         left = 0
         right = max(half, 1)
-        examplar_frame = np.random.choice(frames[left:right])
-        train_range = frames[left:right]
-        train_frames = np.random.choice(train_range, size=cfg.META.TRAIN_SIZE, replace=True)
+        examplar_idx = left + np.random.choice(right - left)
+        train_idx = left + np.random.choice(right - left, size=cfg.META.TRAIN_SIZE, replace=True)
         left = half
         right = max(half + 1, len(frames) - 1)
-        test_range = frames[left:right]
-        test_frames = np.random.choice(
-            test_range, size=cfg.META.TEST_SIZE, replace=True)
-        examplar_frame = '{:06d}'.format(examplar_frame)
-        train_frames = ['{:06d}'.format(train_frame) for train_frame in train_frames]
-        test_frames = ['{:06d}'.format(test_frame) for test_frame in test_frames]
-        examplar_path = os.path.join(self.data_dir, video, self.filename_format.format(examplar_frame, trackid, 'x'))
-        train_paths = [os.path.join(self.data_dir, video, self.filename_format.format(train_frame, trackid, 'x'))
-                       for train_frame in train_frames]
-        test_paths = [os.path.join(self.data_dir, video, self.filename_format.format(test_frame, trackid, 'x'))
-                      for test_frame in test_frames]
-        examplar_anno = self.annos[video][trackid][examplar_frame]
-        train_annos = [self.annos[video][trackid][train_frame] for train_frame in train_frames]
-        test_annos = [self.annos[video][trackid][test_frame] for test_frame in test_frames]
+        test_idx = left + np.random.choice(right - left, size=cfg.META.TEST_SIZE, replace=True)
+        examplar_path = self._get_path(video, frames[examplar_idx], trackid)
+        train_paths = [self._get_path(video, frames[i], trackid) for i in train_idx]
+        test_paths = [self._get_path(video, frames[i], trackid) for i in test_idx]
+        examplar_anno = self.index.box(track, examplar_idx)
+        train_annos = [self.index.box(track, i) for i in train_idx]
+        test_annos = [self.index.box(track, i) for i in test_idx]
         return (examplar_path, examplar_anno), (train_paths, train_annos), (test_paths, test_annos)
 
 
@@ -295,7 +325,7 @@ class MetaTrainDataset(TrainDataset):
         idx = self.pick[idx]
         sub_dataset, idx = self._find_dataset(idx)
         examplar_frame, train_frames, test_frames = sub_dataset.get_anno(idx)
-        examplar_img = cv2.imread(examplar_frame[0])
+        examplar_img = sub_dataset.imread(examplar_frame[0])
         examplar_bbox = self.get_bbox(examplar_img, examplar_frame[1])
 
         examplar_img, _ = self.examplar_aug(examplar_img,
@@ -303,7 +333,7 @@ class MetaTrainDataset(TrainDataset):
                                             cfg.TRAIN.EXAMPLER_SIZE,
                                             gray=False)
         # train set
-        train_imgs = [cv2.imread(train_path) for train_path in train_frames[0]]
+        train_imgs = [sub_dataset.imread(train_path) for train_path in train_frames[0]]
         train_bboxes = [self.get_bbox(img, anno)
                         for img, anno in zip(train_imgs, train_frames[1])]
         train_set = [self.search_aug(train_img, train_bbox, cfg.TRAIN.SEARCH_SIZE, gray=False)
@@ -311,7 +341,7 @@ class MetaTrainDataset(TrainDataset):
         train_imgs, train_bboxes = zip(*train_set)
         train_imgs, train_bboxes = list(train_imgs), list(train_bboxes)
         # test set
-        test_imgs = [cv2.imread(test_path) for test_path in test_frames[0]]
+        test_imgs = [sub_dataset.imread(test_path) for test_path in test_frames[0]]
         test_bboxes = [self.get_bbox(img, anno) for img, anno in zip(test_imgs, test_frames[1])]
         test_set = [self.search_aug(test_img, test_bbox, cfg.TRAIN.SEARCH_SIZE, gray=False)
                     for test_img, test_bbox in zip(test_imgs, test_bboxes)]
@@ -325,12 +355,9 @@ class MetaTrainDataset(TrainDataset):
             lambda x: np.stack(x, axis=0).transpose((0, 3, 1, 2)).astype(np.float32),
             [train_imgs, test_imgs])
         # train
-        gt_data = zip(*[self.anchor_target(bbox) for bbox in train_bboxes])
-        train_cls, train_delta, train_delta_weight = map(lambda x: np.stack(x, axis=0), gt_data)
+        train_cls, train_delta, train_delta_weight = self.anchor_target.batch(train_bboxes)
         # test
-        gt_data = zip(*[self.anchor_target(bbox) for bbox in test_bboxes])
-        test_cls, test_delta, test_delta_weight = map(
-            lambda x: np.stack(x, axis=0), gt_data)
+        test_cls, test_delta, test_delta_weight = self.anchor_target.batch(test_bboxes)
         return {
             'train_examplar_imgs': train_examplar_imgs,
             'test_examplar_imgs': test_examplar_imgs,
@@ -389,11 +416,13 @@ class GradTrainDataset(TrainDataset):
         neg = cfg.DATASET.NEG and cfg.DATASET.NEG > np.random.random()
         if neg:
             examplar = sub_dataset.get_random_target(idx)
-            search = np.random.choice(self.all_dataset).get_random_target()
+            search_dataset = np.random.choice(self.all_dataset)
+            search = search_dataset.get_random_target()
         else:
+            search_dataset = sub_dataset
             examplar, search = sub_dataset.get_postive_pair(idx)
-        examplar_img = cv2.imread(examplar[0])
-        search_img = cv2.imread(search[0])
+        examplar_img = sub_dataset.imread(examplar[0])
+        search_img = search_dataset.imread(search[0])
 
         examplar_bbox = self.get_bbox(examplar_img, examplar[1])
         search_bbox = self.get_bbox(search_img, search[1])  # bbox: x1,y1,x2,y2
@@ -0,0 +1,93 @@
+import mmap
+import hashlib
+import logging
+import multiprocessing
+
+import numpy as np
+
+logger = logging.getLogger('global')
+
+
+class SharedImageCache(object):
+    """Decoded images shared by the DataLoader workers, least recently used out.
+
+    The images live in fixed size slots of one anonymous shared mapping, with the hash of
+    the path, the shape and the last use of every slot in a second one. Both are created
+    before the workers are forked, so every worker sees the images the others decoded and
+    the main process sees the counters. A lookup is a scan of the slot hashes and a copy
+    of the image, under one lock.
+    """
+    HITS, MISSES, INSERTS, EVICTIONS, TICK = range(5)
+
+    def __init__(self, size_mb, max_shape=(511, 511, 3)):
+        self.slot_bytes = int(np.prod(max_shape))
+        self.num_slots = max(int(size_mb * 1024 * 1024) // self.slot_bytes, 1)
+        self._data_map = mmap.mmap(-1, self.num_slots * self.slot_bytes)
+        self._meta_map = mmap.mmap(-1, self.num_slots * (8 + 8 + 12) + 8 * 5)
+        self.data = np.frombuffer(self._data_map, dtype=np.uint8).reshape(self.num_slots, self.slot_bytes)
+        meta = np.frombuffer(self._meta_map, dtype=np.uint8)
+        n = self.num_slots
+        self.keys = meta[:8 * n].view(np.int64)  # 0 for an empty slot
+        self.ticks = meta[8 * n:16 * n].view(np.int64)
+        self.shapes = meta[16 * n:28 * n].view(np.int32).reshape(n, 3)
+        self.counters = meta[28 * n:28 * n + 40].view(np.int64)
+        self.lock = multiprocessing.Lock()
+        logger.info('image cache: {} slots of {} ({:.0f}M)'.format(
+            n, max_shape, n * self.slot_bytes / 1024 ** 2))
+
+    @staticmethod
+    def _key(path):
+        key = int.from_bytes(hashlib.blake2b(path.encode(), digest_size=8).digest(), 'little', signed=True)
+        return key or 1
+
+    def get(self, path):
+        """ a copy of the cached image of path, None on a miss """
+        key = self._key(path)
+        with self.lock:
+            self.counters[self.TICK] += 1
+            slot = np.flatnonzero(self.keys == key)
+            if len(slot) == 0:
+                self.counters[self.MISSES] += 1
+                return None
+            slot = slot[0]
+            self.counters[self.HITS] += 1
+            self.ticks[slot] = self.counters[self.TICK]
+            shape = tuple(self.shapes[slot])
+            return self.data[slot, :int(np.prod(shape))].reshape(shape).copy()
+
+    def put(self, path, image):
+        """ cache image, the least recently used one makes room; images larger than a slot are skipped """
+        if image is None or image.dtype != np.uint8 or image.ndim != 3 or image.nbytes > self.slot_bytes:
+            return
+        key = self._key(path)
+        with self.lock:
+            self.counters[self.TICK] += 1
+            if np.any(self.keys == key):  # another worker was faster
+                return
+            empty = np.flatnonzero(self.keys == 0)
+            if len(empty):
+                slot = empty[0]
+            else:
+                slot = np.argmin(self.ticks)
+                self.counters[self.EVICTIONS] += 1
+            self.data[slot, :image.nbytes] = image.reshape(-1)
+            self.shapes[slot] = image.shape
+            self.keys[slot] = key
+            self.ticks[slot] = self.counters[self.TICK]
+            self.counters[self.INSERTS] += 1
+
+    def stats(self):
+        """ hits, misses, inserts, evictions and hit rate over all the workers, slots in use """
+        hits, misses, inserts, evictions = [int(x) for x in self.counters[:4]]
+        return {
+            'hits': hits,
+            'misses': misses,
+            'inserts': inserts,
+            'evictions': evictions,
+            'hit_rate': hits / max(hits + misses, 1),
+            'used': int(np.count_nonzero(self.keys)) / self.num_slots
+        }
+
+    def __str__(self):
+        return 'hit rate: {hit_rate:.3f} hits: {hits} misses: {misses} evictions: {evictions} ' \
+               'used: {used:.2f}'.format(**self.stats())
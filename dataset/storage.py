@@ -0,0 +1,129 @@
+import os
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger('global')
+
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def jpeg_shape(data):
+    """ h, w, 3 of a jpeg from the frame header, None if data is not a jpeg """
+    if data[:2] != b'\xff\xd8':
+        return None
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xff:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xff:  # fill byte
+            pos += 1
+            continue
+        # start of frame, not DHT (c4), JPG (c8) or DAC (cc)
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            return (data[pos + 5] << 8 | data[pos + 6], data[pos + 7] << 8 | data[pos + 8], 3)
+        pos += 2 + (data[pos + 2] << 8 | data[pos + 3])
+    return None
+
+
+def imdecode_reduced(data, reduce):
+    """ decode at 1/reduce of the resolution (2, 4 or 8), libjpeg scales in the DCT so it is faster
+
+    :return: image, shape of the full resolution image. A full decode when the shape is not known.
+    """
+    shape = jpeg_shape(data) if reduce in REDUCED_FLAGS else None
+    if shape is None:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return image, None if image is None else image.shape
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_FLAGS[reduce]), shape
+
+
+class FileStorage(object):
+    """ one file per image, the crop511 layout of par_crop.py """
+
+    def __init__(self, root):
+        self.root = root
+
+    def imread(self, path):
+        return cv2.imread(path)
+
+    def imread_reduced(self, path, reduce):
+        """ image at 1/reduce of the resolution and the full shape, see imdecode_reduced """
+        if not os.path.isfile(path):
+            return None, None
+        with open(path, 'rb') as f:
+            return imdecode_reduced(f.read(), reduce)
+
+
+class ShardStorage(object):
+    """Images packed by tools/pack_dataset.py into a few large shard files.
+
+    index.npz holds the sorted keys (path relative to the root) with the shard, offset and
+    length of every image, as flat numpy arrays: a lookup is a binary search and a read is
+    one pread of the encoded bytes. The arrays have no python objects per image, so the
+    forked DataLoader workers share them without copying.
+    """
+    INDEX = 'index.npz'
+    SHARD = 'shard_{:05d}.bin'
+
+    def __init__(self, root):
+        self.root = root
+        index = np.load(os.path.join(root, self.INDEX))
+        self.keys = index['keys']
+        self.shard = index['shard']
+        self.offset = index['offset']
+        self.length = index['length']
+        self._files = {}
+        self._pid = None
+        logger.info('{}: {} images in {} shards'.format(root, len(self.keys), self.shard.max() + 1 if len(self.keys) else 0))
+
+    def _key(self, path):
+        if path.startswith(self.root):
+            key = path[len(self.root):].lstrip('/\\')
+        else:
+            key = os.path.relpath(path, self.root)
+        return key.replace('\\', '/').encode()
+
+    def _file(self, shard):
+        # every process opens its own files, the workers are forked after __init__
+        if self._pid != os.getpid():
+            self._files, self._pid = {}, os.getpid()
+        if shard not in self._files:
+            self._files[shard] = open(os.path.join(self.root, self.SHARD.format(shard)), 'rb', buffering=0)
+        return self._files[shard]
+
+    def get(self, path):
+        """ encoded bytes of the image at path, None if it is not packed """
+        key = self._key(path)
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        f = self._file(int(self.shard[i]))
+        offset, length = int(self.offset[i]), int(self.length[i])
+        if hasattr(os, 'pread'):
+            return os.pread(f.fileno(), length, offset)
+        f.seek(offset)
+        return f.read(length)
+
+    def imread(self, path):
+        """ same as cv2.imread, None for a missing image """
+        data = self.get(path)
+        if data is None:
+            return None
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def imread_reduced(self, path, reduce):
+        """ image at 1/reduce of the resolution and the full shape, see imdecode_reduced """
+        data = self.get(path)
+        if data is None:
+            return None, None
+        return imdecode_reduced(data, reduce)
+
+
+def get_storage(data_dir):
+    """ ShardStorage if data_dir was packed by tools/pack_dataset.py, else FileStorage """
+    if os.path.isfile(os.path.join(data_dir, ShardStorage.INDEX)):
+        return ShardStorage(data_dir)
+    return FileStorage(data_dir)
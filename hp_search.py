@@ -10,8 +10,10 @@ import numpy as np
 from toolkit.utils.region import vot_overlap, vot_float2str
 from models import get_model
 from trackers import get_tracker
+from trackers.examplar_cache import get_examplar_cache
 from toolkit.datasets import get_dataset
 from utils.model_load import load_pretrain
+from utils.device import prepare_model
 from configs.config import cfg
 from utils.visual import show_double_bbox
 os.environ["CUDA_VISIBLE_DEVICES"] = '2'
@@ -137,7 +139,7 @@ if __name__ == '__main__':
     model = get_model(cfg.MODEL_ARC)
 
     # load model
-    model = load_pretrain(model, args.snapshot).cuda().eval()
+    model = prepare_model(load_pretrain(model, args.snapshot))
 
     # build tracker
     tracker_name = 'SiamRPN'
@@ -230,3 +232,4 @@ if __name__ == '__main__':
                         #         for x in pred_bboxes:
                         #             f.write(','.join([str(i) for i in x]) + '\n')
         video.free_imgs()
+        print('video: {}, {}'.format(video.name, get_examplar_cache().summary()))
@@ -132,7 +132,9 @@ class ResNet(nn.Module):
             return out
 
 
-def resnet50(**kwargs):
+def resnet50(width_mult=1.0, **kwargs):
+    # cfg.BACKBONE.KWARGS holds a width_mult by default, resnet50 only comes in full width
+    assert width_mult == 1.0, 'resnet50 has no width_mult {}'.format(width_mult)
     return ResNet(ResidualBlock, [3, 4, 6, 3], **kwargs)
 
 
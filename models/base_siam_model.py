@@ -37,19 +37,34 @@ class BaseSiamModel(nn.Module):
             'total_loss': total_loss
         }
 
-    def track(self, search):
+    def track(self, search, kernels=None):
+        """
+        :param kernels: rpn kernels from get_kernels, the ones of set_examplar when None
+        """
         search = self.backbone(search)
-        examplar = self.examplar
+        if kernels is None:
+            kernels = self.kernels
         if cfg.ADJUST.USE:
             search = self.neck(search)
-        pred_cls, pred_loc = self.rpn(examplar, search)
+        pred_cls, pred_loc = self.rpn.forward_search(kernels, search)
         return pred_cls, pred_loc
 
     def set_examplar(self, examplar):
+        self.set_examplar_feature(self.get_examplar(examplar))
+
+    def set_examplar_feature(self, examplar):
+        """ set the output of get_examplar, the rpn kernels are computed here once instead of every frame """
+        self.examplar = examplar
+        self.kernels = self.get_kernels(examplar)
+
+    def get_kernels(self, examplar):
+        return self.rpn.prepare_kernel(examplar)
+
+    def get_examplar(self, examplar):
         examplar = self.backbone(examplar)
         if cfg.ADJUST.USE:
-            examplar=self.neck(examplar)
-        self.examplar=examplar
+            examplar = self.neck(examplar)
+        return examplar
 
 
 
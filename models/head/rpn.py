@@ -19,9 +19,7 @@ class DepthwiseRPN(RPN):
 
     def forward(self, z_f, x_f, weight=None, bn_weight=None):
         if weight is None and bn_weight is None:
-            cls = self.cls(z_f, x_f)
-            loc = self.loc(z_f, x_f)
-            return cls, loc
+            return self.forward_search(self.prepare_kernel(z_f), x_f)
         else:
             # cls
             # cls_kernel
@@ -77,6 +75,19 @@ class DepthwiseRPN(RPN):
                 loc_feat, weight['loc.head.3.weight'], weight['loc.head.3.bias'])
             return cls, loc
 
+    def prepare_kernel(self, z_f):
+        """ the part of the head that only depends on the examplar, run it once per examplar """
+        return self.cls.prepare_kernel(z_f), self.loc.prepare_kernel(z_f)
+
+    def forward_search(self, kernels, x_f):
+        """
+        :param kernels: output of prepare_kernel
+        """
+        cls_kernel, loc_kernel = kernels
+        cls = self.cls.forward_search(cls_kernel, x_f)
+        loc = self.loc.forward_search(loc_kernel, x_f)
+        return cls, loc
+
 
 class MultiRPN(RPN):
     def __init__(self, in_channels, anchor_num=5, weighted=False):
@@ -90,11 +101,21 @@ class MultiRPN(RPN):
             self.loc_weight = nn.Parameter(torch.ones(len(in_channels)), requires_grad=True)
 
     def forward(self, z_fs, x_fs):
+        return self.forward_search(self.prepare_kernel(z_fs), x_fs)
+
+    def prepare_kernel(self, z_fs):
+        """ the kernels of every head, they only depend on the examplar, run it once per examplar """
+        return [getattr(self, 'head' + str(idx)).prepare_kernel(z_f) for idx, z_f in enumerate(z_fs, start=2)]
+
+    def forward_search(self, kernels, x_fs):
+        """
+        :param kernels: output of prepare_kernel
+        """
         cls = []
         loc = []
-        for idx, (z_f, x_f) in enumerate(zip(z_fs, x_fs), start=2):
+        for idx, (kernel, x_f) in enumerate(zip(kernels, x_fs), start=2):
             rpn = getattr(self, 'head' + str(idx))
-            c, l = rpn(z_f, x_f)
+            c, l = rpn.forward_search(kernel, x_f)
             cls.append(c)
             loc.append(l)
 
@@ -140,7 +161,15 @@ class DepthwiseXCorr(nn.Module):
         )
 
     def forward(self, kernel, search):
-        kernel = self.conv_kernel(kernel)
+        return self.forward_search(self.prepare_kernel(kernel), search)
+
+    def prepare_kernel(self, kernel):
+        return self.conv_kernel(kernel)
+
+    def forward_search(self, kernel, search):
+        """
+        :param kernel: output of prepare_kernel
+        """
         search = self.conv_search(search)
         feature = xcorr_depthwise(search, kernel)
         out = self.head(feature)
@@ -152,8 +181,8 @@ def xcorr_depthwise(x, kernel):
     """
     batch = kernel.size(0)
     channel = kernel.size(1)
-    x = x.view(1, batch * channel, x.size(2), x.size(3))
-    kernel = kernel.view(batch * channel, 1, kernel.size(2), kernel.size(3))
+    x = x.reshape(1, batch * channel, x.size(2), x.size(3))  # channels last inputs can not be viewed
+    kernel = kernel.reshape(batch * channel, 1, kernel.size(2), kernel.size(3))
     out = F.conv2d(x, kernel, groups=batch * channel)
     out = out.view(batch, channel, out.size(2), out.size(3))
     return out
@@ -1,6 +1,7 @@
 import torch
 import numpy as np
 from configs.config import cfg
+from utils.device import get_device
 
 from models.base_siam_model import BaseSiamModel
 from utils.loss import select_cross_entropy_loss, weight_l1_loss
@@ -73,6 +74,7 @@ class PruningSiamModel(BaseSiamModel):
     #     return examplar
 
     def create_mask(self):
+        device = get_device()
         repeat_times = [1, 2, 3, 4, 3, 3, 1]
         backbone_params = dict(self.backbone.named_parameters())
         backbone_param_keys = list(backbone_params.keys())
@@ -82,7 +84,7 @@ class PruningSiamModel(BaseSiamModel):
         for i in range(3):
             if len(backbone_param_values[i].size()) == 1:  # skip the batchnorm
                 continue
-            self.mask['backbone.' + backbone_param_keys[i]] = torch.ones(backbone_param_values[i].size(0)).cuda()
+            self.mask['backbone.' + backbone_param_keys[i]] = torch.ones(backbone_param_values[i].size(0), device=device)
         # layer1-7
         idx = 3
         for i in range(7):  # 6 layers
@@ -96,20 +98,20 @@ class PruningSiamModel(BaseSiamModel):
                             and backbone_param_values[idx + k].size(1) == 1:  # skip the depth-wise conv
                         continue
                     self.mask['backbone.' + backbone_param_keys[idx + k]] = torch.ones(
-                        backbone_param_values[idx + k].size(0)).cuda()
+                        backbone_param_values[idx + k].size(0), device=device)
                 idx += 9
         # for neck
         for k, v in self.neck.named_parameters():
             if len(v.size()) == 1:  # skip the batchnorm
                 continue
-            self.mask['neck.' + k] = torch.ones(v.size(0)).cuda()
+            self.mask['neck.' + k] = torch.ones(v.size(0), device=device)
 
         # for rpn
         for k, v in self.rpn.named_parameters():
             if 'head.0' in k or 'head.1' in k:  # now only prune the first layer of the head
                 if len(v.size()) == 1:  # skip the batchnorm
                     continue
-                self.mask['rpn.' + k] = torch.ones(v.size(0)).cuda()
+                self.mask['rpn.' + k] = torch.ones(v.size(0), device=device)
 
     def update_mask(self):
         # sfp
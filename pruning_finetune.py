@@ -19,6 +19,9 @@ from utils.lr_scheduler import build_lr_scheduler
 from utils.misc import commit, describe
 from utils.model_load import load_pretrain, restore_from
 from utils.average_meter import AverageMeter
+from utils.anchor import DeviceAnchorTarget
+from dataset.augmentation import DeviceAugmentation
+from utils.device import get_device
 from pruning_model import prune_model
 
 logger = logging.getLogger('global')
@@ -121,6 +124,11 @@ def train(train_dataloader, model, optimizer, lr_scheduler):
     average_meter = AverageMeter()
     start_epoch = cfg.PRUNING.FINETUNE.START_EPOCH
     num_per_epoch = len(train_dataloader.dataset) // (cfg.PRUNING.FINETUNE.BATCH_SIZE)
+    if cfg.TRAIN.DEVICE_ANCHOR_TARGET:
+        anchor_target = DeviceAnchorTarget(cfg.ANCHOR.SCALES, cfg.ANCHOR.RATIOS, cfg.ANCHOR.STRIDE,
+                                           cfg.TRAIN.SEARCH_SIZE // 2, cfg.TRAIN.OUTPUT_SIZE, get_device())
+    if cfg.TRAIN.DEVICE_AUG:
+        augmentation = DeviceAugmentation(get_device())
     iter = 0
     if not os.path.exists(cfg.PRUNING.FINETUNE.SNAPSHOT_DIR):
         os.makedirs(cfg.PRUNING.FINETUNE.SNAPSHOT_DIR)
@@ -133,11 +141,20 @@ def train(train_dataloader, model, optimizer, lr_scheduler):
         cur_lr = lr_scheduler.get_cur_lr()
         for data in train_dataloader:
             begin = time.time()
-            examplar_img = data['examplar_img'].cuda()
-            search_img = data['search_img'].cuda()
-            gt_cls = data['gt_cls'].cuda()
-            gt_delta = data['gt_delta'].cuda()
-            delta_weight = data['delta_weight'].cuda()
+            if cfg.TRAIN.DEVICE_AUG:
+                # bgr to rgb as TrainDataset does
+                examplar_img = augmentation(data['examplar_img'], data['examplar_param'],
+                                            cfg.TRAIN.EXAMPLER_SIZE).flip(1)
+                search_img = augmentation(data['search_img'], data['search_param'], cfg.TRAIN.SEARCH_SIZE).flip(1)
+            else:
+                examplar_img = data['examplar_img'].cuda()
+                search_img = data['search_img'].cuda()
+            if cfg.TRAIN.DEVICE_ANCHOR_TARGET:
+                gt_cls, gt_delta, delta_weight = anchor_target(data['bbox'], data['neg'])
+            else:
+                gt_cls = data['gt_cls'].cuda()
+                gt_delta = data['gt_delta'].cuda()
+                delta_weight = data['delta_weight'].cuda()
             data_time = time.time() - begin
             losses = model.forward(examplar_img, search_img, gt_cls, gt_delta, delta_weight)
             cls_loss = losses['cls_loss']
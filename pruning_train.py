@@ -12,8 +12,6 @@ from torch import optim
 from torch.nn.utils import clip_grad_norm_
 from torch.utils.data import DataLoader
 from tensorboardX import SummaryWriter
-# from memory_profiler import profile
-# import psutil
 from configs.config import cfg
 from dataset.dataset import TrainDataset
 from models.pruning_siam_model import PruningSiamModel
@@ -22,6 +20,10 @@ from utils.lr_scheduler import build_lr_scheduler
 from utils.misc import commit, describe
 from utils.model_load import load_pretrain, restore_from
 from utils.average_meter import AverageMeter
+from utils.anchor import DeviceAnchorTarget
+from dataset.augmentation import DeviceAugmentation
+from utils.device import get_device
+from utils.memory import WorkerMemoryCollate, process_memory, memory_str
 
 logger = logging.getLogger('global')
 
@@ -110,6 +112,7 @@ def build_data_loader():
     train_dataloader = DataLoader(train_dataset,
                                   batch_size=cfg.PRUNING.BATCH_SIZE,
                                   num_workers=cfg.TRAIN.NUM_WORKERS,
+                                  collate_fn=WorkerMemoryCollate(cfg.TRAIN.LOG_WORKER_MEMORY),
                                   pin_memory=True)
     return train_dataloader
 
@@ -122,6 +125,11 @@ def train(train_dataloader, model, optimizer, lr_scheduler):
     average_meter = AverageMeter()
     start_epoch = cfg.PRUNING.START_EPOCH
     num_per_epoch = len(train_dataloader.dataset) // (cfg.PRUNING.BATCH_SIZE)
+    if cfg.TRAIN.DEVICE_ANCHOR_TARGET:
+        anchor_target = DeviceAnchorTarget(cfg.ANCHOR.SCALES, cfg.ANCHOR.RATIOS, cfg.ANCHOR.STRIDE,
+                                           cfg.TRAIN.SEARCH_SIZE // 2, cfg.TRAIN.OUTPUT_SIZE, get_device())
+    if cfg.TRAIN.DEVICE_AUG:
+        augmentation = DeviceAugmentation(get_device())
     iter = 0
     if not os.path.exists(cfg.PRUNING.SNAPSHOT_DIR):
         os.makedirs(cfg.PRUNING.SNAPSHOT_DIR)
@@ -135,11 +143,20 @@ def train(train_dataloader, model, optimizer, lr_scheduler):
         cur_lr = lr_scheduler.get_cur_lr()
         for data in train_dataloader:
             begin = time.time()
-            examplar_img = data['examplar_img'].cuda()
-            search_img = data['search_img'].cuda()
-            gt_cls = data['gt_cls'].cuda()
-            gt_delta = data['gt_delta'].cuda()
-            delta_weight = data['delta_weight'].cuda()
+            if cfg.TRAIN.DEVICE_AUG:
+                # bgr to rgb as TrainDataset does
+                examplar_img = augmentation(data['examplar_img'], data['examplar_param'],
+                                            cfg.TRAIN.EXAMPLER_SIZE).flip(1)
+                search_img = augmentation(data['search_img'], data['search_param'], cfg.TRAIN.SEARCH_SIZE).flip(1)
+            else:
+                examplar_img = data['examplar_img'].cuda()
+                search_img = data['search_img'].cuda()
+            if cfg.TRAIN.DEVICE_ANCHOR_TARGET:
+                gt_cls, gt_delta, delta_weight = anchor_target(data['bbox'], data['neg'])
+            else:
+                gt_cls = data['gt_cls'].cuda()
+                gt_delta = data['gt_delta'].cuda()
+                delta_weight = data['delta_weight'].cuda()
             data_time = time.time() - begin
             losses = model.forward(examplar_img, search_img, gt_cls, gt_delta, delta_weight)
             cls_loss = losses['cls_loss']
@@ -170,9 +187,8 @@ def train(train_dataloader, model, optimizer, lr_scheduler):
                 print_speed(iter + 1 + start_epoch * num_per_epoch,
                             average_meter.batch_time.avg,
                             cfg.PRUNING.EPOCHS * num_per_epoch)
-                # mem = psutil.virtual_memory()
-                # mem_used=mem.used/1024/1024
-                # logger.info('memory used: {}M'.format(mem_used))
+                if cfg.TRAIN.LOG_WORKER_MEMORY:
+                    logger.info('main pid {}: {}'.format(os.getpid(), memory_str(process_memory())))
             iter += 1
         model.update_mask()
         model.apply_mask()
@@ -2,6 +2,7 @@ import os
 import argparse
 import cv2
 import logging
+import multiprocessing as mp
 import torch
 
 from pruning_model import prune_model
@@ -10,9 +11,12 @@ from utils.model_load import load_pretrain
 from models import get_model
 from configs.config import cfg
 from trackers import get_tracker
+from trackers.examplar_cache import get_examplar_cache
+from trackers.cascade_siamrpn import CascadeSiamRPN, cfg_scope
 from utils.visual import show_double_bbox
 from toolkit.utils.region import vot_overlap
 from utils.log_helper import init_log
+from utils.device import prepare_model
 
 parser = argparse.ArgumentParser(description='test tracker')
 parser.add_argument('--tracker', default='', type=str, help='which tracker to use')
@@ -21,130 +25,334 @@ parser.add_argument('--cfg', default='', type=str, help='cfg file to use')
 parser.add_argument('--snapshot', default='', type=str, help='base snapshot for track')
 parser.add_argument('--video', default='', type=str, help='choose one special video to test')
 parser.add_argument('--vis', action='store_true', help='whether to visual')
+parser.add_argument('--device', default='', type=str, help='override cfg.DEVICE, e.g. cpu')
+parser.add_argument('--num_workers', default=1, type=int,
+                    help='number of processes, every one tracks whole videos with its own model')
+parser.add_argument('--worker_threads', default=1, type=int, help='torch threads of every worker')
+parser.add_argument('--resume', action='store_true', help='skip the videos that already have a result file')
+parser.add_argument('--prefetch', default=0, type=int,
+                    help='number of frames decoded ahead on background threads, 0 decodes in the loop')
+parser.add_argument('--lockstep', default=1, type=int,
+                    help='number of videos tracked together by one MultiTargetSiamRPN, their search crops go '
+                         'through one batched forward (SiamRPN only, without cfg.TRACK.ADAPTIVE and STATIC)')
+parser.add_argument('--heavy_cfg', default='', type=str, help='cfg file of the heavy model of CascadeSiamRPN')
+parser.add_argument('--heavy_snapshot', default='', type=str, help='snapshot of the heavy model of CascadeSiamRPN')
 args = parser.parse_args()
 
+default_cfg = cfg.clone()  # the heavy cfg of CascadeSiamRPN starts from the defaults, not from --cfg
+
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"
 torch.set_num_threads(1)  # use only one threads to test the real speed
 
 
-def vot_evaluate(dataset, tracker):
-    tracker_name = args.tracker
-    backbone_name = args.cfg.split('/')[-1].split('_')[0]
-    snapshot_name = args.snapshot.split('/')[-1].split('.')[0]
-    total_lost = 0
-    for v_idx, video in enumerate(dataset):
-        if args.video != '':  # if test special video
-            if video.name != args.video:
-                continue
-        frame_count = 0
-        lost_number = 0
-        pred_bboxes = []
-        toc = 0
-        for idx, (frame, gt_bbox) in enumerate(video):
-            tic = cv2.getTickCount()
-            if idx == frame_count:
-                tracker.init(frame, gt_bbox)  # cx,cy,w,h
-                pred_bboxes.append(1)
-            elif idx > frame_count:
-                track_result = tracker.track(frame)
-                bbox = track_result['bbox']  # cx,cy,w,h
-                score = track_result['score']
-                bbox_ = [bbox[0] - bbox[2] / 2, bbox[1] - bbox[3] / 2, bbox[2], bbox[3]]  # x,y,w,h
-                gt_bbox_ = [gt_bbox[0] - (gt_bbox[2] - 1) / 2,
-                            gt_bbox[1] - (gt_bbox[3] - 1) / 2,
-                            gt_bbox[2],
-                            gt_bbox[3]]
-                overlap = vot_overlap(bbox_, gt_bbox_, (frame.shape[1], frame.shape[0]))
-                # print('idx: {}\n pred: {}\n gt: {}\n overlap: {}\n'.format(idx, bbox_, gt_bbox_, overlap))
-                if overlap > 0:
-                    pred_bboxes.append(bbox_)
-                else:
-                    # print('lost idx: {}'.format(idx))
-                    pred_bboxes.append(2)
-                    frame_count = idx + 5
-                    lost_number += 1
-            else:
-                pred_bboxes.append(0)
-
-            toc += cv2.getTickCount() - tic
-            if args.vis and idx > frame_count:
-                show_double_bbox(frame, bbox, score, gt_bbox, idx, lost_number)
-        toc /= cv2.getTickFrequency()
-        result_dir = os.path.join(cfg.TRACK.RESULT_DIR, args.dataset, tracker_name, backbone_name, snapshot_name)
-        if not os.path.isdir(result_dir):
-            os.makedirs(result_dir)
-        result_path = '{}/{}.txt'.format(result_dir, video.name)
-        with open(result_path, 'w') as f:
-            for x in pred_bboxes:
-                if isinstance(x, int):
-                    f.write('{:d}\n'.format(x))
-                else:
-                    f.write(','.join(['{:.4f}'.format(i) for i in x]) + '\n')
-        # log
-        total_lost += lost_number
-
-        print('[{:d}/{:d}] | video: {:12s} | time: {:4.1f}s | speed: {:3.1f}fps | lost_number: {:d} ' \
-              .format(v_idx + 1, len(dataset), video.name, toc, idx / toc, lost_number))
-    print('total_lost: {}'.format(total_lost))
-
-
-def ope_evaluate(dataset, tracker):
+def get_result_dir():
     tracker_name = args.tracker
     backbone_name = args.cfg.split('/')[-1].split('_')[0]
     snapshot_name = args.snapshot.split('/')[-1].split('.')[0]
-    for v_idx, video in enumerate(dataset):
-        if args.video != '':  # if test special video
-            if video.name != args.video:
-                continue
-        pred_bboxes = []
-        runtime = []
-        toc = 0
-        for idx, (frame, gt_bbox) in enumerate(video):
-            tic = cv2.getTickCount()
-            if idx == 0:
-                tracker.init(frame, gt_bbox)  # cx,cy,w,h
-                track_result = tracker.track(frame)
-                bbox = track_result['bbox']  # cx,cy,w,h
-                score = track_result['score']
-                bbox_ = [bbox[0] - bbox[2] / 2, bbox[1] - bbox[3] / 2, bbox[2], bbox[3]]  # x,y,w,h
-                gt_bbox_ = [gt_bbox[0] - gt_bbox[2] / 2, gt_bbox[1] - gt_bbox[3] / 2, gt_bbox[2], gt_bbox[3]]
+    return os.path.join(cfg.TRACK.RESULT_DIR, args.dataset, tracker_name, backbone_name, snapshot_name)
+
+
+def get_result_path(video):
+    if args.dataset in ['VOT2016', 'VOT2018']:
+        return '{}/{}.txt'.format(get_result_dir(), video.name)
+    return '{}/{}/{}_001.txt'.format(get_result_dir(), video.name, video.name)
+
+
+def _check_and_occupation(result_path):
+    """ same as hp_search.py, a result file (or the 'Occ' of another run) means the video is done """
+    if os.path.isfile(result_path):
+        return True
+    try:
+        if not os.path.isdir(os.path.dirname(result_path)):
+            os.makedirs(os.path.dirname(result_path))
+    except OSError as err:
+        print(err)
+
+    with open(result_path, 'w') as f:
+        f.write('Occ')
+    return False
+
+
+def vot_video_steps(video):
+    """
+    VOT protocol on the video, re-init 5 frames after a failure. The tracker is left to the caller, see
+    run_video: yields ('init', frame, gt_bbox) and ('track', frame), is sent the result of every track and
+    returns the stats of the video for log_video
+    """
+    frame_count = 0
+    lost_number = 0
+    pred_bboxes = []
+    toc = 0
+    decode_time = 0  # time the loop waited for the next frame
+    frames = video.prefetch(args.prefetch) if args.prefetch > 0 else video
+    last = cv2.getTickCount()
+    for idx, (frame, gt_bbox) in enumerate(frames):
+        tic = cv2.getTickCount()
+        decode_time += tic - last
+        if idx == frame_count:
+            yield 'init', frame, gt_bbox  # cx,cy,w,h
+            pred_bboxes.append(1)
+        elif idx > frame_count:
+            track_result = yield 'track', frame
+            bbox = track_result['bbox']  # cx,cy,w,h
+            score = track_result['score']
+            bbox_ = [bbox[0] - bbox[2] / 2, bbox[1] - bbox[3] / 2, bbox[2], bbox[3]]  # x,y,w,h
+            gt_bbox_ = [gt_bbox[0] - (gt_bbox[2] - 1) / 2,
+                        gt_bbox[1] - (gt_bbox[3] - 1) / 2,
+                        gt_bbox[2],
+                        gt_bbox[3]]
+            overlap = vot_overlap(bbox_, gt_bbox_, (frame.shape[1], frame.shape[0]))
+            # print('idx: {}\n pred: {}\n gt: {}\n overlap: {}\n'.format(idx, bbox_, gt_bbox_, overlap))
+            if overlap > 0:
                 pred_bboxes.append(bbox_)
             else:
-                track_result = tracker.track(frame)
-                bbox = track_result['bbox']  # cx,cy,w,h
-                score = track_result['score']
-                bbox_ = [bbox[0] - bbox[2] / 2, bbox[1] - bbox[3] / 2, bbox[2], bbox[3]]  # x,y,w,h
-                gt_bbox_ = [gt_bbox[0] - gt_bbox[2] / 2, gt_bbox[1] - gt_bbox[3] / 2, gt_bbox[2], gt_bbox[3]]
-                pred_bboxes.append(bbox_)
+                # print('lost idx: {}'.format(idx))
+                pred_bboxes.append(2)
+                frame_count = idx + 5
+                lost_number += 1
+        else:
+            pred_bboxes.append(0)
+
+        toc += cv2.getTickCount() - tic
+        if args.vis and idx > frame_count:
+            show_double_bbox(frame, bbox, score, gt_bbox, idx, lost_number)
+        last = cv2.getTickCount()
+    toc /= cv2.getTickFrequency()
+    decode_time /= cv2.getTickFrequency()
+    result_path = get_result_path(video)
+    if not os.path.isdir(os.path.dirname(result_path)):
+        os.makedirs(os.path.dirname(result_path), exist_ok=True)
+    with open(result_path, 'w') as f:
+        for x in pred_bboxes:
+            if isinstance(x, int):
+                f.write('{:d}\n'.format(x))
+            else:
+                f.write(','.join(['{:.4f}'.format(i) for i in x]) + '\n')
+    return {'name': video.name, 'time': toc, 'decode_time': decode_time, 'frames': idx, 'lost_number': lost_number}
+
+
+def ope_video_steps(video):
+    """ one pass evaluation of the video, same steps as vot_video_steps """
+    pred_bboxes = []
+    runtime = []
+    toc = 0
+    decode_time = 0  # time the loop waited for the next frame
+    frames = video.prefetch(args.prefetch) if args.prefetch > 0 else video
+    last = cv2.getTickCount()
+    for idx, (frame, gt_bbox) in enumerate(frames):
+        tic = cv2.getTickCount()
+        decode_time += tic - last
+        if idx == 0:
+            yield 'init', frame, gt_bbox  # cx,cy,w,h
+            track_result = yield 'track', frame
+            bbox = track_result['bbox']  # cx,cy,w,h
+            score = track_result['score']
+            bbox_ = [bbox[0] - bbox[2] / 2, bbox[1] - bbox[3] / 2, bbox[2], bbox[3]]  # x,y,w,h
+            gt_bbox_ = [gt_bbox[0] - gt_bbox[2] / 2, gt_bbox[1] - gt_bbox[3] / 2, gt_bbox[2], gt_bbox[3]]
+            pred_bboxes.append(bbox_)
+        else:
+            track_result = yield 'track', frame
+            bbox = track_result['bbox']  # cx,cy,w,h
+            score = track_result['score']
+            bbox_ = [bbox[0] - bbox[2] / 2, bbox[1] - bbox[3] / 2, bbox[2], bbox[3]]  # x,y,w,h
+            gt_bbox_ = [gt_bbox[0] - gt_bbox[2] / 2, gt_bbox[1] - gt_bbox[3] / 2, gt_bbox[2], gt_bbox[3]]
+            pred_bboxes.append(bbox_)
+
+        toc += cv2.getTickCount() - tic
+        runtime.append((cv2.getTickCount() - tic) / cv2.getTickFrequency())
+        if args.vis and idx > 0:
+            show_double_bbox(frame, bbox, score, gt_bbox, idx, 0)
+        last = cv2.getTickCount()
+    toc /= cv2.getTickFrequency()
+    decode_time /= cv2.getTickFrequency()
+    result_path = get_result_path(video)
+    result_dir = os.path.dirname(result_path)
+    if not os.path.isdir(result_dir):
+        os.makedirs(result_dir, exist_ok=True)
+    runtime_path = '{}/{}_time.txt'.format(result_dir, video.name)
+    # write result
+    with open(result_path, 'w') as f:
+        for x in pred_bboxes:
+            if isinstance(x, int):
+                f.write('{:d}\n'.format(x))
+            else:
+                f.write(','.join(['{:.4f}'.format(i) for i in x]) + '\n')
+    # write runtime
+    with open(runtime_path, 'w') as f:
+        for time in runtime:
+            f.write('{:.6f}\n'.format(time))
+    return {'name': video.name, 'time': toc, 'decode_time': decode_time, 'frames': idx}
+
+
+def video_steps(video):
+    if args.dataset in ['VOT2016', 'VOT2018']:
+        return vot_video_steps(video)
+    elif args.dataset == 'GOT-10k':
+        return ope_video_steps(video)
+
+
+def run_video(steps, tracker):
+    """ run the steps of a video with a single target tracker, :return: the stats of the video """
+    try:
+        step = next(steps)
+        while True:
+            if step[0] == 'init':
+                tracker.init(step[1], step[2])
+                step = next(steps)
+            else:
+                step = steps.send(tracker.track(step[1]))
+    except StopIteration as stop:
+        return stop.value
+
+
+def evaluate_video(video, tracker):
+    """ :return: stats of the video for log_video, None when another run already has it and --resume is given """
+    if args.resume and _check_and_occupation(get_result_path(video)):
+        return None
+    cascade = isinstance(tracker, CascadeSiamRPN)
+    if cascade:
+        frames, escalations = tracker.frames, tracker.escalations
+    result = run_video(video_steps(video), tracker)
+    if cascade:
+        result['tracked'] = tracker.frames - frames
+        result['escalations'] = tracker.escalations - escalations
+    return result
+
 
-            toc += cv2.getTickCount() - tic
-            runtime.append((cv2.getTickCount() - tic) / cv2.getTickFrequency())
-            if args.vis and idx > 0:
-                show_double_bbox(frame, bbox, score, gt_bbox, idx, 0)
-        toc /= cv2.getTickFrequency()
-        result_dir = os.path.join(cfg.TRACK.RESULT_DIR, args.dataset, tracker_name, backbone_name, snapshot_name,
-                                  video.name)
-        if not os.path.isdir(result_dir):
-            os.makedirs(result_dir)
-        result_path = '{}/{}_001.txt'.format(result_dir, video.name)
-        runtime_path = '{}/{}_time.txt'.format(result_dir, video.name)
-        # write result
-        with open(result_path, 'w') as f:
-            for x in pred_bboxes:
-                if isinstance(x, int):
-                    f.write('{:d}\n'.format(x))
-                else:
-                    f.write(','.join(['{:.4f}'.format(i) for i in x]) + '\n')
-        # write runtime
-        with open(runtime_path, 'w') as f:
-            for time in runtime:
-                f.write('{:.6f}\n'.format(time))
-
-        # log
-        print('[{:d}/{:d}] video: {}, time: {:.1f}s, speed: {:.1f}fps'.format(v_idx + 1,
-                                                                              len(dataset),
-                                                                              video.name,
-                                                                              toc, idx / toc))
+def log_video(v_idx, num_videos, result):
+    if result is None:
+        print('[{:d}/{:d}] skip, the result already exists'.format(v_idx + 1, num_videos))
+        return
+    escalation = ''
+    if 'escalations' in result:
+        escalation = ' | escalated: {:.1%}'.format(result['escalations'] / max(result['tracked'], 1))
+    if 'lost_number' in result:
+        print('[{:d}/{:d}] | video: {:12s} | time: {:4.1f}s | decode: {:4.1f}s | speed: {:3.1f}fps | '
+              'lost_number: {:d} {}'.format(v_idx + 1, num_videos, result['name'], result['time'],
+                                            result['decode_time'], result['frames'] / result['time'],
+                                            result['lost_number'], escalation))
+    else:
+        print('[{:d}/{:d}] video: {}, time: {:.1f}s, decode: {:.1f}s, speed: {:.1f}fps{}'.format(
+            v_idx + 1, num_videos, result['name'], result['time'], result['decode_time'],
+            result['frames'] / result['time'], escalation))
+
+
+def log_total(results):
+    results = [result for result in results if result is not None]
+    if args.dataset in ['VOT2016', 'VOT2018']:
+        print('total_lost: {}'.format(sum([result['lost_number'] for result in results])))
+    if results and 'escalations' in results[0]:
+        print('escalation rate: {:.1%} of {} frames'.format(
+            sum([result['escalations'] for result in results]) / max(sum([result['tracked'] for result in results]), 1),
+            sum([result['tracked'] for result in results])))
+
+
+def get_videos(dataset):
+    videos = []
+    for video in dataset:
+        if args.video != '' and video.name != args.video:  # if test special video
+            continue
+        if args.resume and os.path.isfile(get_result_path(video)):
+            continue
+        videos.append(video)
+    return videos
+
+
+def evaluate(dataset, tracker):
+    videos = get_videos(dataset)
+    results = []
+    for v_idx, video in enumerate(videos):
+        results.append(evaluate_video(video, tracker))
+        log_video(v_idx, len(videos), results[-1])
+    log_total(results)
+
+
+def lockstep_evaluate(dataset, tracker):
+    """
+    advance args.lockstep videos together, every video is a target of the MultiTargetSiamRPN tracker. A step
+    tracks the next frame of all of them in one batch, the inits and the skipped frames of the VOT restarts
+    run in between, and a video that ends makes room for the next one. The result files are the ones of the
+    serial run, the time of a video includes the forward of the whole batch.
+    """
+    videos = get_videos(dataset)[::-1]
+    num_videos = len(videos)
+    running = {}  # target id -> steps of the video, frame to track
+    results = []
+
+    def advance(steps, target_id, track_result):
+        """ run the steps of a video up to its next track """
+        try:
+            step = steps.send(track_result)
+            while step[0] == 'init':
+                if target_id is not None:
+                    tracker.remove_target(target_id)
+                target_id = tracker.add_target(step[1], step[2])
+                step = next(steps)
+            running[target_id] = (steps, step[1])
+        except StopIteration as stop:
+            tracker.remove_target(target_id)
+            results.append(stop.value)
+            log_video(len(results) - 1, num_videos, stop.value)
+
+    while videos or running:
+        while videos and len(running) < args.lockstep:
+            video = videos.pop()
+            if args.resume and _check_and_occupation(get_result_path(video)):
+                results.append(None)
+                log_video(len(results) - 1, num_videos, None)
+                continue
+            advance(video_steps(video), None, None)
+        if not running:
+            continue
+        track_results = tracker.track(dict((target_id, frame) for target_id, (_, frame) in running.items()))
+        for target_id, (steps, _) in list(running.items()):
+            del running[target_id]
+            advance(steps, target_id, track_results[target_id])
+    log_total(results)
+
+
+_worker_tracker = None
+
+
+def _init_worker(worker_ids):
+    """ every worker builds its own model and only uses its own cores, so the speed of a video is
+    measured as if it ran alone """
+    global _worker_tracker
+    worker_id = worker_ids.get()
+    seed_torch(123456)
+    setup_cfg()
+    torch.set_num_threads(args.worker_threads)
+    cv2.setNumThreads(args.worker_threads)
+    if hasattr(os, 'sched_setaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+        first = worker_id * args.worker_threads
+        if first + args.worker_threads <= len(cores):
+            os.sched_setaffinity(0, cores[first:first + args.worker_threads])
+    _worker_tracker = build_tracker()
+    # prepare_model may have applied cfg.CPU.NUM_THREADS
+    torch.set_num_threads(args.worker_threads)
+
+
+def _evaluate_video(video):
+    return evaluate_video(video, _worker_tracker)
+
+
+def parallel_evaluate(dataset):
+    """ spread the videos over args.num_workers processes """
+    videos = get_videos(dataset)
+    # cuda can not be used in forked processes
+    ctx = mp.get_context('spawn')
+    worker_ids = ctx.Queue()
+    for i in range(args.num_workers):
+        worker_ids.put(i)
+    results = []
+    with ctx.Pool(args.num_workers, initializer=_init_worker, initargs=(worker_ids,)) as pool:
+        # longest videos first, so no worker is left with a long one at the end
+        videos = sorted(videos, key=lambda v: len(v.img_names), reverse=True)
+        for v_idx, result in enumerate(pool.imap_unordered(_evaluate_video, videos)):
+            results.append(result)
+            log_video(v_idx, len(videos), result)
+    log_total(results)
 
 
 def seed_torch(seed=0):
@@ -159,13 +367,16 @@ def seed_torch(seed=0):
     torch.backends.cudnn.deterministic = True
 
 
-def main():
-    seed_torch(123456)
+def setup_cfg():
     cfg.merge_from_file(args.cfg)
+    if args.device:
+        cfg.DEVICE = args.device
     init_log('global', logging.INFO)
 
+
+def build_tracker():
     base_model = get_model(cfg.MODEL_ARC)
-    base_model = load_pretrain(base_model, args.snapshot).cuda().eval()
+    base_model = prepare_model(load_pretrain(base_model, args.snapshot))
     # # if want test model pruned
     # base_model = prune_model(base_model).cuda().eval()  # refine the model
 
@@ -175,13 +386,42 @@ def main():
     # base_model = prune_model(base_model) # refine the model
     # base_model=load_pretrain(base_model,args.snapshot).cuda().eval() # load the finetune weight
 
-    tracker = get_tracker(args.tracker, base_model)
+    if args.lockstep > 1:
+        # the videos are the targets, see lockstep_evaluate
+        return get_tracker('MultiTargetSiamRPN', base_model, args.lockstep)
+    if args.tracker == 'CascadeSiamRPN':
+        heavy_model, heavy_cfg = build_heavy_model()
+        return get_tracker(args.tracker, base_model, heavy_model, heavy_cfg)
+    return get_tracker(args.tracker, base_model)
+
+
+def build_heavy_model():
+    """ the heavy model of CascadeSiamRPN, built with the defaults and --heavy_cfg """
+    heavy_cfg = default_cfg.clone()
+    heavy_cfg.merge_from_file(args.heavy_cfg)
+    heavy_cfg.DEVICE = cfg.DEVICE
+    with cfg_scope(heavy_cfg):
+        heavy_model = prepare_model(load_pretrain(get_model(cfg.MODEL_ARC), args.heavy_snapshot))
+    return heavy_model, heavy_cfg
+
+
+def main():
+    seed_torch(123456)
+    setup_cfg()
     data_dir = os.path.join(cfg.TRACK.DATA_DIR, args.dataset)
     dataset = get_dataset(args.dataset, data_dir)
-    if args.dataset in ['VOT2016', 'VOT2018']:
-        vot_evaluate(dataset, tracker)
-    elif args.dataset == 'GOT-10k':
-        ope_evaluate(dataset, tracker)
+    if args.lockstep > 1:
+        if args.tracker != 'SiamRPN':
+            raise Exception('--lockstep only works with SiamRPN')
+        if cfg.TRACK.ADAPTIVE.SIZES or cfg.TRACK.STATIC.THRESHOLD > 0:
+            raise Exception('--lockstep does not support cfg.TRACK.ADAPTIVE.SIZES and cfg.TRACK.STATIC.THRESHOLD')
+        lockstep_evaluate(dataset, build_tracker())
+    elif args.num_workers > 1:
+        parallel_evaluate(dataset)
+    else:
+        tracker = build_tracker()
+        evaluate(dataset, tracker)
+        print(get_examplar_cache().summary())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,68 @@
+import argparse
+import tracemalloc
+
+import numpy as np
+import torch
+
+from configs.config import cfg
+from models import get_model
+from trackers import get_tracker
+from utils.device import prepare_model
+
+parser = argparse.ArgumentParser(description='SiamRPN.track allocates no image sized memory after the warm up')
+parser.add_argument('--cfg', default='configs/alexnet_config.yaml', type=str, help='which config file to use')
+parser.add_argument('--warmup', default=3, type=int, help='frames before checking')
+parser.add_argument('--frames', default=10, type=int, help='frames checked')
+args = parser.parse_args()
+
+# a 255x255 crop is 190K, its float input 760K, the per frame maps of the postprocess are a few K
+LARGE = 64 * 1024
+
+
+def check(tracker, img, bbox):
+    """ track img with the box kept at bbox, :return: the largest host allocation of a frame after the warm up """
+    tracker.init(img, bbox)
+    inputs = set()
+    model_track = tracker.model.track
+
+    def track(search, *others):
+        inputs.add(search.data_ptr())
+        return model_track(search, *others)
+
+    tracker.model.track = track
+    segments = None
+    largest = 0
+    for i in range(args.warmup + args.frames):
+        # random weights make the box drift, keep the search region fixed
+        tracker.bbox_pos, tracker.bbox_size = bbox[0:2], bbox[2:4]
+        if i == args.warmup:
+            inputs.clear()
+            if tracker.device.type == 'cuda':
+                segments = torch.cuda.memory_stats()['segment.all.allocated']
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        tracker.track(img)
+        if i >= args.warmup:
+            largest = max(largest, tracemalloc.get_traced_memory()[1] - before)
+    del tracker.model.track
+    # the model input is the same tensor every frame
+    assert len(inputs) == 1, 'a new model input every frame'
+    if segments is not None:
+        assert torch.cuda.memory_stats()['segment.all.allocated'] == segments, 'new cuda memory after the warm up'
+    return largest
+
+
+if __name__ == '__main__':
+    cfg.merge_from_file(args.cfg)
+    cfg.DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+    tracker = get_tracker('SiamRPN', prepare_model(get_model(cfg.MODEL_ARC)))
+    img = np.random.randint(0, 256, (360, 480, 3), dtype=np.uint8)
+    tracemalloc.start()
+    for name, bbox in [('inside', [240, 180, 60, 40]),
+                       ('padded, upsampling', [10, 10, 20, 16]),
+                       ('padded, downsampling', [460, 340, 200, 150])]:
+        largest = check(tracker, img, bbox)
+        print('{:22s} largest host allocation of a frame: {:.1f}K'.format(name, largest / 1024))
+        assert largest < LARGE, 'image sized host allocation in {} track'.format(name)
+    tracemalloc.stop()
+    print('ok')
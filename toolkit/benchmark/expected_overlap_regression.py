@@ -0,0 +1,99 @@
+"""
+    run from the repo root: python -m toolkit.benchmark.expected_overlap_regression
+"""
+import time
+import argparse
+import numpy as np
+from ..utils.statistics import calculate_expected_overlap
+
+parser = argparse.ArgumentParser(description='vectorized calculate_expected_overlap vs the per length loop')
+parser.add_argument('--videos', default=60, type=int, help='number of synthetic videos')
+parser.add_argument('--max_frames', default=1500, type=int, help='max length of a video')
+parser.add_argument('--seed', default=0, type=int)
+args = parser.parse_args()
+
+# the eao window of EAOBenchmark
+LOW, HIGH = 108, 371
+
+
+def loop_expected_overlap(fragments, fweights):
+    """ calculate_expected_overlap before the cumulative sum, kept as the reference """
+    max_len = fragments.shape[1]
+    expected_overlaps = np.zeros((max_len), np.float32)
+    expected_overlaps[0] = 1
+    for i in range(1, max_len):
+        mask = np.logical_not(np.isnan(fragments[:, i]))
+        if np.any(mask):
+            fragment = fragments[mask, 1:i + 1]
+            seq_mean = np.sum(fragment, 1) / fragment.shape[1]
+            expected_overlaps[i] = np.sum(seq_mean *
+                                          fweights[mask]) / np.sum(fweights[mask])
+    return expected_overlaps
+
+
+def synthetic_fragments(num_videos, max_frames, skipping=5):
+    """ fragments and weights built the way EAOBenchmark._calculate_eao builds them """
+    all_overlaps, all_failures = [], []
+    for _ in range(num_videos):
+        length = np.random.randint(100, max_frames)
+        overlaps = np.random.uniform(0.2, 0.9, length)
+        failures = np.sort(np.random.choice(length, np.random.randint(0, 40), replace=False)).tolist()
+        if len(failures) > 0:
+            # unknown overlaps, set to 0 in the fragments
+            overlaps[np.random.rand(length) < 0.01] = np.nan
+        all_overlaps.append(overlaps)
+        all_failures.append(failures)
+    fragment_num = sum([len(x) + 1 for x in all_failures])
+    max_len = max([len(x) for x in all_overlaps])
+    fweights = np.ones((fragment_num)) * np.nan
+    fragments = np.ones((fragment_num, max_len)) * np.nan
+    seg_counter = 0
+    for failures, overlaps in zip(all_failures, all_overlaps):
+        if len(failures) > 0:
+            points = [x + skipping for x in failures if x + skipping <= len(overlaps)]
+            points.insert(0, 0)
+            for i in range(len(points)):
+                if i != len(points) - 1:
+                    fragment = np.array(overlaps[points[i]:points[i + 1] + 1])
+                    fragments[seg_counter, :] = 0
+                else:
+                    fragment = np.array(overlaps[points[i]:])
+                fragment[np.isnan(fragment)] = 0
+                fragments[seg_counter, :len(fragment)] = fragment
+                fweights[seg_counter] = np.random.uniform(0.5, 1)
+                seg_counter += 1
+        else:
+            fragments[seg_counter, :len(overlaps)] = overlaps
+            fweights[seg_counter] = np.random.uniform(0.5, 1)
+            seg_counter += 1
+    return fragments, fweights
+
+
+def eao(expected_overlaps):
+    weight = np.zeros((len(expected_overlaps)))
+    weight[LOW - 1:HIGH - 1 + 1] = 1
+    is_valid = np.logical_not(np.isnan(expected_overlaps))
+    return np.sum(expected_overlaps[is_valid] * weight[is_valid]) / np.sum(weight[is_valid])
+
+
+if __name__ == '__main__':
+    np.random.seed(args.seed)
+    fragments, fweights = synthetic_fragments(args.videos, args.max_frames)
+    print('fragments: {}, max length: {}'.format(*fragments.shape))
+
+    tic = time.perf_counter()
+    old = loop_expected_overlap(fragments, fweights)
+    t_old = time.perf_counter() - tic
+    tic = time.perf_counter()
+    new = calculate_expected_overlap(fragments, fweights)
+    t_new = time.perf_counter() - tic
+
+    both_nan = np.isnan(old) & np.isnan(new)
+    diff = np.abs(old - new)[~both_nan]
+    print('loop: {:.3f}s | cumsum: {:.3f}s | speedup: {:.1f}x'.format(t_old, t_new, t_old / t_new))
+    print('max expected overlap diff: {:.3g} | same nan: {}'.format(
+        diff.max() if len(diff) else 0., bool(np.all(np.isnan(old) == np.isnan(new)))))
+    print('eao loop: {:.6f} | eao cumsum: {:.6f}'.format(eao(old), eao(new)))
+    assert np.all(np.isnan(old) == np.isnan(new))
+    assert np.allclose(old[~both_nan], new[~both_nan], rtol=0, atol=1e-6)
+    assert abs(eao(old) - eao(new)) < 1e-6
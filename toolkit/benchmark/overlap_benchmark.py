@@ -0,0 +1,69 @@
+"""
+    run from the repo root: python -m toolkit.benchmark.overlap_benchmark
+"""
+import time
+import argparse
+import numpy as np
+from ..utils import region
+from ..utils.statistics import calculate_accuracy
+
+parser = argparse.ArgumentParser(description='calculate_accuracy vs the per frame vot_overlap_traj')
+parser.add_argument('--frames', default=20000, type=int, help='length of the synthetic trajectory')
+parser.add_argument('--seed', default=0, type=int)
+parser.add_argument('--repeat', default=3, type=int, help='runs per case, the best time counts')
+args = parser.parse_args()
+
+# a VOT sized frame, the bound of AccuracyRobustnessBenchmark
+WIDTH, HEIGHT = 640, 480
+
+
+def synthetic_trajectory(num_frames):
+    """ rectangle predictions with special frames, rectangle and rotated polygon ground truth """
+    xy = np.random.uniform(-50, WIDTH, (num_frames, 2))
+    wh = np.random.uniform(0, 200, (num_frames, 2))
+    gt = np.concatenate([xy, wh], 1)
+    pred = gt + np.random.normal(0, 10, gt.shape)
+    pred = [list(x) for x in pred]
+    for i in np.random.choice(num_frames, num_frames // 50, replace=False):
+        pred[i] = [np.random.choice([0, 1, 2])]
+    x, y, w, h = gt.T
+    polygons = np.stack([x, y, x + w, y, x + w, y + h, x, y + h], 1)
+    rotated = polygons + np.random.uniform(-5, 5, polygons.shape)
+    return pred, [list(x) for x in gt], [list(x) for x in polygons], [list(x) for x in rotated]
+
+
+def per_frame_accuracy(pred, gt, bound):
+    """ calculate_accuracy before the batched overlaps """
+    overlaps = region.vot_overlap_traj(pred, gt, bound)
+    return np.nanmean(overlaps), overlaps
+
+
+def timed(fn, *inputs, **kwargs):
+    """ the overlaps of fn and its best time of --repeat runs """
+    times = []
+    for _ in range(args.repeat):
+        tic = time.perf_counter()
+        overlaps = fn(*inputs, **kwargs)[1]
+        times.append(time.perf_counter() - tic)
+    return np.array(overlaps), min(times)
+
+
+def compare(name, pred, gt, bound):
+    old, t_old = timed(per_frame_accuracy, pred, gt, bound)
+    new, t_new = timed(calculate_accuracy, pred, gt, bound=bound)
+    same = (old == new) | (np.isnan(old) & np.isnan(new))
+    print('{:10s} per frame: {:.3f}s | calculate_accuracy: {:.3f}s | speedup: {:5.1f}x | '
+          'mismatches: {:d}'.format(name, t_old, t_new, t_old / t_new, int(np.sum(~same))))
+    assert np.all(same)
+
+
+if __name__ == '__main__':
+    np.random.seed(args.seed)
+    pred, rects, polygons, rotated = synthetic_trajectory(args.frames)
+    print('frames: {}, bound: {}x{}'.format(args.frames, WIDTH, HEIGHT))
+    # vot_overlap takes the same rectangle path when both are x,y,w,h, the aligned
+    # polygons show what every rectangle pair cost before, a raster of the union
+    compare('rectangle', pred, rects, (WIDTH, HEIGHT))
+    compare('aligned', pred, polygons, (WIDTH, HEIGHT))
+    compare('rotated', pred, rotated, (WIDTH, HEIGHT))
+    compare('unbounded', pred, rects, None)
@@ -1,9 +1,19 @@
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 from ..utils.bbox import get_axis_aligned_bbox
 
 
+def read_img(img_path):
+    img = cv2.imread(img_path)
+    # convert bgr to rgb in order to match pretrain model
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
 class Video(object):
     def __init__(self, name, data_dir, init_rect, img_names, gt_rects):
         self.name = name
@@ -21,18 +31,20 @@ class Video(object):
                 yield img, gt_bbox
         else:
             for (img_name, gt_rect) in zip(self.img_names, self.gt_rects):
-                img_path = os.path.join(self.data_dir, img_name)
-                img = cv2.imread(img_path)
-                # convert bgr to rgb in order to match pretrain model
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                img = read_img(os.path.join(self.data_dir, img_name))
                 gt_bbox = get_axis_aligned_bbox(np.array(gt_rect))
                 yield img, gt_bbox
 
+    def prefetch(self, num_frames=8, num_threads=2):
+        """ iterate like the video itself, the next num_frames frames are decoded in the background """
+        if self.imgs is not None:
+            return self
+        return FramePrefetcher(self, num_frames, num_threads)
+
     def read_imgs(self):
         # self.imgs=[cv2.imread(os.path.join(self.data_dir,img_name)) for img_name in self.img_names ]
         # convert bgr to rgb in order to match pretrain model
-        self.imgs = [cv2.cvtColor(cv2.imread(os.path.join(self.data_dir, img_name)), cv2.COLOR_BGR2RGB)
-                     for img_name in self.img_names]
+        self.imgs = [read_img(os.path.join(self.data_dir, img_name)) for img_name in self.img_names]
 
     def free_imgs(self):
         self.imgs = None
@@ -53,3 +65,46 @@ class Video(object):
                                for line in f.readlines()]  # fancy
             self.pred_bboxes[tracker_name] = pred_bboxes
         return pred_bboxes  # TODO: a little bad
+
+
+class FramePrefetcher(object):
+    """Frames of a video decoded on a thread pool while the tracker runs.
+
+    At most num_frames decoded frames wait in memory, read_imgs() keeps the whole video.
+    cv2.imread and cvtColor release the gil, so the decode really overlaps the tracking.
+    wait_time is how long the consumer was blocked on a frame that was not decoded yet.
+    """
+
+    def __init__(self, video, num_frames=8, num_threads=2):
+        self.video = video
+        self.num_frames = max(num_frames, 1)
+        self.num_threads = num_threads
+        self.wait_time = 0.
+
+    def __len__(self):
+        return len(self.video.img_names)
+
+    def __iter__(self):
+        img_paths = iter([os.path.join(self.video.data_dir, img_name) for img_name in self.video.img_names])
+        pending = deque()
+        with ThreadPoolExecutor(self.num_threads) as pool:
+            try:
+                for img_path in img_paths:
+                    pending.append(pool.submit(read_img, img_path))
+                    if len(pending) == self.num_frames:
+                        break
+                for gt_rect in self.video.gt_rects:
+                    if not pending:
+                        break
+                    tic = time.perf_counter()
+                    img = pending.popleft().result()
+                    self.wait_time += time.perf_counter() - tic
+                    img_path = next(img_paths, None)
+                    if img_path is not None:
+                        pending.append(pool.submit(read_img, img_path))
+                    gt_bbox = get_axis_aligned_bbox(np.array(gt_rect))
+                    yield img, gt_bbox
+            finally:
+                # stopped early, do not decode the rest of the queue
+                for future in pending:
+                    future.cancel()
@@ -7,9 +7,13 @@
 from libc.stdlib cimport malloc, free
 from libc.stdio cimport sprintf
 from libc.string cimport strlen
+from libc.math cimport floor, ceil, isnan
 
+cimport cython
 cimport c_region
 
+import numpy as np
+
 cpdef enum RegionType:
     EMTPY
     SPECIAL
@@ -154,6 +158,16 @@ def vot_overlap(polygon1, polygon2, bounds=None):
     if len(polygon1) == 1 or len(polygon2) == 1:
         return float("nan")
 
+    cdef float rect1_x[4]
+    cdef float rect1_y[4]
+    cdef float rect2_x[4]
+    cdef float rect2_y[4]
+    if len(polygon1) == 4 and len(polygon2) == 4:
+        # two rectangles, no polygon and no raster needed
+        _rectangle_corners(polygon1, rect1_x, rect1_y)
+        _rectangle_corners(polygon2, rect2_x, rect2_y)
+        return _rectangle_overlap(rect1_x, rect1_y, rect2_x, rect2_y, _region_bounds(bounds))
+
     if len(polygon1) == 4:
         polygon1_ = Polygon([polygon1[0], polygon1[1],
                              polygon1[0]+polygon1[2], polygon1[1],
@@ -205,6 +219,173 @@ def vot_overlap_traj(polygons1, polygons2, bounds=None):
     return overlaps
 
 
+cdef c_region.region_bounds _region_bounds(bounds):
+    """ same bounds as vot_overlap """
+    cdef c_region.region_bounds c_bounds
+    if bounds is not None and len(bounds) == 4:
+        c_bounds.top, c_bounds.bottom, c_bounds.left, c_bounds.right = bounds[0], bounds[1], bounds[2], bounds[3]
+    elif bounds is not None and len(bounds) == 2:
+        c_bounds.top, c_bounds.bottom, c_bounds.left, c_bounds.right = 0, bounds[1], 0, bounds[0]
+    else:
+        c_bounds.top, c_bounds.bottom = -float("inf"), float("inf")
+        c_bounds.left, c_bounds.right = -float("inf"), float("inf")
+    return c_bounds
+
+cdef void _rectangle_corners(rect, float* x, float* y):
+    """ x,y,w,h -> the 4 corners vot_overlap builds, summed in double like there """
+    x[0], y[0] = rect[0], rect[1]
+    x[1], y[1] = rect[0] + rect[2], rect[1]
+    x[2], y[2] = rect[0] + rect[2], rect[1] + rect[3]
+    x[3], y[3] = rect[0], rect[1] + rect[3]
+
+cdef inline int _round(float fp):
+    # round() of src/region.c
+    return <int>(fp + 0.5 if fp >= 0 else fp - 0.5)
+
+cdef inline bint _is_rectangle(const float* x, const float* y, int count):
+    """ axis aligned rectangle with the corners in one of the two orders of a closed path """
+    if count != 4:
+        return False
+    return (x[0] == x[3] and x[1] == x[2] and y[0] == y[1] and y[2] == y[3]) or \
+           (x[0] == x[1] and x[2] == x[3] and y[1] == y[2] and y[3] == y[0])
+
+cdef inline void _raster_box(const float* x, const float* y, float offset_x, float offset_y,
+                             int width, int height, int* box):
+    """ pixels rasterize_polygon sets for an axis aligned rectangle, as the inclusive box
+    box[0]..box[1] columns, box[2]..box[3] rows, empty when box[0] > box[1] or box[2] > box[3]
+    """
+    cdef int i, px
+    cdef int x_min = _round(x[0] + offset_x), x_max = x_min
+    cdef int y_min = _round(y[0] + offset_y), y_max = y_min
+    for i in range(1, 4):
+        px = _round(x[i] + offset_x)
+        x_min, x_max = min(x_min, px), max(x_max, px)
+        px = _round(y[i] + offset_y)
+        y_min, y_max = min(y_min, px), max(y_max, px)
+    # a row gets one node from each vertical edge, a zero width (equal nodes) or
+    # zero height (no vertical edge) rectangle sets nothing
+    if x_min == x_max or y_min == y_max or x_min >= width or x_max < 0:
+        box[0], box[1], box[2], box[3] = 0, -1, 0, -1
+        return
+    box[0], box[1] = max(x_min, 0), min(x_max, width - 1)
+    box[2], box[3] = max(y_min, 0), min(y_max, height - 1)
+
+@cython.cdivision(True)
+cdef float _rectangle_overlap(const float* x1, const float* y1, const float* x2, const float* y2,
+                              c_region.region_bounds bounds):
+    """ compute_polygon_overlap of two axis aligned rectangles, with the same bounds, the same
+    early exits and the same pixel counts, but the pixels are counted instead of rasterized
+    (the default, not the legacy, rasterization)
+    """
+    cdef int i
+    cdef float l1 = x1[0], r1 = x1[0], t1 = y1[0], b1 = y1[0]
+    cdef float l2 = x2[0], r2 = x2[0], t2 = y2[0], b2 = y2[0]
+    for i in range(1, 4):
+        l1, r1, t1, b1 = min(l1, x1[i]), max(r1, x1[i]), min(t1, y1[i]), max(b1, y1[i])
+        l2, r2, t2, b2 = min(l2, x2[i]), max(r2, x2[i]), min(t2, y2[i]), max(b2, y2[i])
+    # bounds_intersection(bounds_round(compute_bounds(p)), bounds)
+    l1, r1, t1, b1 = max(<float>floor(l1), bounds.left), min(<float>ceil(r1), bounds.right), \
+                     max(<float>floor(t1), bounds.top), min(<float>ceil(b1), bounds.bottom)
+    l2, r2, t2, b2 = max(<float>floor(l2), bounds.left), min(<float>ceil(r2), bounds.right), \
+                     max(<float>floor(t2), bounds.top), min(<float>ceil(b2), bounds.bottom)
+
+    cdef float x = min(l1, l2)
+    cdef float y = min(t1, t2)
+    cdef int width = <int>(max(r1, r2) - x) + 1
+    cdef int height = <int>(max(b1, b2) - y) + 1
+    cdef float area1 = (r1 - l1) * (b1 - t1)
+    cdef float area2 = (r2 - l2) * (b2 - t2)
+    cdef double a1 = area1, a2 = area2
+    if a1 / a2 < 1e-10 or a2 / a1 < 1e-10 or width < 1 or height < 1:
+        return 0
+
+    # bounds_overlap
+    cdef float intersection = (min(r1, r2) - max(l1, l2)) * (min(b1, b2) - max(t1, t2))
+    cdef float ratio = intersection / (area1 + area2 - intersection)
+    if ratio <= 0:
+        return 0
+
+    cdef int box1[4]
+    cdef int box2[4]
+    _raster_box(x1, y1, -x, -y, width, height, box1)
+    _raster_box(x2, y2, -x, -y, width, height, box2)
+    cdef int vol1 = max(box1[1] - box1[0] + 1, 0) * max(box1[3] - box1[2] + 1, 0)
+    cdef int vol2 = max(box2[1] - box2[0] + 1, 0) * max(box2[3] - box2[2] + 1, 0)
+    cdef int mask_intersect = max(min(box1[1], box2[1]) - max(box1[0], box2[0]) + 1, 0) * \
+                              max(min(box1[3], box2[3]) - max(box1[2], box2[2]) + 1, 0)
+    return <float>mask_intersect / <float>(vol1 + vol2 - mask_intersect)
+
+def _as_polygons(regions):
+    """ N x 4 rectangles (x,y,w,h) or N x 2k polygons -> contiguous N x 2k polygons in double """
+    regions = np.asarray(regions, dtype=np.float64)
+    if regions.ndim != 2 or regions.shape[1] < 4 or regions.shape[1] % 2:
+        raise ValueError('regions must be N x 4 rectangles or N x 2k polygons, got {}'.format(regions.shape))
+    if regions.shape[1] == 4:
+        x, y, w, h = regions.T
+        regions = np.stack([x, y, x + w, y, x + w, y + h, x, y + h], axis=1)
+    return np.ascontiguousarray(regions)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def vot_overlap_array(pred, gt, bounds=None):
+    """ vot_overlap of every pair of a trajectory in one C loop
+    Args:
+        pred: N x 4 (x,y,w,h) or N x 8 (polygon) array, a row with a nan is a special
+            frame (init, failure, skip) and gets a nan overlap like a [1] in vot_overlap
+        gt: same as pred
+        bounds: tuple of (left, top, right, bottom) or tuple of (width height)
+    Return:
+        overlaps: N array, same values as vot_overlap
+    """
+    cdef double[:, ::1] polygons1 = _as_polygons(pred)
+    cdef double[:, ::1] polygons2 = _as_polygons(gt)
+    assert polygons1.shape[0] == polygons2.shape[0]
+    cdef Py_ssize_t num = polygons1.shape[0]
+    cdef int count1 = polygons1.shape[1] // 2
+    cdef int count2 = polygons2.shape[1] // 2
+    overlaps_ = np.empty(num, dtype=np.float64)
+    cdef double[::1] overlaps = overlaps_
+    cdef c_region.region_bounds c_bounds = _region_bounds(bounds)
+    cdef c_region.region_polygon c_polygon1, c_polygon2
+    cdef float only1 = 0
+    cdef float only2 = 0
+    cdef Py_ssize_t i
+    cdef int j
+    cdef bint special
+
+    c_polygon1.count, c_polygon2.count = count1, count2
+    c_polygon1.x = <float*>malloc(sizeof(float) * count1)
+    c_polygon1.y = <float*>malloc(sizeof(float) * count1)
+    c_polygon2.x = <float*>malloc(sizeof(float) * count2)
+    c_polygon2.y = <float*>malloc(sizeof(float) * count2)
+    try:
+        if not (c_polygon1.x and c_polygon1.y and c_polygon2.x and c_polygon2.y):
+            raise MemoryError()
+        for i in range(num):
+            special = False
+            for j in range(count1):
+                c_polygon1.x[j], c_polygon1.y[j] = polygons1[i, 2 * j], polygons1[i, 2 * j + 1]
+                special = special or isnan(polygons1[i, 2 * j]) or isnan(polygons1[i, 2 * j + 1])
+            for j in range(count2):
+                c_polygon2.x[j], c_polygon2.y[j] = polygons2[i, 2 * j], polygons2[i, 2 * j + 1]
+                special = special or isnan(polygons2[i, 2 * j]) or isnan(polygons2[i, 2 * j + 1])
+            if special:
+                overlaps[i] = float("nan")
+            elif _is_rectangle(c_polygon1.x, c_polygon1.y, count1) and \
+                    _is_rectangle(c_polygon2.x, c_polygon2.y, count2):
+                overlaps[i] = _rectangle_overlap(c_polygon1.x, c_polygon1.y,
+                                                 c_polygon2.x, c_polygon2.y, c_bounds)
+            else:
+                overlaps[i] = c_region.compute_polygon_overlap(&c_polygon1, &c_polygon2,
+                                                               &only1, &only2, c_bounds)
+    finally:
+        free(c_polygon1.x)
+        free(c_polygon1.y)
+        free(c_polygon2.x)
+        free(c_polygon2.y)
+    return overlaps_
+
+
 def vot_float2str(template, float value):
     """
     Args:
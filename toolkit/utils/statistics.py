@@ -17,6 +17,30 @@ def calculate_failures(trajectory):
     num_failures = len(failures)
     return num_failures, failures
 
+def _trajectory_array(trajectory):
+    """ list of bbox -> N x 4 or N x 8 array for region.vot_overlap_array
+    special frames ([0], [1], [2]) become nan rows, rectangles become polygons
+    when the trajectory also has polygons
+    """
+    lengths = np.array([len(x) for x in trajectory], dtype=np.int64)
+    width = max(lengths.max(), 4) if len(lengths) else 4
+    if np.all((lengths == width) | (lengths == 1)):
+        # one kind of region, a single conversion with nan rows for the special frames
+        nan = [np.nan] * width
+        return np.array([x if len(x) == width else nan for x in trajectory],
+                dtype=np.float64).reshape(-1, width)
+    traj = np.full((len(trajectory), width), np.nan)
+    for length in np.unique(lengths):
+        if length == 1:
+            continue
+        idx = np.where(lengths == length)[0]
+        boxes = np.array([trajectory[i] for i in idx], dtype=np.float64)
+        if length == 4 and width != 4:
+            x, y, w, h = boxes.T
+            boxes = np.stack([x, y, x+w, y, x+w, y+h, x, y+h], 1)
+        traj[idx] = boxes
+    return traj
+
 def calculate_accuracy(pred_trajectory, gt_trajectory,
         burnin=0, ignore_unknown=True, bound=None):
     """Caculate accuracy socre as average overlap over the entire sequence
@@ -43,8 +67,14 @@ def calculate_accuracy(pred_trajectory, gt_trajectory,
                     if i + j < len(mask):
                         pred_trajectory_[i+j] = [0]
     min_len = min(len(pred_trajectory_), len(gt_trajectory))
-    overlaps = region.vot_overlap_traj(pred_trajectory_[:min_len],
-            gt_trajectory[:min_len], bound)
+    pred_trajectory_, gt_trajectory_ = pred_trajectory_[:min_len], gt_trajectory[:min_len]
+    if set(map(len, pred_trajectory_)) | set(map(len, gt_trajectory_)) <= {1, 4}:
+        # rectangle pairs skip the raster in vot_overlap, the array conversion
+        # would cost more than the overlaps
+        overlaps = region.vot_overlap_traj(pred_trajectory_, gt_trajectory_, bound)
+    else:
+        overlaps = region.vot_overlap_array(_trajectory_array(pred_trajectory_),
+                _trajectory_array(gt_trajectory_), bound).tolist()
 
     if not ignore_unknown:
         overlaps = [u if u else 0 for u in unkown]
@@ -154,16 +184,26 @@ def calculate_f1(overlaps, score, bound, thresholds, N):
     return f1, precision, recall
 
 def calculate_expected_overlap(fragments, fweights):
+    """ Expected overlap of every sequence length
+    Args:
+        fragments: N x max_len per frame overlaps, nan after the end of a fragment
+        fweights: N weights of the fragments
+    Return:
+        expected_overlaps: max_len, the i-th is the weighted mean over the fragments
+            longer than i of their average overlap in frames 1..i
+    """
     max_len = fragments.shape[1]
     expected_overlaps = np.zeros((max_len), np.float32)
     expected_overlaps[0] = 1
 
-    # TODO Speed Up 
-    for i in range(1, max_len):
-        mask = np.logical_not(np.isnan(fragments[:, i]))
-        if np.any(mask):
-            fragment = fragments[mask, 1:i+1]
-            seq_mean = np.sum(fragment, 1) / fragment.shape[1]
-            expected_overlaps[i] = np.sum(seq_mean *
-                fweights[mask]) / np.sum(fweights[mask])
+    # average overlap of frames 1..i of every fragment for all i at once, a nan
+    # inside a fragment stays in its running sum, as it did in np.sum
+    seq_mean = np.cumsum(fragments[:, 1:], axis=1) / np.arange(1, max_len)
+    mask = np.logical_not(np.isnan(fragments[:, 1:]))
+    fweights = np.asarray(fweights)[:, np.newaxis]
+    # np.where instead of a product, the nan of the fragments out of the mask must not leak in
+    weight_sum = np.sum(np.where(mask, fweights, 0), 0)
+    overlap_sum = np.sum(np.where(mask, seq_mean * fweights, 0), 0)
+    valid = np.any(mask, 0)
+    expected_overlaps[1:][valid] = overlap_sum[valid] / weight_sum[valid]
     return expected_overlaps
@@ -0,0 +1,124 @@
+import os
+import argparse
+from collections import Counter
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from configs.config import cfg
+from models import get_model
+from trackers import get_tracker
+from toolkit.datasets import get_dataset
+from toolkit.utils.region import vot_overlap
+from utils.model_load import load_pretrain
+from utils.device import prepare_model
+
+parser = argparse.ArgumentParser(description='backbone FLOPs and VOT accuracy of SiamRPN with cfg.TRACK.ADAPTIVE')
+parser.add_argument('--cfg', default='configs/mobilenetv2_config.yaml', type=str, help='config file')
+parser.add_argument('--snapshot', default='', type=str, help='model to track with, only the FLOPs without it')
+parser.add_argument('--dataset', default='VOT2018', type=str, help='VOT2016 or VOT2018 under cfg.TRACK.DATA_DIR')
+parser.add_argument('--sizes', nargs='+', default=[191, 223], type=int, help='cfg.TRACK.ADAPTIVE.SIZES')
+parser.add_argument('--video', default='', type=str, help='only this video')
+parser.add_argument('--device', default='', type=str, help='override cfg.DEVICE, cpu when cuda is not available')
+args = parser.parse_args()
+
+
+def count_flops(fn, modules):
+    """ multiply-adds of the conv and bn layers of modules run by fn, x2 for FLOPs """
+    flops = [0]
+
+    def conv_hook(m, inputs, output):
+        flops[0] += 2 * output.numel() * m.in_channels // m.groups * m.kernel_size[0] * m.kernel_size[1]
+
+    def bn_hook(m, inputs, output):
+        flops[0] += 2 * output.numel()
+
+    handles = []
+    for module in modules:
+        for m in module.modules():
+            if isinstance(m, nn.Conv2d):
+                handles.append(m.register_forward_hook(conv_hook))
+            elif isinstance(m, nn.BatchNorm2d):
+                handles.append(m.register_forward_hook(bn_hook))
+    with torch.no_grad():
+        fn()
+    for handle in handles:
+        handle.remove()
+    return flops[0]
+
+
+def backbone_flops(model, sizes):
+    """ FLOPs of the backbone (and the neck) on a search crop of every size """
+    modules = [model.backbone] + ([model.neck] if cfg.ADJUST.USE else [])
+    device = next(model.parameters()).device
+    return dict((size, count_flops(lambda: model.backbone(torch.zeros(1, 3, size, size, device=device)), modules))
+                for size in sizes)
+
+
+def vot_run(tracker, video):
+    """ VOT protocol of test.py, re-init 5 frames after a failure
+    :return: overlaps of the tracked frames, failures, instance sizes used
+    """
+    frame_count, failures, overlaps, sizes = 0, 0, [], []
+    for idx, (frame, gt_bbox) in enumerate(video):
+        if idx == frame_count:
+            tracker.init(frame, gt_bbox)
+        elif idx > frame_count:
+            bbox = tracker.track(frame)['bbox']
+            sizes.append(tracker.instance_size)
+            bbox_ = [bbox[0] - bbox[2] / 2, bbox[1] - bbox[3] / 2, bbox[2], bbox[3]]
+            gt_bbox_ = [gt_bbox[0] - (gt_bbox[2] - 1) / 2, gt_bbox[1] - (gt_bbox[3] - 1) / 2, gt_bbox[2], gt_bbox[3]]
+            overlap = vot_overlap(bbox_, gt_bbox_, (frame.shape[1], frame.shape[0]))
+            if overlap > 0:
+                overlaps.append(overlap)
+            else:
+                frame_count = idx + 5
+                failures += 1
+    return overlaps, failures, sizes
+
+
+def evaluate(model, dataset, sizes):
+    cfg.TRACK.ADAPTIVE.SIZES = sizes
+    tracker = get_tracker('SiamRPN', model)
+    overlaps, failures, used = [], 0, Counter()
+    for video in dataset:
+        if args.video and video.name != args.video:
+            continue
+        video_overlaps, video_failures, video_sizes = vot_run(tracker, video)
+        overlaps += video_overlaps
+        failures += video_failures
+        used.update(video_sizes)
+    return np.mean(overlaps), failures, used
+
+
+if __name__ == '__main__':
+    cfg.merge_from_file(args.cfg)
+    if args.device:
+        cfg.DEVICE = args.device
+    elif cfg.DEVICE.startswith('cuda') and not torch.cuda.is_available():
+        cfg.DEVICE = 'cpu'
+    model = get_model(cfg.MODEL_ARC)
+    if args.snapshot:
+        model = load_pretrain(model, args.snapshot)
+    model = prepare_model(model)
+    sizes = sorted(set(args.sizes + [cfg.TRACK.INSTANCE_SIZE]))
+    flops = backbone_flops(model, sizes)
+    full = flops[cfg.TRACK.INSTANCE_SIZE]
+    for size in sizes:
+        print('search {}: backbone {:8.1f} MFLOPs ({:5.1f}% of {})'.format(
+            size, flops[size] / 1e6, flops[size] / full * 100, cfg.TRACK.INSTANCE_SIZE))
+    data_dir = os.path.join(cfg.TRACK.DATA_DIR, args.dataset)
+    if not args.snapshot or not os.path.isdir(data_dir):
+        print('no --snapshot or no {}, only the FLOPs'.format(data_dir))
+    else:
+        dataset = get_dataset(args.dataset, data_dir)
+        accuracy, failures, _ = evaluate(model, dataset, [])
+        print('fixed {}: accuracy {:.4f} failures {}'.format(cfg.TRACK.INSTANCE_SIZE, accuracy, failures))
+        accuracy, failures, used = evaluate(model, dataset, args.sizes)
+        frames = sum(used.values())
+        average = sum(flops[size] * n for size, n in used.items()) / frames
+        print('adaptive {}: accuracy {:.4f} failures {} | sizes {} | backbone {:.1f} MFLOPs per frame, '
+              '{:.1f}% saved'.format(args.sizes, accuracy, failures,
+                                     ', '.join('{}: {:.1%}'.format(size, used[size] / frames) for size in sorted(used)),
+                                     average / 1e6, (1 - average / full) * 100))
@@ -0,0 +1,87 @@
+import time
+import argparse
+
+import numpy as np
+import torch
+
+from configs.config import cfg
+from utils.anchor import AnchorTarget, DeviceAnchorTarget
+from utils.device import get_device
+
+parser = argparse.ArgumentParser(description='anchor targets, per sample __call__ vs AnchorTarget.batch '
+                                             'vs DeviceAnchorTarget')
+parser.add_argument('--batch_sizes', nargs='+', default=[1, 8, 32, 128], type=int, help='batch sizes to benchmark')
+parser.add_argument('--neg', default=0.2, type=float, help='ratio of negative pairs')
+parser.add_argument('--iters', default=50, type=int, help='number of measured calls')
+parser.add_argument('--device', default='cpu', type=str, help='device of DeviceAnchorTarget')
+args = parser.parse_args()
+
+
+def random_boxes(batch):
+    """ corner boxes around the center of the search image, like the search augmentation gives """
+    c = cfg.TRAIN.SEARCH_SIZE / 2 + np.random.uniform(-64, 64, (batch, 2))
+    wh = np.random.uniform(16, 160, (batch, 2))
+    return np.concatenate([c - wh / 2, c + wh / 2], 1)
+
+
+def timeit(fn):
+    fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    tic = time.perf_counter()
+    for _ in range(args.iters):
+        fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - tic) / args.iters * 1e3
+
+
+def check(anchor_target, boxes, neg):
+    """ batch gives the deltas and weights of __call__ and the same number of labels from the same candidates """
+    gt_cls, gt_delta, delta_weight = anchor_target.batch(boxes, neg)
+    for i, (box, n) in enumerate(zip(boxes.tolist(), neg.tolist())):
+        cls, delta, weight = anchor_target(box, n)
+        assert np.array_equal(gt_delta[i], delta)
+        assert np.array_equal(np.sort(gt_cls[i].reshape(-1)), np.sort(cls.reshape(-1)))
+        assert np.array_equal(np.sort(delta_weight[i].reshape(-1)), np.sort(weight.reshape(-1)))
+
+
+def check_device(anchor_target, device_anchor_target, boxes, neg):
+    """ the device targets have the deltas of batch and the labels from the same candidates """
+    gt_cls, gt_delta, delta_weight = anchor_target.batch(boxes, neg)
+    cls, delta, weight = [x.cpu().numpy() for x in
+                          device_anchor_target(torch.from_numpy(boxes), torch.from_numpy(neg))]
+    diff = np.abs(gt_delta - delta).max()
+    assert diff < 1e-5
+    assert np.array_equal(np.sort(gt_cls.reshape(len(boxes), -1)), np.sort(cls.reshape(len(boxes), -1)))
+    assert np.array_equal(np.sort(delta_weight.reshape(len(boxes), -1)), np.sort(weight.reshape(len(boxes), -1)))
+    return diff
+
+
+def benchmark(anchor_target, device_anchor_target, batch):
+    boxes = random_boxes(batch)
+    neg = np.random.rand(batch) < args.neg
+    check(anchor_target, boxes, neg)
+    diff = check_device(anchor_target, device_anchor_target, boxes, neg)
+    t_loop = timeit(lambda: [anchor_target(box, n) for box, n in zip(boxes.tolist(), neg.tolist())])
+    t_batch = timeit(lambda: anchor_target.batch(boxes, neg))
+    boxes, neg = torch.from_numpy(boxes), torch.from_numpy(neg)
+    t_device = timeit(lambda: device_anchor_target(boxes, neg))
+    print('batch {:4d} | per sample: {:8.2f}ms | batched: {:8.2f}ms | {}: {:8.2f}ms | '
+          'speedup: {:5.1f}x / {:5.1f}x | max delta diff: {:.1e}'.format(
+              batch, t_loop, t_batch, device.type, t_device, t_loop / t_batch, t_loop / t_device, diff))
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    cfg.DEVICE = args.device
+    device = get_device()
+    anchor_target = AnchorTarget(cfg.ANCHOR.SCALES, cfg.ANCHOR.RATIOS, cfg.ANCHOR.STRIDE,
+                                 cfg.TRAIN.SEARCH_SIZE // 2, cfg.TRAIN.OUTPUT_SIZE)
+    device_anchor_target = DeviceAnchorTarget(cfg.ANCHOR.SCALES, cfg.ANCHOR.RATIOS, cfg.ANCHOR.STRIDE,
+                                              cfg.TRAIN.SEARCH_SIZE // 2, cfg.TRAIN.OUTPUT_SIZE, device)
+    # what the dataloader ships per sample, the three target maps vs the bbox and the neg flag
+    maps = sum(x.nbytes for x in anchor_target([0., 0., 64., 64.]))
+    print('bytes per sample: {:d} targets vs {:d} bbox'.format(maps, 4 * 8 + 1))
+    for batch in args.batch_sizes:
+        benchmark(anchor_target, device_anchor_target, batch)
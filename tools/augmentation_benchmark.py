@@ -0,0 +1,146 @@
+import argparse
+import timeit
+
+import cv2
+import numpy as np
+import torch
+
+from dataset.augmentation import Augmentation, DeviceAugmentation
+from utils.bbox import center2corner, Center
+
+parser = argparse.ArgumentParser(description='per stage time of Augmentation, the original steps vs _fused_call')
+parser.add_argument('--image_size', default=511, type=int, help='size of the crop511 image')
+parser.add_argument('--size', default=255, type=int, help='output size, 255 for search, 127 for template')
+parser.add_argument('--blur_size', default=45, type=int, help='size of the blur kernel of the blur stage')
+parser.add_argument('--number', default=200, type=int, help='calls per timing')
+parser.add_argument('--device', default='', type=str, help='also time DeviceAugmentation on this device')
+parser.add_argument('--batch', default=128, type=int, help='batch size of DeviceAugmentation')
+parser.add_argument('--check', default=2000, type=int, help='random calls compared between the two paths')
+args = parser.parse_args()
+
+
+def timing(func):
+    func()  # warmup
+    return timeit.timeit(func, number=args.number) / args.number * 1000
+
+
+def test_image(size):
+    # smooth image with edges, closer to a photo than noise for the interpolation differences
+    image = cv2.resize(np.random.randint(0, 256, (size // 16, size // 16, 3), dtype=np.uint8),
+                       (size, size), interpolation=cv2.INTER_CUBIC)
+    cv2.rectangle(image, (size // 3, size // 3), (2 * size // 3, 2 * size // 3), (250, 20, 120), -1)
+    return image
+
+
+def stages(image, size, blur_size):
+    aug = Augmentation(shift=64, scale=0.18, blur=0, flip=0, color=1, fused=False)
+    bbox = center2corner(Center(image.shape[1] // 2, image.shape[0] // 2, size - 1, size - 1))
+    crop = aug._crop_roi(image, bbox, size)
+    color = aug._color_aug(crop)
+    kernel = np.zeros((blur_size, blur_size))
+    kernel[:, blur_size // 2] += 0.5 / blur_size
+    kernel[blur_size // 2, :] += 0.5 / blur_size
+    offset = aug._rand_color().astype(np.float32)
+    mapping = aug._crop_mapping(bbox, size)
+    flip_mapping = mapping.copy()
+    flip_mapping[0] = -flip_mapping[0]
+    flip_mapping[0, 2] += size - 1
+
+    def fused_color():
+        out = crop.astype(np.float32)
+        out -= offset
+        return out
+    color32 = fused_color()
+
+    original = [
+        ('gray', lambda: aug._gray_aug(image)),
+        ('crop', lambda: aug._crop_roi(image, bbox, size)),
+        ('color', lambda: aug._color_aug(crop)),
+        ('blur', lambda: cv2.filter2D(color, -1, kernel)),
+        ('flip', lambda: cv2.flip(color, 1)),
+    ]
+    fused = [
+        ('gray', lambda: aug._gray_aug(crop)),
+        ('crop', lambda: cv2.warpAffine(image, flip_mapping, (size, size), borderMode=cv2.BORDER_CONSTANT,
+                                        borderValue=(0, 0, 0))),
+        ('color', fused_color),
+        ('blur', lambda: aug._line_blur(color32, blur_size, 0.5)),
+        ('flip', lambda: None),
+    ]
+    return original, fused
+
+
+def full(image, size, fused):
+    aug = Augmentation(shift=64, scale=0.18, blur=0.2, flip=0.5, color=1.0, fused=fused)
+    bbox = center2corner(Center(image.shape[1] // 2, image.shape[0] // 2, 100, 80))
+    return lambda: aug(image, bbox, size)
+
+
+def check(image, size, number):
+    """ same seed, same boxes and images up to the rounding of warpAffine and float32 """
+    bbox = center2corner(Center(image.shape[1] // 2, image.shape[0] // 2, 100, 80))
+    original = Augmentation(shift=64, scale=0.18, blur=0.2, flip=0.5, color=1.0, fused=False)
+    fused = Augmentation(shift=64, scale=0.18, blur=0.2, flip=0.5, color=1.0, fused=True)
+    max_box, max_pixel, mean_pixel = 0., 0., 0.
+    for seed in range(number):
+        np.random.seed(seed)
+        a, box_a = original(image, bbox, size)
+        np.random.seed(seed)
+        b, box_b = fused(image, bbox, size)
+        diff = np.abs(a.astype(np.float64) - b.astype(np.float64))
+        max_box = max(max_box, np.abs(np.array(box_a) - np.array(box_b)).max())
+        max_pixel = max(max_pixel, diff.max())
+        mean_pixel += diff.mean() / number
+    return max_box, max_pixel, mean_pixel
+
+
+def device_batch(image, size, device, batch):
+    """ a batch through DeviceAugmentation vs the same draws through _fused_call one by one """
+    aug = Augmentation(shift=64, scale=0.18, blur=0.2, flip=0.5, color=1.0, fused=True)
+    bbox = center2corner(Center(image.shape[1] // 2, image.shape[0] // 2, 100, 80))
+    images = torch.from_numpy(np.stack([image] * batch))
+    device_aug = DeviceAugmentation(device)
+
+    def run():
+        out = device_aug(images, params, size)  # params of the closure, set below
+        if out.is_cuda:
+            torch.cuda.synchronize()
+        return out
+    np.random.seed(0)
+    reference = []
+    for i in range(batch):
+        reference.append(aug(image, bbox, size, gray=i % 4 == 0)[0].astype(np.float32))
+    np.random.seed(0)
+    params = torch.from_numpy(np.stack([aug.device_params(image.shape, bbox, size, gray=i % 4 == 0)[0]
+                                        for i in range(batch)]))
+    diff = np.abs(run().permute(0, 2, 3, 1).cpu().numpy() - np.stack(reference))
+    return timing(run), diff.max(), diff.mean()
+
+
+if __name__ == '__main__':
+    image = test_image(args.image_size)
+    original, fused = stages(image, args.size, args.blur_size)
+    print('image {0}x{0} -> {1}x{1}, blur kernel {2}'.format(args.image_size, args.size, args.blur_size))
+    print('{:6s} | {:>10s} | {:>10s} | {:>7s}'.format('stage', 'original', 'fused', 'speedup'))
+    total_original, total_fused = 0., 0.
+    for (name, func), (_, fused_func) in zip(original, fused):
+        t_original, t_fused = timing(func), timing(fused_func)
+        total_original += t_original
+        total_fused += t_fused
+        print('{:6s} | {:8.3f}ms | {:8.3f}ms | {:6.1f}x'.format(name, t_original, t_fused,
+                                                              t_original / max(t_fused, 1e-6)))
+    print('{:6s} | {:8.3f}ms | {:8.3f}ms | {:6.1f}x'.format('sum', total_original, total_fused,
+                                                          total_original / total_fused))
+    t_original = timing(full(image, args.size, False))
+    t_fused = timing(full(image, args.size, True))
+    print('random __call__ (color 1.0, blur 0.2, flip 0.5): {:.3f}ms vs {:.3f}ms, {:.1f}x'.format(
+        t_original, t_fused, t_original / t_fused))
+    max_box, max_pixel, mean_pixel = check(image, args.size, args.check)
+    print('{} seeds: max box difference {:.2e}, pixel difference max {:.2f} mean {:.4f}'.format(
+        args.check, max_box, max_pixel, mean_pixel))
+    if args.device:
+        t_device, max_pixel, mean_pixel = device_batch(image, args.size, args.device, args.batch)
+        t_fused = timing(full(image, args.size, True)) * args.batch
+        print('batch of {} on {}: {:.3f}ms vs {:.3f}ms for _fused_call, {:.1f}x, pixel difference max {:.2f} '
+              'mean {:.4f}'.format(args.batch, args.device, t_device, t_fused, t_fused / t_device,
+                                   max_pixel, mean_pixel))
@@ -0,0 +1,20 @@
+import json
+import time
+import argparse
+
+from dataset.anno_index import AnnoIndex, index_path
+
+parser = argparse.ArgumentParser(description='compile the json annotations of the training sets into AnnoIndex directories of .npy files')
+parser.add_argument('anno_files', nargs='+', type=str, help='json annotation files, the index is written next to them')
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    for anno_file in args.anno_files:
+        tic = time.perf_counter()
+        with open(anno_file, 'r') as f:
+            index = AnnoIndex.from_json(json.load(f))
+        path = index_path(anno_file)
+        index.save(path)
+        print('{}: {} videos, {} tracks, {} frames -> {} ({:.1f}s)'.format(
+            anno_file, len(index), len(index.track_ids), len(index.frames), path, time.perf_counter() - tic))
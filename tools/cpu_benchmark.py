@@ -0,0 +1,68 @@
+import os
+import time
+import argparse
+
+import numpy as np
+
+from configs.config import cfg
+from models import get_model
+from trackers import get_tracker
+from utils.model_load import load_pretrain
+from utils.device import prepare_model
+
+parser = argparse.ArgumentParser(description='per frame latency of SiamRPN on cpu')
+parser.add_argument('--cfgs', nargs='+',
+                    default=['configs/alexnet_config.yaml',
+                             'configs/mobilenetv2_config.yaml',
+                             'configs/resnet_config.yaml'],
+                    help='backbone configs to benchmark')
+parser.add_argument('--snapshot', default='', type=str, help='weights to load, random weights if empty')
+parser.add_argument('--threads', default=1, type=int, help='torch threads, same as cfg.CPU.NUM_THREADS')
+parser.add_argument('--frames', default=100, type=int, help='number of measured frames')
+parser.add_argument('--warmup', default=10, type=int, help='number of frames before measuring')
+parser.add_argument('--no_channels_last', action='store_true', help='keep the default memory format')
+args = parser.parse_args()
+
+
+def benchmark(cfg_file):
+    cfg.merge_from_file(cfg_file)
+    cfg.DEVICE = 'cpu'
+    cfg.CPU.NUM_THREADS = args.threads
+    cfg.CPU.CHANNELS_LAST = not args.no_channels_last
+    model = get_model(cfg.MODEL_ARC)
+    if args.snapshot:
+        model = load_pretrain(model, args.snapshot)
+    model = prepare_model(model)
+    tracker = get_tracker('SiamRPN', model)
+
+    np.random.seed(0)
+    img = np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8)
+    tracker.init(img, [320, 240, 80, 60])
+    times = []
+    for i in range(args.warmup + args.frames):
+        frame = np.roll(img, i, axis=1)  # move the content a little every frame
+        tic = time.perf_counter()
+        tracker.track(frame)
+        if i >= args.warmup:
+            times.append(time.perf_counter() - tic)
+        # random weights make the box drift, keep the search region fixed
+        tracker.bbox_pos, tracker.bbox_size = [320, 240], [80, 60]
+    times = np.array(times) * 1000
+    return times
+
+
+if __name__ == '__main__':
+    base_cfg = cfg.clone()
+    print('threads: {}, channels last: {}'.format(args.threads, not args.no_channels_last))
+    for cfg_file in args.cfgs:
+        # start every config from the defaults
+        cfg.clear()
+        cfg.update(base_cfg.clone())
+        try:
+            times = benchmark(cfg_file)
+        except Exception as e:
+            print('{:40s} failed: {}'.format(os.path.basename(cfg_file), e))
+            continue
+        print('{:40s} mean: {:7.2f}ms | median: {:7.2f}ms | p90: {:7.2f}ms | {:5.1f}fps'.format(
+            os.path.basename(cfg_file), times.mean(), np.median(times), np.percentile(times, 90),
+            1000 / times.mean()))
@@ -0,0 +1,77 @@
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from trackers.base_tracker import BaseTracker
+
+parser = argparse.ArgumentParser(description='BaseTracker.get_subwindow vs the old pad and resize crop')
+parser.add_argument('--ori_sizes', nargs='+', default=[32, 100, 300, 800, 2000, 4000], type=int,
+                    help='crop sizes in the frame')
+parser.add_argument('--dst_sizes', nargs='+', default=[127, 287], type=int, help='output sizes')
+parser.add_argument('--iters', default=50, type=int, help='number of measured calls')
+args = parser.parse_args()
+
+
+def pad_resize_subwindow(img, pos, dst_size, ori_size, padding):
+    """ the crop BaseTracker used before the warpAffine one, kept as the reference """
+    ori_size = int(ori_size)
+    img_h, img_w, img_c = img.shape
+    x1, y1 = np.floor(pos[0] - (ori_size + 1) / 2 + 0.5), np.floor(
+        pos[1] - (ori_size + 1) / 2 + 0.5)
+    x2, y2 = x1 + ori_size - 1, y1 + ori_size - 1
+    cx1, cy1, cx2, cy2 = int(max(x1, 0)), int(max(y1, 0)), int(min(x2, img_w)), int(min(y2, img_h))
+    left_pad, top_pad, right_pad, bottom_pad = map(lambda x: int(max(x, 0)),
+                                                   [-x1, -y1, x2 - img_w + 1, y2 - img_h + 1])
+    if any([left_pad, top_pad, right_pad, bottom_pad]):
+        patch = np.zeros((ori_size, ori_size, img_c), dtype=np.uint8)
+        patch[top_pad:ori_size - bottom_pad, left_pad:ori_size - right_pad, :] = img[cy1:cy2 + 1, cx1:cx2 + 1, :]
+        if left_pad:
+            patch[:, 0:left_pad, :] = padding
+        if top_pad:
+            patch[0:top_pad, :, :] = padding
+        if right_pad:
+            patch[:, ori_size - right_pad:ori_size, :] = padding
+        if bottom_pad:
+            patch[ori_size - bottom_pad:ori_size, :, :] = padding
+    else:
+        patch = img[cy1:cy2 + 1, cx1:cx2 + 1, :]
+    patch = cv2.resize(patch, (dst_size, dst_size))
+    return patch
+
+
+def timeit(fn):
+    fn()
+    tic = time.perf_counter()
+    for _ in range(args.iters):
+        fn()
+    return (time.perf_counter() - tic) / args.iters * 1000
+
+
+if __name__ == '__main__':
+    np.random.seed(0)
+    img_h, img_w = 720, 1280
+    # smooth content, like a real frame, so the rounding differences stay small
+    img = cv2.resize(np.random.randint(0, 256, (img_h // 8, img_w // 8, 3), dtype=np.uint8), (img_w, img_h))
+    padding = img.mean((0, 1))
+    tracker = BaseTracker()
+    cases = {
+        'center': lambda size: [img_w / 2, img_h / 2],
+        'left': lambda size: [size / 4, img_h / 2],
+        'bottom right': lambda size: [img_w - size / 4, img_h - size / 4],
+        'top left out': lambda size: [-size / 4, -size / 4],
+    }
+    print('{:>6s} {:>5s} {:>14s} | {:>9s} | {:>9s} | {:>7s} | {:>8s} | {:>7s}'.format(
+        'ori', 'dst', 'case', 'old', 'warp', 'speedup', 'max diff', 'diff px'))
+    for ori_size in args.ori_sizes:
+        for dst_size in args.dst_sizes:
+            for name, case in cases.items():
+                pos = case(ori_size)
+                old = pad_resize_subwindow(img, pos, dst_size, ori_size, padding)
+                new = tracker.get_subwindow(img, pos, dst_size, ori_size, padding)
+                diff = np.abs(old.astype(np.int32) - new.astype(np.int32))
+                t_old = timeit(lambda: pad_resize_subwindow(img, pos, dst_size, ori_size, padding))
+                t_new = timeit(lambda: tracker.get_subwindow(img, pos, dst_size, ori_size, padding))
+                print('{:6d} {:5d} {:>14s} | {:7.3f}ms | {:7.3f}ms | {:6.2f}x | {:8d} | {:6.2f}%'.format(
+                    ori_size, dst_size, name, t_old, t_new, t_old / t_new, diff.max(), (diff > 0).mean() * 100))
@@ -0,0 +1,87 @@
+import os
+import glob
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+from configs.config import cfg
+from dataset.augmentation import Augmentation
+from dataset.storage import FileStorage
+from utils.bbox import center2corner, Center
+
+parser = argparse.ArgumentParser(description='exemplar decode and crop throughput, full vs reduced resolution decode')
+parser.add_argument('--cfg', default='configs/alexnet_config.yaml', type=str, help='config of the exemplar augmentation')
+parser.add_argument('--data_dir', default='', type=str,
+                    help='crop511 directory of VID, *.x.jpg are read recursively, synthetic crops when empty')
+parser.add_argument('--images', default=500, type=int, help='number of images')
+parser.add_argument('--reduce', nargs='+', default=[1, 2, 4], type=int, help='decode reductions')
+args = parser.parse_args()
+
+
+def synthetic_crops(num):
+    """ crop511 like jpegs: smooth content with edges, a target at the center """
+    out_dir = os.path.join(tempfile.gettempdir(), 'decode_benchmark')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    paths = []
+    for i in range(num):
+        path = os.path.join(out_dir, '{:06d}.00.x.jpg'.format(i))
+        if not os.path.isfile(path):
+            image = cv2.resize(np.random.randint(0, 256, (40, 40, 3), dtype=np.uint8), (511, 511),
+                               interpolation=cv2.INTER_CUBIC)
+            cv2.ellipse(image, (255, 255), (40, 60), 0, 0, 360, (30, 200, 90), -1)
+            cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def examplar(storage, aug, path, reduce):
+    """ decode and crop the exemplar as TrainDataset does, with a fixed target of 100x80 at the center """
+    if reduce > 1:
+        image, shape = storage.imread_reduced(path, reduce)
+    else:
+        image = storage.imread(path)
+        shape = image.shape
+    bbox = center2corner(Center(shape[1] // 2, shape[0] // 2, 100, 80))
+    return aug(image, bbox, cfg.TRAIN.EXAMPLER_SIZE, shape=shape)
+
+
+def run(storage, aug, paths, reduce):
+    np.random.seed(0)
+    outputs = []
+    begin = time.perf_counter()
+    for path in paths:
+        outputs.append(examplar(storage, aug, path, reduce))
+    return len(paths) / (time.perf_counter() - begin), outputs
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255. ** 2 / mse)
+
+
+if __name__ == '__main__':
+    if args.cfg:
+        cfg.merge_from_file(args.cfg)
+    if args.data_dir:
+        paths = sorted(glob.glob(os.path.join(args.data_dir, '**', '*.x.jpg'), recursive=True))[:args.images]
+    else:
+        paths = synthetic_crops(args.images)
+    storage = FileStorage(args.data_dir)
+    aug = Augmentation(cfg.DATASET.EXAMPLAR.SHIFT, cfg.DATASET.EXAMPLAR.SCALE, cfg.DATASET.EXAMPLAR.BLUR,
+                       cfg.DATASET.EXAMPLAR.FLIP, 0)  # no color, it would hide the resolution loss
+    run(storage, aug, paths[:20], 1)  # warm the page cache
+    print('{} images, exemplar {}'.format(len(paths), cfg.TRAIN.EXAMPLER_SIZE))
+    speed, reference = run(storage, aug, paths, 1)
+    print('reduce 1: {:8.1f} samples/s'.format(speed))
+    for reduce in args.reduce:
+        if reduce == 1:
+            continue
+        reduced_speed, outputs = run(storage, aug, paths, reduce)
+        box_diff = max(np.abs(np.array(a[1]) - np.array(b[1])).max() for a, b in zip(reference, outputs))
+        quality = np.mean([psnr(a[0], b[0]) for a, b in zip(reference, outputs)])
+        print('reduce {}: {:8.1f} samples/s, {:.2f}x, exemplar psnr {:.1f}dB, max box difference {:.1e}'.format(
+            reduce, reduced_speed, reduced_speed / speed, quality, box_diff))
@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+from torch.utils.data import DataLoader
+
+from configs.config import cfg
+from dataset.dataset import TrainDataset
+
+parser = argparse.ArgumentParser(description='TrainDataset with and without the shared image cache')
+parser.add_argument('--cfg', default='configs/alexnet_config.yaml', type=str, help='config of the augmentation')
+parser.add_argument('--videos', default=300, type=int, help='videos of every synthetic set')
+parser.add_argument('--cache_mb', nargs='+', default=[0, 64, 256], type=int, help='cache sizes, 0 without cache')
+parser.add_argument('--workers', default=4, type=int, help='DataLoader workers')
+parser.add_argument('--samples', default=2048, type=int, help='samples drawn per run')
+args = parser.parse_args()
+
+
+def synthetic_set(name, num_videos, num_frames):
+    """ crop511 jpegs and json annotations of a set with num_frames frames per video """
+    data_dir = os.path.join(tempfile.gettempdir(), 'image_cache_benchmark', name)
+    anno_file = data_dir + '.json'
+    if not os.path.isfile(anno_file):
+        annos = {}
+        for v in range(num_videos):
+            video = 'video{:05d}'.format(v)
+            os.makedirs(os.path.join(data_dir, video), exist_ok=True)
+            annos[video] = {'00': {}}
+            for f in range(num_frames):
+                image = cv2.resize(np.random.randint(0, 256, (32, 32, 3), dtype=np.uint8), (511, 511))
+                cv2.imwrite(os.path.join(data_dir, video, '{:06d}.00.x.jpg'.format(f)), image)
+                annos[video]['00']['{:06d}'.format(f)] = [205.5, 215.5, 305.5, 295.5]
+        json.dump(annos, open(anno_file, 'w'))
+    return data_dir, anno_file
+
+
+def run(cache_mb):
+    cfg.DATASET.IMAGE_CACHE.SIZE_MB = cache_mb
+    dataset = TrainDataset()
+    dataset.shuffle()
+    loader = DataLoader(dataset, batch_size=32, num_workers=args.workers)
+    begin = time.perf_counter()
+    num = 0
+    for batch in loader:
+        num += len(batch['bbox'])
+    speed = num / (time.perf_counter() - begin)
+    return speed, dataset.image_cache
+
+
+if __name__ == '__main__':
+    cfg.merge_from_file(args.cfg)
+    # COCO: one frame per track, YOUTUBEBB: a few frames, FRAME_RANGE of the config
+    cfg.DATASET.NAMES = ['COCO', 'YOUTUBEBB']
+    for name, num_frames in [('COCO', 1), ('YOUTUBEBB', 4)]:
+        sub_cfg = getattr(cfg.DATASET, name)
+        sub_cfg.DATA_DIR, sub_cfg.ANNO_FILE = synthetic_set(name, args.videos, num_frames)
+        sub_cfg.NUM_USE = -1
+    cfg.DATASET.VIDEO_PER_EPOCH = args.samples
+    cfg.DATASET.IMAGE_CACHE.NAMES = ['COCO', 'YOUTUBEBB']
+    print('{} videos per set, {} samples, {} workers, NEG {}'.format(args.videos, args.samples, args.workers,
+                                                                      cfg.DATASET.NEG))
+    for cache_mb in args.cache_mb:
+        speed, cache = run(cache_mb)
+        print('cache {:5d}M: {:7.1f} samples/s {}'.format(cache_mb, speed, '' if cache is None else cache))
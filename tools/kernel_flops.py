@@ -0,0 +1,66 @@
+import os
+import argparse
+
+import torch
+import torch.nn as nn
+
+from configs.config import cfg
+from models import get_model
+
+parser = argparse.ArgumentParser(description='per frame FLOPs saved by preparing the rpn kernels once per examplar')
+parser.add_argument('--cfgs', nargs='+',
+                    default=['configs/alexnet_config.yaml',
+                             'configs/mobilenetv2_config.yaml',
+                             'configs/resnet_config.yaml'],
+                    help='backbone configs to count')
+args = parser.parse_args()
+
+
+def count_flops(fn, model):
+    """ multiply-adds of the conv and bn layers run by fn, counted with forward hooks, x2 for FLOPs """
+    flops = [0]
+
+    def conv_hook(m, inputs, output):
+        flops[0] += 2 * output.numel() * m.in_channels // m.groups * m.kernel_size[0] * m.kernel_size[1]
+
+    def bn_hook(m, inputs, output):
+        flops[0] += 2 * output.numel()
+
+    handles = []
+    for m in model.modules():
+        if isinstance(m, nn.Conv2d):
+            handles.append(m.register_forward_hook(conv_hook))
+        elif isinstance(m, nn.BatchNorm2d):
+            handles.append(m.register_forward_hook(bn_hook))
+    with torch.no_grad():
+        fn()
+    for handle in handles:
+        handle.remove()
+    return flops[0]
+
+
+def count(cfg_file):
+    cfg.merge_from_file(cfg_file)
+    model = get_model(cfg.MODEL_ARC).eval()
+    examplar = torch.zeros(1, 3, cfg.TRACK.EXAMPLAR_SIZE, cfg.TRACK.EXAMPLAR_SIZE)
+    search = torch.zeros(1, 3, cfg.TRACK.INSTANCE_SIZE, cfg.TRACK.INSTANCE_SIZE)
+    model.set_examplar(examplar)
+    # the examplar branch of the head, what every frame used to run again
+    saved = count_flops(lambda: model.get_kernels(model.examplar), model)
+    track = count_flops(lambda: model.track(search), model)
+    return saved, track
+
+
+if __name__ == '__main__':
+    base_cfg = cfg.clone()
+    for cfg_file in args.cfgs:
+        # start every config from the defaults
+        cfg.clear()
+        cfg.update(base_cfg.clone())
+        try:
+            saved, track = count(cfg_file)
+        except Exception as e:
+            print('{:40s} failed: {}'.format(os.path.basename(cfg_file), e))
+            continue
+        print('{:40s} track: {:8.1f} MFLOPs | saved per frame: {:7.1f} MFLOPs ({:4.1f}%)'.format(
+            os.path.basename(cfg_file), track / 1e6, saved / 1e6, saved / (saved + track) * 100))
@@ -0,0 +1,60 @@
+import os
+import argparse
+
+import numpy as np
+from tqdm import tqdm
+
+from dataset.storage import ShardStorage
+
+parser = argparse.ArgumentParser(description='pack a crop511 directory into the shard files of ShardStorage')
+parser.add_argument('--data_dir', required=True, type=str, help='crop511 directory of one dataset')
+parser.add_argument('--out_dir', required=True, type=str, help='packed directory, use it as DATA_DIR')
+parser.add_argument('--shard_size', default=1024, type=int, help='max size of a shard in MB')
+parser.add_argument('--ext', default='.jpg', type=str, help='extension of the images to pack')
+args = parser.parse_args()
+
+
+def list_images(data_dir, ext):
+    """ paths relative to data_dir with / separators, sorted so that the frames of a video stay together """
+    keys = []
+    for root, dirs, files in os.walk(data_dir):
+        dirs.sort()
+        rel = os.path.relpath(root, data_dir)
+        for name in sorted(files):
+            if name.endswith(ext):
+                keys.append(name if rel == '.' else '/'.join(rel.split(os.sep) + [name]))
+    return sorted(keys)
+
+
+def pack(data_dir, out_dir, keys, shard_size):
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    shard = np.zeros(len(keys), dtype=np.int32)
+    offset = np.zeros(len(keys), dtype=np.int64)
+    length = np.zeros(len(keys), dtype=np.int64)
+    shard_id, f = -1, None
+    for i, key in enumerate(tqdm(keys)):
+        with open(os.path.join(data_dir, key), 'rb') as img:
+            data = img.read()
+        if f is None or f.tell() + len(data) > shard_size and f.tell() > 0:
+            if f is not None:
+                f.close()
+            shard_id += 1
+            f = open(os.path.join(out_dir, ShardStorage.SHARD.format(shard_id)), 'wb')
+        shard[i], offset[i], length[i] = shard_id, f.tell(), len(data)
+        f.write(data)
+    if f is not None:
+        f.close()
+    # the index last, a directory without it is not used as a ShardStorage
+    tmp_path = os.path.join(out_dir, 'index.tmp.npz')
+    np.savez(tmp_path, keys=np.array([k.encode() for k in keys], dtype=bytes),
+             shard=shard, offset=offset, length=length)
+    os.replace(tmp_path, os.path.join(out_dir, ShardStorage.INDEX))
+    return shard_id + 1
+
+
+if __name__ == '__main__':
+    keys = list_images(args.data_dir, args.ext)
+    print('{} images in {}'.format(len(keys), args.data_dir))
+    num_shards = pack(args.data_dir, args.out_dir, keys, args.shard_size * 1024 * 1024)
+    print('packed into {} shards in {}'.format(num_shards, args.out_dir))
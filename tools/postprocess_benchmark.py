@@ -0,0 +1,87 @@
+import time
+import argparse
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from configs.config import cfg
+from utils.anchor import AnchorGenerator
+from utils.bbox import delta2bbox, corner2center
+from utils.device import get_device
+from trackers.postprocess import PostProcessor
+
+parser = argparse.ArgumentParser(description='post-processing of the rpn output, numpy path vs PostProcessor')
+parser.add_argument('--score_sizes', nargs='+', default=[17, 25], type=int, help='score map sizes to benchmark')
+parser.add_argument('--device', default='cpu', type=str, help='device of the rpn output')
+parser.add_argument('--iters', default=1000, type=int, help='number of measured calls')
+parser.add_argument('--warmup', default=50, type=int, help='number of calls before measuring')
+args = parser.parse_args()
+
+
+def numpy_postprocess(cls, loc, all_anchor, window, anchor_num, bbox_size, scale_z):
+    """ the post-processing the trackers did before PostProcessor, kept as the reference """
+    cls = cls.reshape(2, -1).permute(1, 0)
+    score = F.softmax(cls, dim=1).data[:, 1].cpu().numpy()
+    loc = loc.reshape(4, anchor_num, loc.size()[2], loc.size()[3])
+    pred_bbox = delta2bbox(all_anchor, loc)
+    pred_bbox = pred_bbox.transpose((1, 2, 3, 0)).reshape((-1, 4))  # x1,y1,x2,y2
+    pred_bbox = corner2center(pred_bbox)  # cx,cy,w,h
+
+    def change(r):
+        return np.maximum(r, 1 / r)
+
+    def s_z(w, h):
+        w_z = w + 0.5 * (w + h)
+        h_z = h + 0.5 * (w + h)
+        size_z = np.sqrt(w_z * h_z)
+        return size_z
+
+    rc = change((bbox_size[0] / bbox_size[1]) / (pred_bbox[:, 2] / pred_bbox[:, 3]))
+    sc = change(s_z(bbox_size[0] * scale_z, bbox_size[1] * scale_z) / s_z(pred_bbox[:, 2], pred_bbox[:, 3]))
+    penalty = np.exp(-(rc * sc - 1) * cfg.TRACK.PENALTY_K)
+    pscore = penalty * score
+    pscore = pscore * (1 - cfg.TRACK.WINDOW_INFLUENCE) + window * cfg.TRACK.WINDOW_INFLUENCE
+    best_idx = np.argmax(pscore)
+    return pred_bbox[best_idx, :], score[best_idx], penalty[best_idx], pscore[best_idx]
+
+
+def timeit(fn):
+    for _ in range(args.warmup):
+        fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    tic = time.perf_counter()
+    for _ in range(args.iters):
+        fn()
+    return (time.perf_counter() - tic) / args.iters * 1e6
+
+
+def benchmark(score_size):
+    anchor_generator = AnchorGenerator(cfg.ANCHOR.SCALES, cfg.ANCHOR.RATIOS, cfg.ANCHOR.STRIDE)
+    anchor_num = anchor_generator.anchor_num
+    hanning = np.hanning(score_size)
+    window = np.tile(np.outer(hanning, hanning).flatten(), anchor_num)
+    all_anchor = anchor_generator.generate_all_anchors(cfg.TRACK.INSTANCE_SIZE // 2, score_size)
+    postprocess = PostProcessor(all_anchor, window, device)
+
+    torch.manual_seed(0)
+    cls = torch.randn(1, 2 * anchor_num, score_size, score_size, device=device) * 3
+    loc = torch.randn(1, 4 * anchor_num, score_size, score_size, device=device) * 0.3
+    bbox_size, scale_z = [80., 60.], 1.2
+
+    ref = numpy_postprocess(cls, loc, all_anchor, window, anchor_num, bbox_size, scale_z)
+    out = [x[0] for x in postprocess(cls, loc, bbox_size, scale_z)]
+    diff = max(np.abs(np.asarray(r, dtype=np.float64) - o).max() for r, o in zip(ref, out))
+
+    t_numpy = timeit(lambda: numpy_postprocess(cls, loc, all_anchor, window, anchor_num, bbox_size, scale_z))
+    t_fused = timeit(lambda: postprocess(cls, loc, bbox_size, scale_z))
+    print('score size {:3d} | numpy: {:8.1f}us | fused: {:8.1f}us | speedup: {:5.2f}x | max diff: {:.2e}'.format(
+        score_size, t_numpy, t_fused, t_numpy / t_fused, diff))
+
+
+if __name__ == '__main__':
+    cfg.DEVICE = args.device
+    device = get_device()
+    for score_size in args.score_sizes:
+        benchmark(score_size)
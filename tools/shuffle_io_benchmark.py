@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from configs.config import cfg
+from dataset.dataset import TrainDataset
+
+parser = argparse.ArgumentParser(description='page cache behaviour of the global and the block shuffle of TrainDataset')
+parser.add_argument('--videos', default=200, type=int, help='videos of the synthetic VID like set')
+parser.add_argument('--frames', default=30, type=int, help='frames per video')
+parser.add_argument('--samples', default=4000, type=int, help='samples of the epoch')
+parser.add_argument('--blocks', nargs='+', default=[0, 8, 32], type=int, help='SHUFFLE.BLOCK values, 0 is global')
+parser.add_argument('--interleave', default=4, type=int, help='SHUFFLE.INTERLEAVE')
+parser.add_argument('--cache_mb', nargs='+', default=[16, 64], type=int, help='sizes of the simulated page cache')
+parser.add_argument('--cold', action='store_true', help='also read the files after evicting them with posix_fadvise')
+args = parser.parse_args()
+
+
+def synthetic_set(num_videos, num_frames):
+    data_dir = os.path.join(tempfile.gettempdir(), 'shuffle_io_benchmark', 'vid')
+    anno_file = data_dir + '_{}_{}.json'.format(num_videos, num_frames)
+    if not os.path.isfile(anno_file):
+        annos = {}
+        for v in range(num_videos):
+            video = 'video{:05d}'.format(v)
+            os.makedirs(os.path.join(data_dir, video), exist_ok=True)
+            annos[video] = {'00': {}}
+            for f in range(num_frames):
+                path = os.path.join(data_dir, video, '{:06d}.00.x.jpg'.format(f))
+                if not os.path.isfile(path):
+                    image = cv2.resize(np.random.randint(0, 256, (64, 64, 3), dtype=np.uint8), (511, 511))
+                    cv2.imwrite(path, image)
+                annos[video]['00']['{:06d}'.format(f)] = [205.5, 215.5, 305.5, 295.5]
+        json.dump(annos, open(anno_file, 'w'))
+    return data_dir, anno_file
+
+
+def epoch_paths(dataset):
+    """ the files read by the positive pairs of an epoch, in the order of the samples """
+    paths = []
+    for idx in dataset.pick:
+        sub_dataset, idx = dataset._find_dataset(idx)
+        examplar, search = sub_dataset.get_postive_pair(idx)
+        paths += [examplar[0], search[0]]
+    return paths
+
+
+def lru_hit_rate(paths, sizes, capacity):
+    """ hit rate of a page cache of capacity bytes that keeps whole files, least recently used out """
+    cache, used, hits = OrderedDict(), 0, 0
+    for path in paths:
+        if path in cache:
+            hits += 1
+            cache.move_to_end(path)
+            continue
+        cache[path] = True
+        used += sizes[path]
+        while used > capacity:
+            used -= sizes[cache.popitem(last=False)[0]]
+    return hits / len(paths)
+
+
+def cold_read(paths):
+    """ seconds to read the files in order after evicting them from the page cache """
+    for path in set(paths):
+        with open(path, 'rb') as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    begin = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb') as f:
+            f.read()
+    return time.perf_counter() - begin
+
+
+if __name__ == '__main__':
+    cfg.DATASET.NAMES = ['VID']
+    cfg.DATASET.VID.DATA_DIR, cfg.DATASET.VID.ANNO_FILE = synthetic_set(args.videos, args.frames)
+    cfg.DATASET.VID.NUM_USE = args.samples
+    cfg.DATASET.VIDEO_PER_EPOCH = args.samples
+    cfg.DATASET.SHUFFLE.INTERLEAVE = args.interleave
+    dataset = TrainDataset()
+    sizes = {}
+    print('{} videos x {} frames, {} samples, interleave {}'.format(args.videos, args.frames, args.samples,
+                                                                      args.interleave))
+    for block in args.blocks:
+        cfg.DATASET.SHUFFLE.BLOCK = block
+        np.random.seed(0)
+        dataset.shuffle()
+        paths = epoch_paths(dataset)
+        for path in paths:
+            if path not in sizes:
+                sizes[path] = os.path.getsize(path)
+        line = 'block {:3d}:'.format(block) if block else 'global   :'
+        for cache_mb in args.cache_mb:
+            line += ' cache {}M hit rate {:.3f}'.format(cache_mb, lru_hit_rate(paths, sizes, cache_mb * 1024 ** 2))
+        if args.cold:
+            line += ' | cold read {:.0f} files/s'.format(len(paths) / cold_read(paths))
+        print(line)
@@ -0,0 +1,72 @@
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from configs.config import cfg
+from models import get_model
+from trackers import get_tracker
+from utils.model_load import load_pretrain
+from utils.device import prepare_model
+
+parser = argparse.ArgumentParser(description='SiamRPN with and without the reuse of the rpn output of unchanged crops')
+parser.add_argument('--cfg', default='configs/alexnet_config.yaml', type=str, help='config file')
+parser.add_argument('--snapshot', default='', type=str, help='weights to load, random weights if empty')
+parser.add_argument('--device', default='cpu', type=str, help='cfg.DEVICE')
+parser.add_argument('--thresholds', nargs='+', default=[1., 2., 4.], type=float, help='cfg.TRACK.STATIC.THRESHOLD')
+parser.add_argument('--noise', default=2., type=float, help='sigma of the sensor noise, pixel levels')
+parser.add_argument('--frames', default=100, type=int, help='frames of the static and of the moving half')
+args = parser.parse_args()
+
+
+def synthetic_video(num_frames, noise):
+    """ a static scene for num_frames, then the target moves 2 pixels a frame for num_frames, sensor noise on all """
+    rng = np.random.RandomState(0)
+    background = cv2.resize(rng.randint(0, 256, (24, 32, 3)).astype(np.uint8), (640, 480),
+                            interpolation=cv2.INTER_CUBIC)
+    frames = []
+    for i in range(2 * num_frames):
+        cx = 320 + 2 * max(i - num_frames, 0)
+        frame = background.copy()
+        cv2.ellipse(frame, (cx, 240), (40, 30), 0, 0, 360, (30, 200, 90), -1)
+        frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+        frames.append((frame, [cx, 240, 80, 60]))
+    return frames
+
+
+def run(tracker, frames, threshold):
+    cfg.TRACK.STATIC.THRESHOLD = threshold
+    tracker.frames = tracker.skipped = 0
+    tracker.init(frames[0][0], frames[0][1])
+    boxes, times, skipped = [], [], []
+    for frame, gt_bbox in frames[1:]:
+        if not args.snapshot:
+            # random weights make the box drift, follow the ground truth
+            tracker.bbox_pos, tracker.bbox_size = gt_bbox[0:2], gt_bbox[2:4]
+        tic = time.perf_counter()
+        skip = tracker.skipped
+        boxes.append(tracker.track(frame)['bbox'])
+        times.append(time.perf_counter() - tic)
+        skipped.append(tracker.skipped > skip)
+    return np.array(boxes), np.array(times) * 1000, np.array(skipped)
+
+
+if __name__ == '__main__':
+    cfg.merge_from_file(args.cfg)
+    cfg.DEVICE = args.device
+    model = get_model(cfg.MODEL_ARC)
+    if args.snapshot:
+        model = load_pretrain(model, args.snapshot)
+    tracker = get_tracker('SiamRPN', prepare_model(model))
+    frames = synthetic_video(args.frames, args.noise)
+    half = args.frames  # tracked frames of the static half, the first frame is the init
+    run(tracker, frames[:10], 0)  # warm up
+    reference, times, _ = run(tracker, frames, 0)
+    print('{} static + {} moving frames, noise {}'.format(args.frames, args.frames, args.noise))
+    print('threshold 0  : {:6.2f}ms per frame'.format(times.mean()))
+    for threshold in args.thresholds:
+        boxes, times, skipped = run(tracker, frames, threshold)
+        print('threshold {:<3g}: {:6.2f}ms per frame | skipped static {:5.1%} moving {:5.1%} | '
+              'max box difference {:.2f}'.format(threshold, times.mean(), skipped[:half].mean(),
+                                                 skipped[half:].mean(), np.abs(boxes - reference).max()))
@@ -0,0 +1,91 @@
+import os
+import gc
+import json
+import argparse
+import tempfile
+
+import numpy as np
+from torch.utils.data import Dataset, DataLoader
+
+from dataset.dataset import SubDataset
+from utils.memory import process_memory
+
+parser = argparse.ArgumentParser(description='private memory of the DataLoader workers, '
+                                             'json dicts and list picks vs the numpy dataset state')
+parser.add_argument('--anno', default='', type=str, help='json annotation file, a synthetic one when empty')
+parser.add_argument('--videos', default=10000, type=int, help='videos of the synthetic annotations')
+parser.add_argument('--workers', nargs='+', default=[1, 2, 4, 8], type=int, help='numbers of workers')
+parser.add_argument('--samples', default=4096, type=int, help='samples drawn per run')
+args = parser.parse_args()
+
+
+def sample_memory(idx):
+    """ private memory of the worker, read once a batch, smaps_rollup is not free
+    the full collection stands for the ones a long epoch runs, they touch every python object
+    """
+    if idx % 64 != 0:
+        return 0.
+    gc.collect()
+    return process_memory()['private']
+
+
+class DictState(Dataset):
+    """ the dataset state before the numpy index: nested dicts and a list of ints """
+
+    def __init__(self, anno_file, num):
+        self.annos = json.load(open(anno_file))
+        for video, tracks in self.annos.items():
+            for trackid, frames in tracks.items():
+                frames['frames'] = sorted(int(x) for x in frames.keys() if x.isdigit())
+        self.videos = list(self.annos.keys())
+        self.pick = list(np.random.randint(0, len(self.videos), num).tolist())
+
+    def __getitem__(self, idx):
+        video = self.videos[self.pick[idx]]
+        trackid = np.random.choice(list(self.annos[video].keys()))
+        frames = self.annos[video][trackid]['frames']
+        self.annos[video][trackid]['{:06d}'.format(np.random.choice(frames))]
+        return sample_memory(idx)
+
+    def __len__(self):
+        return len(self.pick)
+
+
+class ArrayState(Dataset):
+    """ SubDataset with its AnnoIndex and an array of picks """
+
+    def __init__(self, anno_file, num):
+        self.sub_dataset = SubDataset('bench', '', anno_file, 100, 0, num)
+
+    def __getitem__(self, idx):
+        self.sub_dataset.get_postive_pair(self.sub_dataset.pick[idx])
+        return sample_memory(idx)
+
+    def __len__(self):
+        return len(self.sub_dataset.pick)
+
+
+def synthetic_anno(path, num_videos):
+    annos = {'video{:06d}'.format(v): {'{:02d}'.format(t): {'{:06d}'.format(f): [10.5, 20.5, 100.5, 120.5]
+                                                           for f in range(0, 100, 2)}
+                                       for t in range(2)}
+             for v in range(num_videos)}
+    json.dump(annos, open(path, 'w'))
+
+
+def max_worker_memory(dataset, num_workers):
+    loader = DataLoader(dataset, batch_size=64, num_workers=num_workers, shuffle=True)
+    return max(float(batch.max()) for batch in loader)
+
+
+if __name__ == '__main__':
+    anno_file = args.anno
+    if not anno_file:
+        anno_file = os.path.join(tempfile.gettempdir(), 'worker_memory_anno.json')
+        synthetic_anno(anno_file, args.videos)
+    for name, state in [('dicts', DictState), ('arrays', ArrayState)]:
+        dataset = state(anno_file, args.samples)
+        for num_workers in args.workers:
+            private = max_worker_memory(dataset, num_workers)
+            print('{:6s} | workers: {:2d} | private memory per worker: {:7.1f}M | total: {:7.1f}M'.format(
+                name, num_workers, private, private * num_workers))
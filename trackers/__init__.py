@@ -1,11 +1,15 @@
 from trackers.siamrpn import SiamRPN
 from trackers.meta_siamrpn import MetaSiamRPN
 from trackers.grad_siamrpn import GradSiamRPN
+from trackers.multi_siamrpn import MultiTargetSiamRPN
+from trackers.cascade_siamrpn import CascadeSiamRPN
 
 trackers={
     'SiamRPN': SiamRPN,
     'MetaSiamRPN': MetaSiamRPN,
-    'GradSiamRPN': GradSiamRPN
+    'GradSiamRPN': GradSiamRPN,
+    'MultiTargetSiamRPN': MultiTargetSiamRPN,
+    'CascadeSiamRPN': CascadeSiamRPN
 }
 def get_tracker(tracker_name,*args):
     return trackers[tracker_name](*args)
@@ -13,17 +13,27 @@ class BaseTracker(object):
     def track(self, img):
         raise NotImplementedError
 
-    def get_subwindow(self, img, pos, dst_size, ori_size, padding):
+    def get_subwindow(self, img, pos, dst_size, ori_size, padding, out=None):
+        """
+        crop the ori_size square around pos, filled with padding outside the image, resized to dst_size
+        :param out: dst_size,dst_size,c uint8 array the crop is written into, the padded patch of the
+                    upsampling case then also lives in a buffer kept on the tracker, so nothing is allocated
+        """
         ori_size = int(ori_size)
         img_h, img_w, img_c = img.shape
-        x1, y1 = np.floor(pos[0] - (ori_size + 1) / 2 + 0.5), np.floor(
-            pos[1] - (ori_size + 1) / 2 + 0.5)
+        x1, y1 = self._window_origin(pos, ori_size)
         x2, y2 = x1 + ori_size - 1, y1 + ori_size - 1
         cx1, cy1, cx2, cy2 = int(max(x1, 0)), int(max(y1, 0)), int(min(x2, img_w)), int(min(y2, img_h))
         left_pad, top_pad, right_pad, bottom_pad = map(lambda x: int(max(x, 0)),
                                                        [-x1, -y1, x2 - img_w + 1, y2 - img_h + 1])
         if any([left_pad, top_pad, right_pad, bottom_pad]):
-            patch = np.zeros((ori_size, ori_size, img_c), dtype=np.uint8)
+            if ori_size > dst_size:
+                return self._warp_subwindow(img, x1, y1, dst_size, ori_size, padding, out)
+            # upsampling, the padded patch is not larger than the output
+            if out is None:
+                patch = np.zeros((ori_size, ori_size, img_c), dtype=np.uint8)
+            else:
+                patch = self._patch_buffer(ori_size, img_c)
             patch[top_pad:ori_size - bottom_pad, left_pad:ori_size - right_pad, :] = img[cy1:cy2 + 1, cx1:cx2 + 1, :]
             if left_pad:
                 patch[:, 0:left_pad, :] = padding
@@ -35,7 +45,38 @@ class BaseTracker(object):
                 patch[ori_size - bottom_pad:ori_size, :, :] = padding
         else:
             patch = img[cy1:cy2 + 1, cx1:cx2 + 1, :]
-        patch = cv2.resize(patch, (dst_size, dst_size))
+        patch = cv2.resize(patch, (dst_size, dst_size), dst=out)
+        return patch
+
+    def _patch_buffer(self, ori_size, channels):
+        """ ori_size,ori_size,channels uint8 view of a buffer kept on the tracker, only grown for a larger patch """
+        size = ori_size * ori_size * channels
+        if getattr(self, 'patch_buffer', None) is None or self.patch_buffer.size < size:
+            self.patch_buffer = np.empty(size, dtype=np.uint8)
+        return self.patch_buffer[:size].reshape(ori_size, ori_size, channels)
+
+    def _window_origin(self, pos, ori_size):
+        """ top left corner of the ori_size square around pos cropped by get_subwindow """
+        return np.floor(pos[0] - (ori_size + 1) / 2 + 0.5), np.floor(pos[1] - (ori_size + 1) / 2 + 0.5)
+
+    def _warp_subwindow(self, img, x1, y1, dst_size, ori_size, padding, out=None):
+        """
+        downsampling crop that leaves the image, sampled straight from the frame with one warpAffine, so
+        nothing is allocated at ori_size. Same pixels as cv2.resize of the padded patch up to the fixed
+        point rounding of warpAffine (at most 1).
+        """
+        img_h, img_w, img_c = img.shape
+        cx1, cy1 = int(min(max(x1, 0), img_w - 1)), int(min(max(y1, 0), img_h - 1))
+        # the padded patch is uint8, the channel average is truncated when written into it
+        padding = tuple(np.asarray(padding).astype(np.uint8).tolist())
+        # cv2.resize samples the patch at (dst + 0.5) * scale - 0.5, which never leaves the patch
+        # when scale > 1, so a constant border is all the padding needs
+        scale = ori_size / dst_size
+        mapping = np.array([[scale, 0, x1 - cx1 + 0.5 * scale - 0.5],
+                            [0, scale, y1 - cy1 + 0.5 * scale - 0.5]])
+        patch = cv2.warpAffine(img[cy1:, cx1:, :], mapping, (dst_size, dst_size), dst=out,
+                               flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                               borderMode=cv2.BORDER_CONSTANT, borderValue=padding)
         return patch
 
     def _convert_score(self, cls):
@@ -62,13 +103,14 @@ class BaseTracker(object):
         size_z = np.sqrt(w_z * h_z)
         return size_z
 
-    def _size_x(self, bbox_size):
+    def _size_x(self, bbox_size, instance_size=None):
+        instance_size = cfg.TRACK.INSTANCE_SIZE if instance_size is None else instance_size
         context_amount = 0.5
         w_z = bbox_size[0] + context_amount * sum(bbox_size)
         h_z = bbox_size[1] + context_amount * sum(bbox_size)
         size_z = np.sqrt(w_z * h_z)
         scale_z = cfg.TRACK.EXAMPLAR_SIZE / size_z
-        d_search = (cfg.TRACK.INSTANCE_SIZE - cfg.TRACK.EXAMPLAR_SIZE) / 2
+        d_search = (instance_size - cfg.TRACK.EXAMPLAR_SIZE) / 2
         pad = d_search / scale_z
         size_x = size_z + 2 * pad
         return size_x
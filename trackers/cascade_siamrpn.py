@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from trackers.base_tracker import BaseTracker
+from trackers.siamrpn import SiamRPN
+from configs.config import cfg
+
+
+@contextmanager
+def cfg_scope(node):
+    """
+    the global cfg is node inside the block, SiamRPN and the models read it at call time. Only the top
+    level nodes are swapped, so entering the scope costs nothing next to a forward.
+    """
+    saved = dict(cfg)
+    cfg.clear()
+    cfg.update(node)
+    try:
+        yield
+    finally:
+        cfg.clear()
+        cfg.update(saved)
+
+
+class CascadeSiamRPN(BaseTracker):
+    """SiamRPN on a light model, a frame goes to a heavy model only when the light one is unsure.
+
+    Both models are initialized on every init, so escalating a frame costs one heavy forward and
+    no examplar. The heavy model tracks from the same box as the light one, and its result is
+    handed back to the light one, which continues from it on the next frame. The heavy model runs
+    with its own cfg (anchors, penalty, window, lr), the light one with the global cfg.
+    """
+
+    def __init__(self, model, heavy_model, heavy_cfg):
+        """
+        :param model: the light model, built with the global cfg
+        :param heavy_model: the heavy model, built with heavy_cfg
+        :param heavy_cfg: the full cfg of the heavy model
+        """
+        super(CascadeSiamRPN, self).__init__()
+        self.light = SiamRPN(model)
+        self.heavy_cfg = heavy_cfg
+        with cfg_scope(heavy_cfg):
+            self.heavy = SiamRPN(heavy_model)
+        self.frames = 0
+        self.escalations = 0
+
+    @property
+    def escalation_rate(self):
+        return self.escalations / max(self.frames, 1)
+
+    def init(self, img, bbox):
+        self.light.init(img, bbox)
+        with cfg_scope(self.heavy_cfg):
+            self.heavy.init(img, bbox)
+        self.bbox_pos = bbox[0:2]
+        self.bbox_size = bbox[2:4]
+
+    def _escalate(self, result):
+        return result['pscore'] < cfg.TRACK.CASCADE.MIN_PSCORE or \
+               result['penalty'] < cfg.TRACK.CASCADE.MIN_PENALTY
+
+    def track(self, img):
+        self.light.bbox_pos, self.light.bbox_size = self.bbox_pos, self.bbox_size
+        result = self.light.track(img)
+        self.frames += 1
+        escalated = self._escalate(result)
+        if escalated:
+            self.escalations += 1
+            self.heavy.bbox_pos, self.heavy.bbox_size = self.bbox_pos, self.bbox_size
+            with cfg_scope(self.heavy_cfg):
+                result = self.heavy.track(img)
+        result['escalated'] = escalated
+        self.bbox_pos = result['bbox'][0:2]
+        self.bbox_size = result['bbox'][2:4]
+        return result
@@ -0,0 +1,133 @@
+import os
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from configs.config import cfg
+
+logger = logging.getLogger('global')
+
+
+def model_hash(model):
+    """ hash of the weights of the model, computed once and kept on the model
+
+    The weights must not change after the first call, delete model.weights_hash if they do.
+    """
+    if getattr(model, 'weights_hash', None) is None:
+        sha = hashlib.sha1()
+        for name, value in model.state_dict().items():
+            sha.update(name.encode())
+            sha.update(value.detach().cpu().numpy().tobytes())
+        model.weights_hash = sha.hexdigest()
+    return model.weights_hash
+
+
+def _to(feature, device):
+    if isinstance(feature, (list, tuple)):
+        return [f.to(device) for f in feature]
+    return feature.to(device)
+
+
+class ExamplarCache(object):
+    """LRU cache of examplar features keyed by (model hash, examplar crop hash).
+
+    hp_search.py and the VOT restarts init the tracker on the same crops again and again,
+    a hit skips the backbone and neck forward of BaseSiamModel.get_examplar. The features
+    are deterministic in eval mode, so a hit gives the same tracking result as a miss.
+    With a cache dir every new feature is also written to disk, so later runs (and other
+    processes) start warm.
+    """
+
+    def __init__(self, size=None, cache_dir=None):
+        self.size = size if size is not None else cfg.TRACK.EXAMPLAR_CACHE.SIZE
+        self.cache_dir = cache_dir if cache_dir is not None else cfg.TRACK.EXAMPLAR_CACHE.DIR
+        self.features = OrderedDict()  # key -> (feature, seconds it took to compute)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.time_saved = 0.
+
+    def __len__(self):
+        return len(self.features)
+
+    def get_examplar(self, model, crop, examplar):
+        """
+        :param model: model with get_examplar
+        :param crop: h,w,c uint8 examplar crop, hashed for the key
+        :param examplar: the crop as the input tensor of the model
+        :return: examplar feature of the model
+        """
+        if self.size <= 0:
+            return model.get_examplar(examplar)
+        crop = np.ascontiguousarray(crop)
+        key = (model_hash(model), hashlib.sha1(str(crop.shape).encode() + crop.tobytes()).hexdigest())
+        if key in self.features:
+            self.features.move_to_end(key)
+            feature, cost = self.features[key]
+            self.hits += 1
+            self.time_saved += cost
+            return feature
+        feature, cost = self._load(key, examplar.device)
+        if feature is not None:
+            self.disk_hits += 1
+            self.time_saved += cost
+        else:
+            self.misses += 1
+            tic = time.perf_counter()
+            feature = model.get_examplar(examplar)
+            if examplar.device.type == 'cuda':
+                torch.cuda.synchronize(examplar.device)
+            cost = time.perf_counter() - tic
+            self._save(key, feature, cost)
+        self.features[key] = (feature, cost)
+        if len(self.features) > self.size:
+            self.features.popitem(last=False)
+        return feature
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[0], key[1] + '.pth')
+
+    def _load(self, key, device):
+        if not self.cache_dir or not os.path.isfile(self._path(key)):
+            return None, 0.
+        try:
+            data = torch.load(self._path(key), map_location=device)
+        except Exception as e:  # corrupt file, compute it again
+            logger.info('[Warning] can not load cached examplar {}: {}'.format(self._path(key), e))
+            return None, 0.
+        return data['feature'], data['cost']
+
+    def _save(self, key, feature, cost):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, a reader never sees a partial file
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        torch.save({'feature': _to(feature, 'cpu'), 'cost': cost}, tmp_path)
+        os.replace(tmp_path, path)
+
+    def hit_rate(self):
+        total = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / total if total else 0.
+
+    def summary(self):
+        return 'examplar cache: {:d} hits | {:d} disk hits | {:d} misses | hit rate: {:.1f}% | ' \
+               'init time saved: {:.1f}s'.format(self.hits, self.disk_hits, self.misses,
+                                                 self.hit_rate() * 100, self.time_saved)
+
+
+_examplar_cache = None
+
+
+def get_examplar_cache():
+    """ the cache shared by all the trackers of the process, built from cfg.TRACK.EXAMPLAR_CACHE on first use """
+    global _examplar_cache
+    if _examplar_cache is None:
+        _examplar_cache = ExamplarCache()
+    return _examplar_cache
@@ -3,9 +3,11 @@ import numpy as np
 import torch
 
 from dataset.augmentation import Augmentation
-from utils.bbox import delta2bbox, corner2center, center2corner, Corner
+from utils.bbox import center2corner, Corner
 from utils.anchor import AnchorGenerator, AnchorTarget
 from trackers.base_tracker import BaseTracker
+from trackers.postprocess import PostProcessor
+from utils.device import get_device, img2tensor
 from utils.visual import show_img
 from configs.config import cfg
 
@@ -15,6 +17,7 @@ class GradSiamRPN(BaseTracker):
         super().__init__()
         self.model = model
         self.model.eval()
+        self.device = get_device()
         self.anchor_generator = AnchorGenerator(cfg.ANCHOR.SCALES,
                                                 cfg.ANCHOR.RATIOS,
                                                 cfg.ANCHOR.STRIDE)
@@ -24,6 +27,7 @@ class GradSiamRPN(BaseTracker):
         window = np.outer(hanning, hanning)
         self.window = np.tile(window.flatten(), self.anchor_generator.anchor_num)
         self.all_anchor = self.anchor_generator.generate_all_anchors(cfg.TRACK.INSTANCE_SIZE // 2, self.score_size)
+        self.postprocess = PostProcessor(self.all_anchor, self.window, self.device)
         self.anchor_target = AnchorTarget(cfg.ANCHOR.SCALES, cfg.ANCHOR.RATIOS, cfg.ANCHOR.STRIDE,
                                           cfg.TRACK.INSTANCE_SIZE // 2, self.score_size)
         self.search_aug = Augmentation(
@@ -40,7 +44,7 @@ class GradSiamRPN(BaseTracker):
         size_z = self._size_z(bbox_size)
         self.channel_average = img.mean((0, 1))
         self.examplar = self.get_subwindow(img, bbox_pos, cfg.TRACK.EXAMPLAR_SIZE, size_z, self.channel_average)
-        examplar = torch.tensor(self.examplar[np.newaxis, :], dtype=torch.float32).permute(0, 3, 1, 2).cuda()
+        examplar = img2tensor(self.examplar, self.device)
         size_x = self._size_x(bbox_size)
         search = self.get_subwindow(img, bbox_pos, cfg.TRACK.INSTANCE_SIZE, size_x, self.channel_average)
 
@@ -65,9 +69,9 @@ class GradSiamRPN(BaseTracker):
 
         bbox = get_bbox(search, bbox)
         search, bbox= self.search_aug(search, bbox, cfg.TRACK.INSTANCE_SIZE)
-        search = torch.from_numpy(search[np.newaxis, :].astype(np.float32)).permute(0, 3, 1, 2).cuda()
+        search = img2tensor(search, self.device)
         gt_cls, gt_loc, gt_loc_weight = self.anchor_target(bbox)
-        gt_cls, gt_loc, gt_loc_weight = [torch.from_numpy(x[np.newaxis, :]).cuda() for x in
+        gt_cls, gt_loc, gt_loc_weight = [torch.from_numpy(x[np.newaxis, :]).to(self.device) for x in
                                          [gt_cls, gt_loc, gt_loc_weight]]
         self.model.set_examplar(examplar, search, gt_cls, gt_loc, gt_loc_weight)
         self.bbox_pos = bbox_pos
@@ -80,39 +84,16 @@ class GradSiamRPN(BaseTracker):
         size_x = self._size_x(bbox_size)
         search = self.get_subwindow(img, self.bbox_pos, cfg.TRACK.INSTANCE_SIZE, size_x, self.channel_average)
         # show_img(search)
-        new_search = torch.from_numpy(search[np.newaxis, :].astype(np.float32)).permute(0, 3, 1, 2).cuda()
+        new_search = img2tensor(search, self.device)
         cls, loc = self.model.track(new_search)
-        score = self._convert_score(cls)
-
-        loc = loc.reshape(4, self.anchor_generator.anchor_num, loc.size()[2], loc.size()[3])
-        pred_bbox = delta2bbox(self.all_anchor, loc)
-        pred_bbox = pred_bbox.transpose((1, 2, 3, 0)).reshape((-1, 4))  # x1,y1,x2,y2
-        pred_bbox = corner2center(pred_bbox)  # cx,cy,w,h
-
-        def change(r):
-            return np.maximum(r, 1 / r)
-
-        def s_z(w, h):
-            w_z = w + 0.5 * (w + h)
-            h_z = h + 0.5 * (w + h)
-            size_z = np.sqrt(w_z * h_z)
-            return size_z
-
-        rc = change((bbox_size[0] / bbox_size[1]) / (pred_bbox[:, 2] / pred_bbox[:, 3]))
-        sc = change(
-            s_z(self.bbox_size[0] * scale_z, self.bbox_size[1] * scale_z) / s_z(pred_bbox[:, 2], pred_bbox[:, 3]))
-        penalty = np.exp(-(rc * sc - 1) * cfg.TRACK.PENALTY_K)
-        pscore = penalty * score
-        pscore = pscore * (1 - cfg.TRACK.WINDOW_INFLUENCE) + \
-                 self.window * cfg.TRACK.WINDOW_INFLUENCE
-        best_idx = np.argmax(pscore)
-        best_bbox = pred_bbox[best_idx, :]
+        best_bbox, best_score, best_penalty, best_pscore = [x[0] for x in
+                                                            self.postprocess(cls, loc, bbox_size, scale_z)]
         best_bbox[0] -= cfg.TRACK.INSTANCE_SIZE // 2
         best_bbox[1] -= cfg.TRACK.INSTANCE_SIZE // 2
         best_bbox = best_bbox / scale_z
         cx = best_bbox[0] + self.bbox_pos[0]
         cy = best_bbox[1] + self.bbox_pos[1]
-        lr = penalty[best_idx] * score[best_idx] * cfg.TRACK.LR
+        lr = best_penalty * best_score * cfg.TRACK.LR
         w = self.bbox_size[0] * (1 - lr) + lr * best_bbox[2]
         h = self.bbox_size[1] * (1 - lr) + lr * best_bbox[3]
         pred_bbox = self._clip_bbox(cx, cy, w, h, img.shape[1], img.shape[0])
@@ -122,5 +103,5 @@ class GradSiamRPN(BaseTracker):
 
         return {
             'bbox': pred_bbox,
-            'score': score[best_idx]
+            'score': best_score
         }
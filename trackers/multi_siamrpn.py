@@ -0,0 +1,150 @@
+import numpy as np
+import torch
+from utils.anchor import AnchorGenerator
+from trackers.base_tracker import BaseTracker
+from trackers.postprocess import PostProcessor
+from trackers.examplar_cache import get_examplar_cache
+from utils.device import get_device, img2tensor, inference_mode
+from configs.config import cfg
+
+
+class MultiTargetSiamRPN(BaseTracker):
+    """SiamRPN tracker for many targets in the same frame.
+
+    The examplar kernels of all targets live in one buffer of `max_targets` slots and
+    the search crops are written into one preallocated batch, so every frame costs a
+    single backbone forward no matter how many targets are tracked. Live targets are
+    kept packed in the first slots, removing a target moves the last one into its slot.
+    """
+
+    def __init__(self, model, max_targets=None):
+        super(MultiTargetSiamRPN, self).__init__()
+        self.model = model
+        self.model.eval()
+        self.device = get_device()
+        self.max_targets = max_targets if max_targets is not None else cfg.TRACK.MAX_TARGETS
+        self.anchor_generator = AnchorGenerator(cfg.ANCHOR.SCALES,
+                                                cfg.ANCHOR.RATIOS,
+                                                cfg.ANCHOR.STRIDE)
+        self.score_size = (cfg.TRACK.INSTANCE_SIZE - cfg.TRACK.EXAMPLAR_SIZE) // \
+                          cfg.ANCHOR.STRIDE + 1 + cfg.TRACK.BASE_SIZE
+        hanning = np.hanning(self.score_size)
+        window = np.outer(hanning, hanning)
+        self.window = np.tile(window.flatten(), self.anchor_generator.anchor_num)
+        self.all_anchor = self.anchor_generator.generate_all_anchors(cfg.TRACK.INSTANCE_SIZE // 2, self.score_size)
+        self.postprocess = PostProcessor(self.all_anchor, self.window, self.device)
+        self.search_batch = torch.zeros((self.max_targets, cfg.TRACK.INSTANCE_SIZE, cfg.TRACK.INSTANCE_SIZE, 3),
+                                        dtype=torch.float32, device=self.device).permute(0, 3, 1, 2)  # channels last
+        self.kernels = None  # allocated on the first target, the shape depends on the backbone
+        self.targets = []  # state of the live targets, index is the slot in the batch
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.targets)
+
+    @property
+    def target_ids(self):
+        return [target['id'] for target in self.targets]
+
+    def init(self, img, bbox):
+        """ drop all the targets and start tracking a single one, same as SiamRPN """
+        self.targets = []
+        return self.add_target(img, bbox)
+
+    @inference_mode()
+    def add_target(self, img, bbox):
+        """
+        :param img: frame where the target is given
+        :param bbox: cx,cy,w,h
+        :return: id of the new target
+        """
+        if len(self.targets) >= self.max_targets:
+            raise Exception('too many targets, max_targets is {}'.format(self.max_targets))
+        bbox_pos = bbox[0:2]  # cx,cy
+        bbox_size = bbox[2:4]  # w,h
+        size_z = self._size_z(bbox_size)
+        channel_average = img.mean((0, 1))
+        examplar = self.get_subwindow(img, bbox_pos, cfg.TRACK.EXAMPLAR_SIZE, round(size_z), channel_average)
+        feature = get_examplar_cache().get_examplar(self.model, examplar, img2tensor(examplar, self.device))
+        kernel = self.model.get_kernels(feature)
+        if self.kernels is None:
+            self.kernels = _apply(lambda x: x.new_zeros((self.max_targets,) + x.size()[1:]), kernel)
+        slot = len(self.targets)
+        _apply2(lambda buf, x: buf[slot].copy_(x[0]), self.kernels, kernel)
+        target_id = self.next_id
+        self.next_id += 1
+        self.targets.append({
+            'id': target_id,
+            'bbox_pos': bbox_pos,
+            'bbox_size': bbox_size,
+            'channel_average': channel_average
+        })
+        return target_id
+
+    @inference_mode()
+    def remove_target(self, target_id):
+        slot = self.target_ids.index(target_id)
+        last = len(self.targets) - 1
+        if slot != last:
+            _apply(lambda buf: buf[slot].copy_(buf[last]), self.kernels)
+            self.targets[slot] = self.targets[last]
+        del self.targets[last]
+
+    @inference_mode()
+    def track(self, img):
+        """
+        :param img: frame of all the targets, or dict of target id -> frame, when the targets are in different
+                    videos (lockstep evaluation in test.py)
+        :return: dict of target id -> {'bbox': cx,cy,w,h, 'score': score}
+        """
+        num = len(self.targets)
+        if num == 0:
+            return {}
+        scale_z = np.zeros(num)
+        for i, target in enumerate(self.targets):
+            bbox_size = target['bbox_size']
+            scale_z[i] = cfg.TRACK.EXAMPLAR_SIZE / self._size_z(bbox_size)
+            size_x = self._size_x(bbox_size)
+            frame = img[target['id']] if isinstance(img, dict) else img
+            search = self.get_subwindow(frame, target['bbox_pos'], cfg.TRACK.INSTANCE_SIZE, round(size_x),
+                                        target['channel_average'])
+            self.search_batch[i].copy_(torch.from_numpy(search).permute(2, 0, 1))
+        kernels = _apply(lambda x: x[:num], self.kernels)
+        cls, loc = self.model.track(self.search_batch[:num], kernels)
+        bbox_size = [target['bbox_size'] for target in self.targets]
+        best_bbox, best_score, best_penalty, _ = self.postprocess(cls, loc, bbox_size, scale_z)
+
+        results = {}
+        for i, target in enumerate(self.targets):
+            bbox = best_bbox[i]
+            bbox[0] -= cfg.TRACK.INSTANCE_SIZE // 2
+            bbox[1] -= cfg.TRACK.INSTANCE_SIZE // 2
+            bbox = bbox / scale_z[i]
+            cx = bbox[0] + target['bbox_pos'][0]
+            cy = bbox[1] + target['bbox_pos'][1]
+            lr = best_penalty[i] * best_score[i] * cfg.TRACK.LR
+            bbox_w = target['bbox_size'][0] * (1 - lr) + lr * bbox[2]
+            bbox_h = target['bbox_size'][1] * (1 - lr) + lr * bbox[3]
+            frame = img[target['id']] if isinstance(img, dict) else img
+            pred = self._clip_bbox(cx, cy, bbox_w, bbox_h, frame.shape[1], frame.shape[0])
+            # update
+            target['bbox_pos'] = pred[0:2]
+            target['bbox_size'] = pred[2:4]
+            results[target['id']] = {
+                'bbox': pred,
+                'score': best_score[i]
+            }
+        return results
+
+
+def _apply(fn, feature):
+    """ apply fn on a feature map, or on every map of nested lists of them (the rpn kernels) """
+    if isinstance(feature, (list, tuple)):
+        return [_apply(fn, f) for f in feature]
+    return fn(feature)
+
+
+def _apply2(fn, feature1, feature2):
+    if isinstance(feature1, (list, tuple)):
+        return [_apply2(fn, f1, f2) for f1, f2 in zip(feature1, feature2)]
+    return fn(feature1, feature2)
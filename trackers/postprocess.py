@@ -0,0 +1,84 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from utils.device import inference_mode
+from configs.config import cfg
+
+
+class PostProcessor(object):
+    """Softmax, anchor decode, scale/ratio penalty, cosine window and argmax in one pass.
+
+    Everything runs on the device of the rpn output, only the winning box of every
+    target is copied back to the host. The anchors and the window are converted once,
+    the intermediate maps are written into workspaces kept per number of targets.
+    """
+
+    def __init__(self, all_anchor, window, device):
+        """
+        :param all_anchor: 4,anchor_num,score_size,score_size x1,y1,x2,y2 from AnchorGenerator
+        :param window: anchor_num*score_size*score_size cosine window
+        """
+        anchor = torch.from_numpy(np.ascontiguousarray(all_anchor)).float().reshape(4, -1)
+        wh = anchor[2:] - anchor[:2]
+        self.anchor_ctr = (anchor[:2] + wh * 0.5).to(device)
+        self.anchor_wh = wh.to(device)
+        self.device = device
+        self.window = torch.from_numpy(np.asarray(window, dtype=np.float32)).to(device)
+        self.workspaces = {}
+
+    def _workspace(self, num):
+        """ the maps of __call__ for num targets, allocated on the first call """
+        if num not in self.workspaces:
+            size = self.window.numel()
+            self.workspaces[num] = {
+                # cx,cy,w,h,score,penalty,pscore of every anchor, gathered at the best one in a single call
+                'maps': torch.empty((num, 7, size), device=self.device),
+                'change': torch.empty((num, 2, size), device=self.device),
+                'tmp': torch.empty((num, 2, size), device=self.device),
+                'window': torch.empty(size, device=self.device),
+                'best_idx': torch.empty((num, 1, 1), dtype=torch.long, device=self.device),
+                'best': torch.empty((num, 7, 1), device=self.device)
+            }
+        return self.workspaces[num]
+
+    @inference_mode()
+    def __call__(self, cls, loc, bbox_size, scale_z):
+        """
+        :param cls: n,2*anchor_num,score_size,score_size
+        :param loc: n,4*anchor_num,score_size,score_size
+        :param bbox_size: w,h of the current bbox of every target, n,2 (or 2, when n is 1)
+        :param scale_z: scale of the examplar crop of every target, n (or a number)
+        :return: best bbox cx,cy,w,h in the search crop (n,4), score, penalty and pscore (n) of the best anchor
+        """
+        num = cls.size(0)
+        # the target side of the penalty only has n values, compute it on the host
+        bbox_size = np.asarray(bbox_size, dtype=np.float32).reshape(num, 2)
+        w = bbox_size[:, 0] * np.asarray(scale_z, dtype=np.float32).reshape(num)
+        h = bbox_size[:, 1] * np.asarray(scale_z, dtype=np.float32).reshape(num)
+        pad = 0.5 * (w + h)
+        target = np.stack((bbox_size[:, 0] / bbox_size[:, 1], np.sqrt((w + pad) * (h + pad))), axis=1)
+        target = torch.from_numpy(target.reshape(num, 2, 1)).to(self.device)
+
+        ws = self._workspace(num)
+        maps, change, tmp = ws['maps'], ws['change'], ws['tmp']
+        pred_ctr, pred_wh, score, penalty, pscore = maps[:, 0:2], maps[:, 2:4], maps[:, 4:5], maps[:, 5:6], maps[:, 6:7]
+        score.copy_(F.softmax(cls.reshape(num, 2, -1), dim=1)[:, 1:])
+        delta = loc.reshape(num, 4, -1)
+        torch.addcmul(self.anchor_ctr, delta[:, :2], self.anchor_wh, out=pred_ctr)
+        torch.exp(delta[:, 2:], out=pred_wh).mul_(self.anchor_wh)
+        pred_w, pred_h = pred_wh[:, 0:1], pred_wh[:, 1:2]
+        pred_pad = torch.add(pred_w, pred_h, out=tmp[:, 0:1]).mul_(0.5)
+        # ratio and size change, max(r, 1/r)
+        torch.div(pred_w, pred_h, out=change[:, 0:1])
+        torch.add(pred_h, pred_pad, out=change[:, 1:2])
+        torch.add(pred_w, pred_pad, out=tmp[:, 1:2])
+        torch.mul(tmp[:, 1:2], change[:, 1:2], out=change[:, 1:2]).sqrt_()
+        torch.div(target, change, out=change)
+        torch.max(change, torch.reciprocal(change, out=tmp), out=change)
+        torch.mul(change[:, 0:1], change[:, 1:2], out=penalty).sub_(1).mul_(-cfg.TRACK.PENALTY_K).exp_()
+        window = torch.mul(self.window, cfg.TRACK.WINDOW_INFLUENCE, out=ws['window'])
+        torch.add(window, torch.mul(penalty, score, out=pscore), alpha=1 - cfg.TRACK.WINDOW_INFLUENCE, out=pscore)
+        best_idx = torch.argmax(pscore, dim=2, keepdim=True, out=ws['best_idx'])
+        best = torch.gather(maps, 2, best_idx.expand(num, 7, 1), out=ws['best']).reshape(num, 7)
+        best = best.cpu().numpy().astype(np.float64)
+        return best[:, 0:4], best[:, 4], best[:, 5], best[:, 6]
@@ -1,9 +1,12 @@
 import cv2
+from collections import deque
 import numpy as np
 import torch
-from utils.bbox import delta2bbox, corner2center
 from utils.anchor import AnchorGenerator
 from trackers.base_tracker import BaseTracker
+from trackers.postprocess import PostProcessor
+from trackers.examplar_cache import get_examplar_cache
+from utils.device import get_device, img2tensor, inference_mode
 from utils.visual import show_img
 from configs.config import cfg
 
@@ -13,74 +16,128 @@ class SiamRPN(BaseTracker):
         super(SiamRPN, self).__init__()
         self.model = model
         self.model.eval()
+        self.device = get_device()
         self.anchor_generator = AnchorGenerator(cfg.ANCHOR.SCALES,
                                                 cfg.ANCHOR.RATIOS,
                                                 cfg.ANCHOR.STRIDE)
-        self.score_size = (cfg.TRACK.INSTANCE_SIZE - cfg.TRACK.EXAMPLAR_SIZE) // \
-                          cfg.ANCHOR.STRIDE + 1 + cfg.TRACK.BASE_SIZE
-        hanning = np.hanning(self.score_size)
+        # score size, window, anchors and postprocessor of every search size, see _instance_size
+        self.search_regions = dict((size, self._search_region(size)) for size in
+                                   set([cfg.TRACK.INSTANCE_SIZE] + list(cfg.TRACK.ADAPTIVE.SIZES)))
+        self.score_size, self.window, self.all_anchor, self.postprocess = \
+            self.search_regions[cfg.TRACK.INSTANCE_SIZE]
+        self.search_buffers = dict((size, self._search_buffers(size)) for size in self.search_regions)
+        self.instance_size = cfg.TRACK.INSTANCE_SIZE
+        self.frames = 0
+        self.skipped = 0  # frames that reused the rpn output of an unchanged search crop
+        self.last_output = None
+
+    def _search_region(self, instance_size):
+        score_size = (instance_size - cfg.TRACK.EXAMPLAR_SIZE) // \
+                     cfg.ANCHOR.STRIDE + 1 + cfg.TRACK.BASE_SIZE
+        hanning = np.hanning(score_size)
         window = np.outer(hanning, hanning)
-        self.window = np.tile(window.flatten(), self.anchor_generator.anchor_num)
-        self.all_anchor = self.anchor_generator.generate_all_anchors(cfg.TRACK.INSTANCE_SIZE // 2, self.score_size)
+        window = np.tile(window.flatten(), self.anchor_generator.anchor_num)
+        all_anchor = self.anchor_generator.generate_all_anchors(instance_size // 2, score_size)
+        return score_size, window, all_anchor, PostProcessor(all_anchor, window, self.device)
+
+    def _search_buffers(self, instance_size):
+        """
+        the crop of a search size (pinned for cuda, with its array) and the model input it is converted into,
+        written again every frame, so a steady state track allocates no image sized memory
+        """
+        crop = torch.empty((instance_size, instance_size, 3), dtype=torch.uint8)
+        if self.device.type == 'cuda':
+            crop = crop.pin_memory()
+        # channels last, as img2tensor
+        search = torch.empty((1, instance_size, instance_size, 3), device=self.device).permute(0, 3, 1, 2)
+        return crop, crop.numpy(), search
+
+    def _instance_size(self):
+        """
+        cfg.TRACK.INSTANCE_SIZE, or the smallest of cfg.TRACK.ADAPTIVE.SIZES whose score map still reaches
+        MOTION_RATIO times the largest move of the last HISTORY frames, when all of them scored MIN_SCORE
+        """
+        adaptive = cfg.TRACK.ADAPTIVE
+        if not adaptive.SIZES or len(self.motion) < adaptive.HISTORY or min(self.scores) < adaptive.MIN_SCORE:
+            return cfg.TRACK.INSTANCE_SIZE
+        # moves are in search crop pixels, the score map reaches (size - examplar size) / 2 from the center
+        reach = max(self.motion) * adaptive.MOTION_RATIO
+        for size in sorted(adaptive.SIZES):
+            if size < cfg.TRACK.INSTANCE_SIZE and (size - cfg.TRACK.EXAMPLAR_SIZE) / 2. >= reach:
+                return size
+        return cfg.TRACK.INSTANCE_SIZE
+
+    def _rpn_output(self, buffers, window):
+        """
+        cls and loc of the search crop, the ones of the last forward when the crop window is the same and the
+        downsampled crops differ by less than cfg.TRACK.STATIC.THRESHOLD
+        :param buffers: search buffers of the instance size, with the crop written
+        :param window: x1,y1,size of the crop in the frame and the instance size
+        """
+        crop, search, search_input = buffers
+        self.frames += 1
+        threshold = cfg.TRACK.STATIC.THRESHOLD
+        if threshold > 0:
+            size = cfg.TRACK.STATIC.SIZE
+            thumb = cv2.resize(search, (size, size), interpolation=cv2.INTER_AREA).astype(np.int16)
+            # against the crop of the last forward, not of the last frame, so a slow change adds up
+            if self.last_output is not None and window == self.last_window and \
+                    np.abs(thumb - self.last_thumb).mean() < threshold:
+                self.skipped += 1
+                return self.last_output
+        search_input.copy_(crop.permute(2, 0, 1)[None], non_blocking=True)
+        output = self.model.track(search_input)
+        if threshold > 0:
+            self.last_window, self.last_thumb, self.last_output = window, thumb, output
+        return output
 
+    @inference_mode()
     def init(self, img, bbox):
         bbox_pos = bbox[0:2]  # cx,cy
         bbox_size = bbox[2:4]  # w,h
         size_z = self._size_z(bbox_size)
         self.channel_average = img.mean((0, 1))
         self.examplar = self.get_subwindow(img, bbox_pos, cfg.TRACK.EXAMPLAR_SIZE, round(size_z), self.channel_average)
-        examplar = torch.tensor(self.examplar[np.newaxis, :], dtype=torch.float32).permute(0, 3, 1, 2).cuda()
-        self.model.set_examplar(examplar)
+        examplar = img2tensor(self.examplar, self.device)
+        self.model.set_examplar_feature(get_examplar_cache().get_examplar(self.model, self.examplar, examplar))
         self.bbox_pos = bbox_pos
         self.bbox_size = bbox_size
+        self.motion = deque(maxlen=cfg.TRACK.ADAPTIVE.HISTORY)
+        self.scores = deque(maxlen=cfg.TRACK.ADAPTIVE.HISTORY)
+        self.last_output = None
 
+    @inference_mode()
     def track(self, img):
         bbox_size = self.bbox_size
         size_z = self._size_z(bbox_size)
         scale_z = cfg.TRACK.EXAMPLAR_SIZE / size_z
-        size_x = self._size_x(bbox_size)
-        search = self.get_subwindow(img, self.bbox_pos, cfg.TRACK.INSTANCE_SIZE, round(size_x), self.channel_average)
-        new_search = torch.from_numpy(search[np.newaxis, :].astype(np.float32)).permute(0, 3, 1, 2).cuda()
-        cls, loc = self.model.track(new_search)
-        score = self._convert_score(cls)
-
-        loc = loc.reshape(4, self.anchor_generator.anchor_num, loc.size()[2], loc.size()[3])
-        pred_bbox = delta2bbox(self.all_anchor, loc)
-        pred_bbox = pred_bbox.transpose((1, 2, 3, 0)).reshape((-1, 4))  # x1,y1,x2,y2
-        pred_bbox = corner2center(pred_bbox)  # cx,cy,w,h
-
-        def change(r):
-            return np.maximum(r, 1 / r)
-
-        def s_z(w, h):
-            w_z = w + 0.5 * (w + h)
-            h_z = h + 0.5 * (w + h)
-            size_z = np.sqrt(w_z * h_z)
-            return size_z
-
-        rc = change((bbox_size[0] / bbox_size[1]) / (pred_bbox[:, 2] / pred_bbox[:, 3]))
-        sc = change(
-            s_z(self.bbox_size[0] * scale_z, self.bbox_size[1] * scale_z) / s_z(pred_bbox[:, 2], pred_bbox[:, 3]))
-        penalty = np.exp(-(rc * sc - 1) * cfg.TRACK.PENALTY_K)
-        pscore = penalty * score
-        pscore = pscore * (1 - cfg.TRACK.WINDOW_INFLUENCE) + \
-                 self.window * cfg.TRACK.WINDOW_INFLUENCE
-        best_idx = np.argmax(pscore)
-        best_bbox = pred_bbox[best_idx, :]
-        best_bbox[0] -= cfg.TRACK.INSTANCE_SIZE // 2
-        best_bbox[1] -= cfg.TRACK.INSTANCE_SIZE // 2
+        self.instance_size = instance_size = self._instance_size()
+        postprocess = self.search_regions[instance_size][3]
+        size_x = int(round(self._size_x(bbox_size, instance_size)))
+        buffers = self.search_buffers[instance_size]
+        self.get_subwindow(img, self.bbox_pos, instance_size, size_x, self.channel_average, out=buffers[1])
+        window = self._window_origin(self.bbox_pos, size_x) + (size_x, instance_size)
+        cls, loc = self._rpn_output(buffers, window)
+        best_bbox, best_score, best_penalty, best_pscore = [x[0] for x in
+                                                            postprocess(cls, loc, bbox_size, scale_z)]
+        best_bbox[0] -= instance_size // 2
+        best_bbox[1] -= instance_size // 2
         best_bbox = best_bbox / scale_z
         cx = best_bbox[0] + self.bbox_pos[0]
         cy = best_bbox[1] + self.bbox_pos[1]
-        lr = penalty[best_idx] * score[best_idx] * cfg.TRACK.LR
+        lr = best_penalty * best_score * cfg.TRACK.LR
         w = self.bbox_size[0] * (1 - lr) + lr * best_bbox[2]
         h = self.bbox_size[1] * (1 - lr) + lr * best_bbox[3]
         pred_bbox = self._clip_bbox(cx, cy, w, h, img.shape[1], img.shape[0])
         # update
+        self.motion.append(max(abs(pred_bbox[0] - self.bbox_pos[0]), abs(pred_bbox[1] - self.bbox_pos[1])) * scale_z)
+        self.scores.append(best_score)
         self.bbox_pos = pred_bbox[0:2]
         self.bbox_size = pred_bbox[2:4]
 
         return {
             'bbox': pred_bbox,
-            'score': score[best_idx]
+            'score': best_score,
+            'penalty': best_penalty,
+            'pscore': best_pscore
         }
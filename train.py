@@ -22,6 +22,10 @@ from utils.distributed import get_world_size, dist_init, DistModule, get_rank, r
 from utils.misc import commit, describe
 from utils.model_load import load_pretrain, restore_from
 from utils.average_meter import AverageMeter
+from utils.memory import WorkerMemoryCollate, process_memory, memory_str
+from utils.device import get_device
+from utils.anchor import DeviceAnchorTarget
+from dataset.augmentation import DeviceAugmentation
 
 logger = logging.getLogger('global')
 
@@ -125,6 +129,7 @@ def build_data_loader():
     train_dataloader = DataLoader(train_dataset,
                                   batch_size=cfg.TRAIN.BATCH_SIZE,
                                   num_workers=cfg.TRAIN.NUM_WORKERS,
+                                  collate_fn=WorkerMemoryCollate(cfg.TRAIN.LOG_WORKER_MEMORY),
                                   pin_memory=True,
                                   sampler=train_sampler)
     return train_dataloader
@@ -139,7 +144,13 @@ def train(train_dataloader, model, optimizer, lr_scheduler):
     average_meter = AverageMeter()
     start_epoch = cfg.TRAIN.START_EPOCH
     world_size = get_world_size()
+    device = get_device()
     num_per_epoch = len(train_dataloader.dataset) // (cfg.TRAIN.BATCH_SIZE * world_size)
+    if cfg.TRAIN.DEVICE_ANCHOR_TARGET:
+        anchor_target = DeviceAnchorTarget(cfg.ANCHOR.SCALES, cfg.ANCHOR.RATIOS, cfg.ANCHOR.STRIDE,
+                                           cfg.TRAIN.SEARCH_SIZE // 2, cfg.TRAIN.OUTPUT_SIZE, device)
+    if cfg.TRAIN.DEVICE_AUG:
+        augmentation = DeviceAugmentation(device)
     iter = 0
     if not os.path.exists(cfg.TRAIN.SNAPSHOT_DIR) and get_rank() == 0:
         os.makedirs(cfg.TRAIN.SNAPSHOT_DIR)
@@ -157,11 +168,20 @@ def train(train_dataloader, model, optimizer, lr_scheduler):
         cur_lr = lr_scheduler.get_cur_lr()
         for data in train_dataloader:
             begin = time.time()
-            examplar_img = data['examplar_img'].cuda()
-            search_img = data['search_img'].cuda()
-            gt_cls = data['gt_cls'].cuda()
-            gt_delta = data['gt_delta'].cuda()
-            delta_weight = data['delta_weight'].cuda()
+            if cfg.TRAIN.DEVICE_AUG:
+                # bgr to rgb as TrainDataset does
+                examplar_img = augmentation(data['examplar_img'], data['examplar_param'],
+                                            cfg.TRAIN.EXAMPLER_SIZE).flip(1)
+                search_img = augmentation(data['search_img'], data['search_param'], cfg.TRAIN.SEARCH_SIZE).flip(1)
+            else:
+                examplar_img = data['examplar_img'].to(device)
+                search_img = data['search_img'].to(device)
+            if cfg.TRAIN.DEVICE_ANCHOR_TARGET:
+                gt_cls, gt_delta, delta_weight = anchor_target(data['bbox'], data['neg'])
+            else:
+                gt_cls = data['gt_cls'].to(device)
+                gt_delta = data['gt_delta'].to(device)
+                delta_weight = data['delta_weight'].to(device)
             data_time = time.time() - begin
             losses = model.forward(examplar_img, search_img, gt_cls, gt_delta, delta_weight)
             cls_loss = losses['cls_loss']
@@ -193,6 +213,12 @@ def train(train_dataloader, model, optimizer, lr_scheduler):
                     print_speed(iter + 1 + start_epoch * num_per_epoch,
                                 average_meter.batch_time.avg,
                                 cfg.TRAIN.EPOCHS * num_per_epoch)
+                    if cfg.TRAIN.LOG_WORKER_MEMORY:
+                        logger.info('main pid {}: {}'.format(os.getpid(), memory_str(process_memory())))
+                    image_cache = train_dataloader.dataset.image_cache
+                    if image_cache is not None:
+                        logger.info('image cache {}'.format(image_cache))
+                        tb_writer.add_scalar('image_cache/hit_rate', image_cache.stats()['hit_rate'], iter)
             iter += 1
         # save model
         if get_rank() == 0:
@@ -221,7 +247,7 @@ def main():
 
     logger.info('dist init done!')
     train_dataloader = build_data_loader()
-    model = get_model('BaseSiamModel').cuda().train()
+    model = get_model('BaseSiamModel').to(get_device()).train()
     dist_model = DistModule(model)
     optimizer, lr_scheduler = build_optimizer_lr(dist_model.module, cfg.TRAIN.START_EPOCH)
     if cfg.TRAIN.BACKBONE_PRETRAIN:
@@ -1,5 +1,6 @@
 import math
 import numpy as np
+import torch
 from utils.bbox import bbox2delta, calc_iou, corner2center
 from configs.config import cfg
 
@@ -51,6 +52,20 @@ class AnchorTarget(object):
         self.out_size = out_size
         self.anchor_generator = AnchorGenerator(scales, ratios, stride)
         self.all_anchors = self.anchor_generator.generate_all_anchors(img_c, out_size)
+        # lookup tables of the flattened anchors for batch(), same values as calc_iou and bbox2delta compute
+        x1, y1, x2, y2 = self.all_anchors.reshape(4, -1)
+        self._anchors = np.stack([x1, y1, x2, y2])
+        self._anchor_area = (x2 - x1) * (y2 - y1)
+        self._anchor_w = x2 - x1
+        self._anchor_h = y2 - y1
+        self._anchor_cx = x1 + self._anchor_w * 0.5
+        self._anchor_cy = y1 + self._anchor_h * 0.5
+        eps = np.finfo(self._anchor_h.dtype).eps
+        self._anchor_w = np.maximum(self._anchor_w, eps)
+        self._anchor_h = np.maximum(self._anchor_h, eps)
+        # anchor index -> row, col of the score map, for the negative pair windows
+        self._anchor_row, self._anchor_col = [x.reshape(-1) for x in np.indices(self.all_anchors.shape[1:])[1:]]
+        self._buffers = {}
 
     def __call__(self, gt_bbox, neg=False):  # corner x1,y1,x2,y2
         anchor_num = self.anchor_generator.anchor_num
@@ -100,3 +115,181 @@ class AnchorTarget(object):
         gt_cls[neg_idx[:, 0], neg_idx[:, 1], neg_idx[:, 2]] = 0
         gt_delta = bbox2delta(self.all_anchors, gt_bbox)
         return gt_cls, gt_delta, delta_weight
+
+    def _get_buffers(self, batch):
+        """ scratch arrays of batch(), allocated once per batch size """
+        if batch not in self._buffers:
+            num = self._anchors.shape[1]
+            self._buffers[batch] = {'iou': np.empty((batch, num), dtype=np.float32),
+                                    'tmp': np.empty((batch, num), dtype=np.float32),
+                                    'pos': np.empty((batch, num), dtype=bool),
+                                    'neg': np.empty((batch, num), dtype=bool)}
+        return self._buffers[batch]
+
+    @staticmethod
+    def _sample(candidates, keys, keep_num):
+        """ keep keep_num random candidates of every row, the ones with the smallest keys """
+        if keep_num >= candidates.shape[1]:
+            return candidates
+        masked = np.where(candidates, keys, np.inf)
+        kth = np.partition(masked, keep_num - 1, axis=1)[:, keep_num - 1:keep_num]
+        return candidates & (masked <= kth)
+
+    def batch(self, gt_bboxes, neg=False, out=None):
+        """ __call__ of a whole batch at once
+        Args:
+            gt_bboxes: B x 4 corner boxes x1,y1,x2,y2
+            neg: bool or B bools, negative pairs
+            out: optional contiguous (gt_cls, gt_delta, delta_weight) to write the targets to
+        Return:
+            gt_cls: B x A x S x S, gt_delta: B x 4 x A x S x S, delta_weight: B x A x S x S
+
+        Same targets as calling __call__ on every box, the sampling draws one random key per
+        anchor (a random permutation) instead of shuffling the positive and negative indices.
+        """
+        gt_bboxes = np.asarray(gt_bboxes, dtype=np.float64).reshape(-1, 4)
+        batch = len(gt_bboxes)
+        neg = np.broadcast_to(np.asarray(neg, dtype=bool), (batch,))
+        shape = self.all_anchors.shape[1:]
+        if out is None:
+            out = (np.empty((batch,) + shape, dtype=np.int64),
+                   np.empty((batch, 4) + shape, dtype=np.float32),
+                   np.empty((batch,) + shape, dtype=np.float32))
+        gt_cls, gt_delta, delta_weight = [x.reshape(batch, *x.shape[1:-3], -1) for x in out]
+        buf = self._get_buffers(batch)
+        iou, tmp, pos, neg_cand = buf['iou'], buf['tmp'], buf['pos'], buf['neg']
+
+        # calc_iou, the gt values go to float32 like the python floats of __call__ do
+        x1, y1, x2, y2 = self._anchors
+        tx1, ty1, tx2, ty2 = [x[:, None] for x in gt_bboxes.astype(np.float32).T]
+        target_a = ((gt_bboxes[:, 2] - gt_bboxes[:, 0]) * (gt_bboxes[:, 3] - gt_bboxes[:, 1])).astype(np.float32)
+        np.minimum(tx2, x2, out=iou)
+        iou -= np.maximum(tx1, x1, out=tmp)
+        np.maximum(iou, 0, out=iou)
+        np.minimum(ty2, y2, out=tmp)
+        tmp -= np.maximum(ty1, y1)
+        np.maximum(tmp, 0, out=tmp)
+        iou *= tmp  # intersection
+        np.add(self._anchor_area, target_a[:, None], out=tmp)
+        tmp -= iou
+        iou /= tmp
+        np.greater(iou, cfg.TRAIN.THRESH_HIGH, out=pos)
+        np.less(iou, cfg.TRAIN.THRESH_LOW, out=neg_cand)
+        pos[neg] = False
+
+        # negative pairs: every anchor in a 7x7 window around the shifted target
+        if np.any(neg):
+            gt_cx = (gt_bboxes[neg, 0] + gt_bboxes[neg, 2]) / 2
+            gt_cy = (gt_bboxes[neg, 1] + gt_bboxes[neg, 3]) / 2
+            cx = self.out_size // 2 + np.ceil((gt_cx - cfg.TRAIN.SEARCH_SIZE // 2) / cfg.ANCHOR.STRIDE + 0.5)
+            cy = self.out_size // 2 + np.ceil((gt_cy - cfg.TRAIN.SEARCH_SIZE // 2) / cfg.ANCHOR.STRIDE + 0.5)
+            col, row = self._anchor_col, self._anchor_row
+            neg_cand[neg] = (col >= cx[:, None] - 3) & (col < cx[:, None] + 4) & \
+                            (row >= cy[:, None] - 3) & (row < cy[:, None] + 4)
+
+        pos_num = pos.sum(1)
+        keys = np.random.random_sample(pos.shape)
+        pos_keep = self._sample(pos, keys, cfg.TRAIN.POS_NUM)
+        neg_keep = self._sample(neg_cand, keys, cfg.TRAIN.TOTAL_NUM - cfg.TRAIN.POS_NUM)
+        if np.any(neg):
+            neg_keep[neg] = self._sample(neg_cand[neg], keys[neg], cfg.TRAIN.NEG_NUM)
+
+        gt_cls.fill(-1)
+        gt_cls[neg_keep] = 0
+        gt_cls[pos_keep] = 1
+        delta_weight.fill(0)
+        np.copyto(delta_weight, (1 / (pos_num + 1e-6))[:, None].astype(np.float32), where=pos_keep)
+
+        # bbox2delta, zeros for the negative pairs
+        gt = gt_bboxes[:, :, None]
+        dst_w, dst_h = gt[:, 2] - gt[:, 0], gt[:, 3] - gt[:, 1]
+        dst_cx, dst_cy = gt[:, 0] + dst_w * 0.5, gt[:, 1] + dst_h * 0.5
+        dst_w, dst_h, dst_cx, dst_cy = [x.astype(np.float32) for x in [dst_w, dst_h, dst_cx, dst_cy]]
+        np.subtract(dst_cx, self._anchor_cx, out=gt_delta[:, 0])
+        gt_delta[:, 0] /= self._anchor_w
+        np.subtract(dst_cy, self._anchor_cy, out=gt_delta[:, 1])
+        gt_delta[:, 1] /= self._anchor_h
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.log(np.divide(dst_w, self._anchor_w, out=gt_delta[:, 2]), out=gt_delta[:, 2])
+            np.log(np.divide(dst_h, self._anchor_h, out=gt_delta[:, 3]), out=gt_delta[:, 3])
+        gt_delta[neg] = 0
+        return out
+
+
+class DeviceAnchorTarget(object):
+    """AnchorTarget.batch in torch, the targets of a whole batch are built on the device.
+
+    The dataset then only ships the search bbox and the negative pair flag of every sample
+    instead of the label, delta and weight maps. The anchor tables are converted once.
+    """
+
+    def __init__(self, scales, ratios, stride, img_c, out_size, device):
+        anchor_target = AnchorTarget(scales, ratios, stride, img_c, out_size)
+        self.shape = anchor_target.all_anchors.shape[1:]
+        self.out_size = out_size
+        self.device = device
+        to_device = lambda x: torch.from_numpy(np.ascontiguousarray(x)).to(device)
+        self.anchors = to_device(anchor_target._anchors)
+        self.anchor_area = to_device(anchor_target._anchor_area)
+        self.anchor_ctr = to_device(np.stack([anchor_target._anchor_cx, anchor_target._anchor_cy]))
+        self.anchor_wh = to_device(np.stack([anchor_target._anchor_w, anchor_target._anchor_h]))
+        self.anchor_row = to_device(anchor_target._anchor_row)
+        self.anchor_col = to_device(anchor_target._anchor_col)
+
+    @staticmethod
+    def _sample(candidates, keys, keep_num):
+        """ keep keep_num random candidates of every row, the ones with the smallest keys """
+        if keep_num >= candidates.size(1):
+            return candidates
+        masked = torch.where(candidates, keys, torch.full_like(keys, float('inf')))
+        kth = torch.topk(masked, keep_num, dim=1, largest=False)[0][:, -1:]
+        return candidates & (masked <= kth)
+
+    def __call__(self, gt_bboxes, neg):
+        """
+        :param gt_bboxes: B,4 corner boxes x1,y1,x2,y2
+        :param neg: B bools, negative pairs
+        :return: gt_cls B,A,S,S, gt_delta B,4,A,S,S, delta_weight B,A,S,S on the device
+        """
+        gt_bboxes = gt_bboxes.to(self.device, torch.float64).reshape(-1, 4)
+        neg = neg.to(self.device, torch.bool).reshape(-1)
+        batch = gt_bboxes.size(0)
+
+        gt = gt_bboxes.float()
+        target_a = ((gt_bboxes[:, 2] - gt_bboxes[:, 0]) * (gt_bboxes[:, 3] - gt_bboxes[:, 1])).float()
+        x1, y1, x2, y2 = self.anchors
+        ww = (torch.min(gt[:, 2:3], x2) - torch.max(gt[:, 0:1], x1)).clamp_(min=0)
+        hh = (torch.min(gt[:, 3:4], y2) - torch.max(gt[:, 1:2], y1)).clamp_(min=0)
+        inter = ww * hh
+        iou = inter / (self.anchor_area + target_a[:, None] - inter)
+        pos = (iou > cfg.TRAIN.THRESH_HIGH) & ~neg[:, None]
+        neg_cand = iou < cfg.TRAIN.THRESH_LOW
+        if neg.any():
+            # every anchor in a 7x7 window around the shifted target
+            ctr = (gt_bboxes[neg, :2] + gt_bboxes[neg, 2:]) / 2
+            ctr = self.out_size // 2 + torch.ceil((ctr - cfg.TRAIN.SEARCH_SIZE // 2) / cfg.ANCHOR.STRIDE + 0.5)
+            cx, cy = ctr[:, 0:1], ctr[:, 1:2]
+            col, row = self.anchor_col, self.anchor_row
+            neg_cand[neg] = (col >= cx - 3) & (col < cx + 4) & (row >= cy - 3) & (row < cy + 4)
+
+        pos_num = pos.sum(1, keepdim=True)
+        keys = torch.rand(pos.shape, device=self.device)
+        pos_keep = self._sample(pos, keys, cfg.TRAIN.POS_NUM)
+        neg_keep = self._sample(neg_cand, keys, cfg.TRAIN.TOTAL_NUM - cfg.TRAIN.POS_NUM)
+        if neg.any():
+            neg_keep[neg] = self._sample(neg_cand[neg], keys[neg], cfg.TRAIN.NEG_NUM)
+
+        gt_cls = torch.full(pos.shape, -1, dtype=torch.int64, device=self.device)
+        gt_cls[neg_keep] = 0
+        gt_cls[pos_keep] = 1
+        delta_weight = pos_keep.float() * (1 / (pos_num.double() + 1e-6)).float()
+
+        # bbox2delta, zeros for the negative pairs
+        dst_wh = gt_bboxes[:, 2:] - gt_bboxes[:, :2]
+        dst_ctr = (gt_bboxes[:, :2] + dst_wh * 0.5).float()[:, :, None]
+        dst_wh = dst_wh.float()[:, :, None]
+        gt_delta = torch.cat(((dst_ctr - self.anchor_ctr) / self.anchor_wh,
+                              torch.log(dst_wh / self.anchor_wh)), dim=1)
+        gt_delta[neg] = 0
+        return (gt_cls.reshape(batch, *self.shape), gt_delta.reshape(batch, 4, *self.shape),
+                delta_weight.reshape(batch, *self.shape))
@@ -0,0 +1,40 @@
+import torch
+
+from configs.config import cfg
+
+# torch.inference_mode only exists from torch 1.9, no_grad is the closest thing before it
+inference_mode = getattr(torch, 'inference_mode', torch.no_grad)
+
+
+def get_device():
+    """ the device in cfg.DEVICE, an index is filled in for cuda so every rank keeps its own gpu """
+    device = torch.device(cfg.DEVICE)
+    if device.type == 'cuda' and device.index is None:
+        device = torch.device('cuda', torch.cuda.current_device())
+    return device
+
+
+def setup_cpu():
+    if cfg.CPU.NUM_THREADS > 0:
+        torch.set_num_threads(cfg.CPU.NUM_THREADS)
+
+
+def prepare_model(model):
+    """ move the model to cfg.DEVICE for tracking, on cpu also apply the cpu settings """
+    device = get_device()
+    model = model.to(device).eval()
+    if device.type == 'cpu':
+        setup_cpu()
+        if cfg.CPU.CHANNELS_LAST:
+            model = model.to(memory_format=torch.channels_last)
+    return model
+
+
+def img2tensor(img, device):
+    """ h,w,c (or n,h,w,c) uint8 image -> n,c,h,w float32 tensor on device
+
+    The channels stay the innermost dimension, so the result is already channels last.
+    """
+    if img.ndim == 3:
+        img = img[None, ...]
+    return torch.from_numpy(img).to(device).permute(0, 3, 1, 2).float()
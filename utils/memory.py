@@ -0,0 +1,51 @@
+import os
+import logging
+
+from torch.utils.data import get_worker_info
+from torch.utils.data.dataloader import default_collate
+
+logger = logging.getLogger('global')
+
+
+def process_memory(pid='self'):
+    """ rss, pss and private (not shared with the parent) memory of a process in MB
+
+    Read from /proc/<pid>/smaps_rollup, the private memory is what the copy on write of a
+    forked DataLoader worker costs. Where it is missing only rss is known, the others are nan.
+    """
+    memory = {'rss': float('nan'), 'pss': float('nan'), 'private': float('nan')}
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+            fields = dict((line.split(':')[0], line.split()[1]) for line in f if line.split()[-1] == 'kB')
+        memory['rss'] = int(fields['Rss']) / 1024
+        memory['pss'] = int(fields['Pss']) / 1024
+        memory['private'] = (int(fields['Private_Clean']) + int(fields['Private_Dirty'])) / 1024
+    except (IOError, OSError, KeyError):
+        try:
+            with open('/proc/{}/statm'.format(pid)) as f:
+                memory['rss'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+        except (IOError, OSError, ValueError):
+            pass
+    return memory
+
+
+def memory_str(memory):
+    return 'rss: {:.0f}M pss: {:.0f}M private: {:.0f}M'.format(memory['rss'], memory['pss'], memory['private'])
+
+
+class WorkerMemoryCollate(object):
+    """ default_collate that logs the memory of its DataLoader worker every `every` batches """
+
+    def __init__(self, every):
+        self.every = every
+        self.batches = 0
+
+    def __call__(self, batch):
+        # every worker has its own copy of the counter
+        self.batches += 1
+        if self.every > 0 and self.batches % self.every == 0:
+            info = get_worker_info()
+            worker = info.id if info is not None else 'main'
+            logger.info('worker {} pid {} batch {}: {}'.format(worker, os.getpid(), self.batches,
+                                                              memory_str(process_memory())))
+        return default_collate(batch)
@@ -9,6 +9,8 @@ import logging
 
 import torch
 
+from utils.device import get_device
+
 logger = logging.getLogger('global')
 
 
@@ -47,9 +49,9 @@ def remove_prefix(state_dict, prefix):
 def meta_load(load_pretrain):
     def wrapper(model, pretrained_path):
         model = load_pretrain(model, pretrained_path)
-        device = torch.cuda.current_device()
+        device = get_device()
         pretrained_dict = torch.load(pretrained_path,
-                                     map_location=lambda storage, loc: storage.cuda(device))
+                                     map_location=device)
         model.init_weight = pretrained_dict['init_weight']
         model.alpha = pretrained_dict['alpha']
         model.bn_weight = pretrained_dict['bn_weight']
@@ -61,9 +63,9 @@ def meta_load(load_pretrain):
 # @meta_load
 def load_pretrain(model, pretrained_path):
     logger.info('load pretrained model from {}'.format(pretrained_path))
-    device = torch.cuda.current_device()
+    device = get_device()
     pretrained_dict = torch.load(pretrained_path,
-                                 map_location=lambda storage, loc: storage.cuda(device))
+                                 map_location=device)
     # for meta
     if 'init_weight' in pretrained_dict.keys() \
             and 'alpha' in pretrained_dict.keys() \
@@ -100,9 +102,9 @@ def load_pretrain(model, pretrained_path):
 
 
 def restore_from(model, optimizer, ckpt_path):
-    device = torch.cuda.current_device()
+    device = get_device()
     ckpt = torch.load(ckpt_path,
-                      map_location=lambda storage, loc: storage.cuda(device))
+                      map_location=device)
     epoch = ckpt['epoch']
     ckpt_model_dict = remove_prefix(ckpt['model'], 'module.')
     check_keys(model, ckpt_model_dict)